@@ -0,0 +1,348 @@
+import random
+import json
+import os
+
+
+# Class names copied from the markup the crawler's XPath/CSS selectors target
+CAPTION_CLASS = "xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs x126k92a"
+CAPTION_SPE_CLASS = "x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s x126k92a"
+COMMENT_CLASS = "x1n2onr6 x1ye3gou x1iorvi4 x78zum5 x1q0g3np x1a2a7pz"
+REPLY_CLASS = "x1n2onr6 xurb0ha x1iorvi4 x78zum5 x1q0g3np x1a2a7pz"
+COMMENT_TEXT_CLASS = "xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs"
+SEE_MORE_CLASS = "x11i0hfl"
+IMAGE_CLASS = "x10l6tqk x13vifvy"
+
+WORDS = ("facebook", "crawler", "benchmark", "comment", "video", "reel", "post", "page", "great", "thanks",
+         "xin", "chao", "cam", "on", "rat", "hay", "dep", "qua", "ban", "oi")
+EMOJIS = ("\U0001F600", "\U0001F602", "\U0001F44D", "❤️", "\U0001F525")
+
+# Appends comments in batches, either when the last one is scrolled into view (posts)
+# or when "View more comments" is clicked (videos/reels), after a short simulated delay.
+# Comments with replies get a "View N replies" button loading them the same way.
+_COMMENTS_JS = """
+var comments = %(comments)s, replies = %(replies)s, batch = %(batch)d, delay = %(delay)d, byScroll = %(by_scroll)s;
+var list = document.getElementById('comments'), shown = 0, loading = false;
+function render(text, long, className, thread) {
+    var outer = document.createElement('div');
+    outer.className = className;
+    var inner = document.createElement('div');
+    inner.className = '%(text_class)s';
+    var body = document.createElement('div');
+    body.setAttribute('dir', 'auto');
+    body.textContent = long ? text.slice(0, 40) : text;
+    inner.appendChild(body);
+    if (long) {
+        var more = document.createElement('div');
+        more.className = '%(see_more_class)s';
+        more.setAttribute('role', 'button');
+        more.textContent = 'See more';
+        more.onclick = function () { body.textContent = text; more.remove(); };
+        inner.appendChild(more);
+    }
+    outer.appendChild(inner);
+    if (thread) {
+        var view = document.createElement('div');
+        view.setAttribute('role', 'button');
+        view.textContent = thread.length === 1 ? 'View 1 reply' : 'View all ' + thread.length + ' replies';
+        view.onclick = function () {
+            setTimeout(function () {
+                thread.forEach(function (r) { outer.appendChild(render(r[0], r[1], '%(reply_class)s')); });
+                view.remove();
+            }, delay);
+        };
+        outer.appendChild(view);
+    }
+    return outer;
+}
+function loadMore() {
+    if (loading || shown >= comments.length) return;
+    loading = true;
+    setTimeout(function () {
+        var fragment = document.createDocumentFragment();
+        comments.slice(shown, shown + batch).forEach(function (c, i) {
+            fragment.appendChild(render(c[0], c[1], '%(comment_class)s', replies[shown + i]));
+        });
+        list.appendChild(fragment);
+        shown = Math.min(shown + batch, comments.length);
+        loading = false;
+        var button = document.getElementById('view-more');
+        if (button && shown >= comments.length) button.remove();
+    }, delay);
+}
+if (byScroll) {
+    window.addEventListener('scroll', function () {
+        var last = list.lastElementChild;
+        if (last && last.getBoundingClientRect().top < window.innerHeight * 2) loadMore();
+    });
+} else {
+    var button = document.getElementById('view-more');
+    if (button) button.onclick = loadMore;
+}
+loadMore();
+"""
+
+# Appends post links to the feed as it is scrolled, like the fanpage timeline
+_FEED_JS = """
+var posts = %(posts)s, batch = %(batch)d, delay = %(delay)d;
+var feed = document.getElementById('feed'), shown = 0, loading = false;
+function loadMore() {
+    if (loading || shown >= posts.length) return;
+    loading = true;
+    setTimeout(function () {
+        posts.slice(shown, shown + batch).forEach(function (p) {
+            var article = document.createElement('div');
+            article.setAttribute('role', 'article');
+            article.style.height = '400px';
+            var link = document.createElement('a');
+            link.href = p[0];
+            link.setAttribute('aria-label', p[1]);
+            link.textContent = p[1];
+            article.appendChild(link);
+            feed.appendChild(article);
+        });
+        shown += batch;
+        loading = false;
+    }, delay);
+}
+window.addEventListener('scroll', function () {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 800) loadMore();
+});
+loadMore();
+"""
+
+
+def random_text(rng, words=12):
+    '''Return a pseudo-random sentence of the given number of words'''
+
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def caption_html(rng, class_name, lines=3):
+    """
+    Builds a caption block: dir="auto" lines with image emojis, the way
+    Facebook renders them.
+    """
+    parts = []
+    for _ in range(lines):
+        emoji = rng.choice(EMOJIS)
+        parts.append(f'<div dir="auto">{random_text(rng, 8)} <img alt="{emoji}" src="/media/emoji.png"></div>')
+    return f'<div class="{class_name}">{"".join(parts)}</div>'
+
+
+def make_comments(rng, n_comments):
+    # Every fifth comment is long enough to be truncated behind "See more"
+    return [[random_text(rng, rng.randint(4, 30)), i % 5 == 0] for i in range(n_comments)]
+
+
+def comments_html(comments):
+    '''Static markup of fully loaded and expanded comments, as in page_source after crawling'''
+
+    return "".join(f'<div class="{COMMENT_CLASS}"><div class="{COMMENT_TEXT_CLASS}"><div dir="auto">{text}</div>'
+                   f'</div></div>' for text, _ in comments)
+
+
+def make_replies(n_comments, seed=0):
+    # Every tenth comment has a thread of one to five replies, the first of them truncated
+    rng = random.Random(seed)
+    return {i: make_comments(rng, rng.randint(1, 5)) for i in range(3, n_comments, 10)}
+
+
+def comments_section(rng, n_comments, batch, delay, by_scroll, rendered):
+    """
+    Returns the comment container and the script loading it. Rendered
+    sections hold every comment already and need no script.
+    """
+    comments = make_comments(rng, n_comments)
+    if rendered:
+        return f'<div id="comments">{comments_html(comments)}</div>', ""
+    return '<div id="comments"></div>', _COMMENTS_JS % {
+        "comments": json.dumps(comments), "replies": json.dumps(make_replies(n_comments)), "batch": batch,
+        "delay": delay, "by_scroll": json.dumps(by_scroll), "comment_class": COMMENT_CLASS,
+        "reply_class": REPLY_CLASS, "text_class": COMMENT_TEXT_CLASS, "see_more_class": SEE_MORE_CLASS,
+    }
+
+
+def page(title, body, script=""):
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title></head>"
+            f"<body>{body}<script>{script}</script></body></html>")
+
+
+def build_post_page(n_comments=1000, n_images=4, batch=50, delay=20, seed=0, rendered=False):
+    """
+    Builds a photo post: caption, images, and comments loaded by scrolling.
+
+    Args:
+        n_comments: The total number of comments.
+        n_images: The number of images in the post.
+        batch: The number of comments loaded per batch.
+        delay: The simulated loading time of a batch in milliseconds.
+        seed: The random seed, so fixtures are reproducible.
+        rendered: Return the page as it looks once every comment is loaded.
+
+    Returns:
+        The HTML of the page.
+    """
+    rng = random.Random(seed)
+    images = "".join(f'<div class="{IMAGE_CLASS}"><img src="/media/image_{i+1}.jpg"></div>' for i in range(n_images))
+    caption = caption_html(rng, CAPTION_CLASS)
+    comments, script = comments_section(rng, n_comments, batch, delay, True, rendered)
+    body = caption + images + '<div aria-label="Comment" role="button">Comment</div>' + comments
+    return page("Post", body, script)
+
+
+def build_video_page(n_comments=1000, batch=50, delay=20, seed=1, reel=False, rendered=False):
+    """
+    Builds a video (or reel) page: caption behind "See more", a video
+    element and comments loaded with "View more comments".
+
+    Args:
+        n_comments: The total number of comments.
+        batch: The number of comments loaded per click.
+        delay: The simulated loading time of a batch in milliseconds.
+        seed: The random seed, so fixtures are reproducible.
+        reel: Build the reel layout instead of the video one.
+        rendered: Return the page as it looks once every comment is loaded.
+
+    Returns:
+        The HTML of the page.
+    """
+    rng = random.Random(seed)
+    caption = caption_html(rng, CAPTION_CLASS if reel else COMMENT_TEXT_CLASS, lines=1)
+    caption += caption_html(rng, CAPTION_SPE_CLASS, lines=2)
+    comments, script = comments_section(rng, n_comments, batch, delay, False, rendered)
+    body = (caption
+            + '<div role="button" aria-label="See more">See more</div>'
+            + '<div role="button">See less</div>'
+            + '<div class="inline-video-container"><video src="/media/video_1.mp4" preload="auto"></video></div>'
+            + '<div class="inline-video-icon" role="button">Play</div>'
+            + '<div aria-label="Comment" role="button">Comment</div>'
+            + '<span>See all</span>'
+            + comments
+            + ('' if rendered else '<div role="button" id="view-more"><span>View more comments</span></div>'))
+    return page("Reel" if reel else "Video", body, script)
+
+
+def build_basic_post_pages(n_comments=1000, n_images=4, per_page=30, seed=0, query=""):
+    """
+    Builds the basic HTML view of a photo post (as served to old mobile
+    browsers, no JavaScript): caption and images on the first page, and
+    comments spread over pages linked by "View more comments".
+
+    Args:
+        n_comments: The total number of comments.
+        n_images: The number of images in the post.
+        per_page: The number of comments per page.
+        seed: The random seed, so fixtures are reproducible.
+        query: Query parameters kept in the page links, e.g. "size=large&".
+
+    Returns:
+        The HTML of every page, in order.
+    """
+    rng = random.Random(seed)
+    lines = "".join(f"<p>{random_text(rng, 8)} <img alt=\"{rng.choice(EMOJIS)}\" src=\"/media/emoji.png\"></p>"
+                    for _ in range(3))
+    caption = f'<div data-ft=\'{{"tn":"*s"}}\'><div>{lines}</div></div>'
+    images = "".join(f'<a href="/photo.php?fbid={i+1}"><img src="/media/image_{i+1}.jpg"></a>' for i in range(n_images))
+    comments = make_comments(rng, n_comments)
+    n_pages = max(1, -(-n_comments // per_page))
+
+    pages = []
+    for p in range(n_pages):
+        items = "".join(f'<div id="{p * per_page + i + 1}"><div><h3><a href="/profile.php">User</a></h3>'
+                        f'<div>{text}</div><div>Like · Reply</div></div></div>'
+                        for i, (text, _) in enumerate(comments[p * per_page:(p + 1) * per_page]))
+        more = f'<div id="see_next_1"><a href="?{query}p={p + 1}">View more comments…</a></div>' if p + 1 < n_pages else ""
+        story = (caption + f'<div data-ft=\'{{"tn":"E"}}\'>{images}</div>') if p == 0 else ""
+        body = f'<div id="m_story_permalink_view">{story}<div id="ufi_1"><div>{items}</div>{more}</div></div>'
+        pages.append(page("Post", body))
+    return pages
+
+
+def build_feed_page(n_posts=200, batch=10, delay=50, seed=2):
+    """
+    Builds a fanpage feed that keeps appending post links while scrolled.
+
+    Args:
+        n_posts: The total number of posts in the feed.
+        batch: The number of posts loaded per scroll.
+        delay: The simulated loading time of a batch in milliseconds.
+        seed: The random seed, so fixtures are reproducible.
+
+    Returns:
+        The HTML of the page.
+    """
+    rng = random.Random(seed)
+    kinds = ("posts", "videos", "reel")
+    posts = []
+    for i in range(n_posts):
+        kind = rng.choice(kinds)
+        link = f"/{kind}/{1000000 + i}" if kind == "reel" else f"/benchpage/{kind}/{1000000 + i}"
+        posts.append([link, f"{i // 3 + 1} days ago"])
+    return page("Feed", '<div id="feed"></div>', _FEED_JS % {"posts": json.dumps(posts), "batch": batch,
+                                                             "delay": delay})
+
+
+def write_media(path, size, seed=0):
+    '''Write a file of pseudo-random bytes unless it already has the right size'''
+
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1 << 20)
+            f.write(rng.randbytes(chunk))
+            remaining -= chunk
+
+
+def write_fixtures(root, comments=1000, large_comments=10000, posts=200, images=4, image_size=200_000,
+                   video_size=5_000_000, large_video_size=64_000_000):
+    """
+    Writes the synthetic fixture set served by FixtureServer.
+
+    Every post, video and reel page exists in a normal and a large variant
+    (post.html/post_large.html, ...), plus a fully rendered copy under
+    snapshots/ for the browser-free parsing benchmark, and the post's basic
+    HTML view paged in basic_p0.html, basic_p1.html, ... Saved snapshots of real pages can be
+    dropped into the same layout and are used as-is when the benchmark is
+    pointed at that directory.
+
+    Args:
+        root: The fixture directory.
+        comments: The number of comments on each normal post, video and reel page.
+        large_comments: The number of comments on the large variants.
+        posts: The number of post links in the feed.
+        images: The number of images in the photo post.
+        image_size: The size of each image file in bytes.
+        video_size: The size of the video file in bytes.
+        large_video_size: The size of video_large.mp4, used for ranged downloads.
+
+    Returns:
+        The fixture directory.
+    """
+    media = os.path.join(root, "media")
+    for directory in (media, os.path.join(root, "snapshots")):
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    pages = {"feed.html": build_feed_page(posts)}
+    for suffix, n, query in (("", comments, ""), ("_large", large_comments, "size=large&")):
+        pages[f"post{suffix}.html"] = build_post_page(n, images)
+        pages[f"video{suffix}.html"] = build_video_page(n)
+        pages[f"reel{suffix}.html"] = build_video_page(n, reel=True)
+        pages[f"snapshots/post{suffix}.html"] = build_post_page(n, images, rendered=True)
+        pages[f"snapshots/video{suffix}.html"] = build_video_page(n, rendered=True)
+        pages[f"snapshots/reel{suffix}.html"] = build_video_page(n, reel=True, rendered=True)
+        for p, html in enumerate(build_basic_post_pages(n, images, query=query)):
+            pages[f"basic{suffix}_p{p}.html"] = html
+    for name, html in pages.items():
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(html)
+
+    for i in range(images):
+        write_media(os.path.join(media, f"image_{i+1}.jpg"), image_size, seed=i)
+    write_media(os.path.join(media, "video_1.mp4"), video_size, seed=100)
+    write_media(os.path.join(media, "video_large.mp4"), large_video_size, seed=101)
+    write_media(os.path.join(media, "emoji.png"), 100, seed=200)
+    return root
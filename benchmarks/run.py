@@ -0,0 +1,473 @@
+"""
+Offline benchmark of the crawler against local fixture pages.
+
+Serves synthetic (or saved) Facebook-like pages from a local HTTP server and
+runs the crawler's own functions against them in a headless Chrome, so wait
+strategies, extraction engines and downloaders can be compared without
+touching Facebook:
+
+    python -m benchmarks.run --driver /path/to/chromedriver
+    python -m benchmarks.run --no-browser    # HTML parsing and downloads only
+
+Results are printed and written to <out>/results.json, next to the per-stage
+profile (summary.json, trace.json) of configuration.profiling.
+"""
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from time import perf_counter, time
+from functools import partial
+import configuration as cf
+import argparse
+import tempfile
+import hashlib
+import shutil
+import pickle
+import json
+import os
+
+from benchmarks.fixtures import write_fixtures, REPLY_CLASS
+from benchmarks.server import FixtureServer
+
+
+POST_TYPES = ("post", "video", "reel")
+PARSERS = ("html.parser", "lxml")
+
+
+def make_browser(driver_path=None, headless=True):
+    """
+    Starts a plain Chrome for the benchmark: no login, no stealth, with the
+    performance log enabled like login() so get_network_video_urls works.
+
+    Args:
+        driver_path: Path to the chromedriver executable (found on PATH if None).
+        headless: Run Chrome without a window.
+
+    Returns:
+        A Selenium WebDriver instance.
+    """
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    service = Service(executable_path=driver_path) if driver_path else Service()
+    return webdriver.Chrome(service=service, options=options)
+
+
+def measure(results, name, func, *args, **kwargs):
+    """
+    Runs func once and appends its wall time and item count to results.
+
+    Returns:
+        What func returned.
+    """
+    start = perf_counter()
+    with cf.PROFILER.span(f"bench.{name}") as counts:
+        value = func(*args, **kwargs)
+        items = len(value) if isinstance(value, list) else value if isinstance(value, int) else 0
+        counts["items"] = items
+    results.append({"name": name, "seconds": perf_counter() - start, "items": items})
+    return value
+
+
+def summarize(results):
+    """
+    Aggregates the runs of each benchmark.
+
+    Returns:
+        A dict mapping benchmark name to runs, mean/p50/p95 seconds, items
+        per run and items per second.
+    """
+    by_name = {}
+    for r in results:
+        by_name.setdefault(r["name"], []).append(r)
+    summary = {}
+    for name, runs in by_name.items():
+        seconds = [r["seconds"] for r in runs]
+        items = sum(r["items"] for r in runs)
+        summary[name] = {
+            "runs": len(runs),
+            "mean": sum(seconds) / len(runs),
+            "p50": cf.percentile(seconds, 0.5),
+            "p95": cf.percentile(seconds, 0.95),
+            "items": items / len(runs),
+            "items_per_second": items / sum(seconds) if sum(seconds) > 0 else 0.0,
+        }
+    return summary
+
+
+def bench_parsing(results, fixtures, sizes):
+    '''Extract every post type from rendered snapshots with each parser backend'''
+
+    for post_type in POST_TYPES:
+        for size in sizes:
+            path = os.path.join(fixtures, "snapshots", f"{post_type}{'_large' if size == 'large' else ''}.html")
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+            for parser in PARSERS:
+                if parser == "lxml" and cf.HTML_PARSER != "lxml":
+                    continue  # lxml is optional
+                soup = measure(results, f"parse.{parser}.{post_type}.{size}", cf.make_soup, html, parser)
+                extractor = cf.CAPTION_EXTRACTORS["posts" if post_type == "post" else
+                                                  "videos" if post_type == "video" else "reel"]
+                measure(results, f"extract.{parser}.{post_type}.{size}.captions", extractor, soup)
+                measure(results, f"extract.{parser}.{post_type}.{size}.comments", cf.extract_comments, soup)
+
+
+def bench_parse_pool(results, fixtures, sizes, workers=None, posts=24):
+    '''Parse a batch of post snapshots in this process and on a ParsePool, checking both agree'''
+
+    snapshots = []
+    for post_type in POST_TYPES:
+        for size in sizes:
+            path = os.path.join(fixtures, "snapshots", f"{post_type}{'_large' if size == 'large' else ''}.html")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append([(f.read(), "posts" if post_type == "post" else
+                                       "videos" if post_type == "video" else "reel", ("captions", "comments"))])
+    if not snapshots:
+        return
+    batch = [snapshots[i % len(snapshots)] for i in range(posts)]
+
+    serial = measure(results, "parse_pool.serial", lambda: [cf.parse_snapshots(s)[0] for s in batch])
+
+    def parse_on_pool():
+        parsed = [None] * len(batch)
+        with cf.ParsePool(workers) as pool:
+            for i, s in enumerate(batch):
+                pool.submit(s, partial(lambda i, fields, error: parsed.__setitem__(i, fields), i))
+        return parsed
+
+    pooled = measure(results, f"parse_pool.workers_{workers or os.cpu_count()}", parse_on_pool)
+    if pooled != serial:
+        raise RuntimeError("The parse pool's fields differ from parsing in process")
+
+
+def bench_archive(results, fixtures, work_dir, workers=None, posts=24):
+    '''Archive post snapshots with PageArchive, then re-extract them all on a ParsePool'''
+
+    pages = []
+    for post_type in POST_TYPES:
+        path = os.path.join(fixtures, "snapshots", f"{post_type}.html")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                pages.append((f.read(), "posts" if post_type == "post" else
+                              "videos" if post_type == "video" else "reel"))
+    if not pages:
+        return
+
+    def archive_posts():
+        with cf.PageArchive(work_dir) as archive:
+            for i in range(posts):
+                html, post_type = pages[i % len(pages)]
+                archive.add(str(i), f"https://www.facebook.com/page/{post_type}/{i}",
+                            [(html, post_type, ("captions", "comments"))])
+        return posts
+
+    def reextract_posts():
+        parsed = []
+        with cf.PageArchive(work_dir) as archive, cf.ParsePool(workers, parse=cf.parse_archived) as pool:
+            for post in archive.posts():
+                pool.submit(post["snapshots"], lambda fields, error: parsed.append(fields))
+        return parsed
+
+    measure(results, "archive.add", archive_posts)
+    parsed = measure(results, "archive.reextract", reextract_posts)
+    if len(parsed) != posts or None in parsed:
+        raise RuntimeError(f"Re-extracted {len(parsed)} of {posts} archived posts")
+
+
+def bench_downloads(results, server, work_dir, images=4):
+    '''Download the fixture media sequentially, with MediaDownloader, and through a MediaStore'''
+
+    image_urls = [server.url(f"media/image_{i+1}.jpg") for i in range(images)]
+    video_urls = [server.url("media/video_1.mp4")]
+
+    folder = os.path.join(work_dir, "sequential")
+    measure(results, "download.sequential.images", lambda: cf.download_images(image_urls, folder) or image_urls)
+    measure(results, "download.sequential.videos", lambda: cf.download_videos(video_urls, folder) or video_urls)
+
+    def pooled(store=None):
+        with cf.MediaDownloader(store=store) as downloader:
+            futures = (downloader.submit_images(image_urls, os.path.join(work_dir, "pooled"))
+                       + downloader.submit_videos(video_urls, os.path.join(work_dir, "pooled")))
+            return [f.result() for f in futures]
+
+    measure(results, "download.pooled", pooled)
+    store = cf.MediaStore(os.path.join(work_dir, "store"))
+    try:
+        measure(results, "download.store.cold", pooled, store)
+        measure(results, "download.store.warm", pooled, store)
+    finally:
+        store.close()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bench_ranged(results, server, fixtures, work_dir):
+    '''Fetch the large video with one stream, with parallel Range requests, and resumed after resets'''
+
+    url = server.url("media/video_large.mp4")
+    expected = file_digest(os.path.join(fixtures, "media", "video_large.mp4"))
+    session = cf.make_session(pool_size=cf.RANGE_CONNECTIONS)
+    os.makedirs(work_dir, exist_ok=True)
+
+    single, ranged, resumed = (os.path.join(work_dir, name) for name in ("single.mp4", "ranged.mp4", "resumed.mp4"))
+    measure(results, "download.single.video_large", cf.fetch_to_file, session, url, single)
+    measure(results, "download.ranged.video_large", cf.fetch_media, session, url, ranged, threshold=0)
+
+    def resume():
+        # Every third part is cut short and parts are not retried, so each call fails
+        # until the recorded parts add up to the whole file
+        attempts = 0
+        server.fail_every = 3
+        try:
+            while True:
+                attempts += 1
+                try:
+                    cf.fetch_media(session, url, resumed, threshold=0, retries=0)
+                    return attempts
+                except Exception:
+                    if attempts >= 50:
+                        raise
+        finally:
+            server.fail_every = 0
+
+    measure(results, "download.resumed.video_large", resume)
+    for path in (single, ranged, resumed):
+        if file_digest(path) != expected:
+            raise RuntimeError(f"{path} does not match the served file")
+    session.close()
+
+
+def bench_http(results, server, work_dir, sizes, expected_comments):
+    '''Fetch the post's basic HTML view and all its comment pages over HTTP, without a browser'''
+
+    os.makedirs(work_dir, exist_ok=True)
+    cookies_path = os.path.join(work_dir, "cookies.pkl")
+    with open(cookies_path, "wb") as f:
+        pickle.dump([{"name": "c_user", "value": "1", "domain": "127.0.0.1", "path": "/"}], f)
+    session = cf.make_cookie_session(cookies_path)
+    for size in sizes:
+        url = page_url(server, "basic", size, 0)
+        comments = measure(results, f"http.fetch_post_http.post.{size}",
+                           lambda: (cf.fetch_post_http(session, url, host=None, max_comment_pages=None)
+                                    or {"comments": []})["comments"])
+        if len(comments) != expected_comments[size]:
+            raise RuntimeError(f"fetch_post_http found {len(comments)} of {expected_comments[size]} comments")
+    session.close()
+
+
+def bench_feed(results, browser, server, max_posts=None):
+    '''Scroll the fixture feed with get_post_links'''
+
+    measure(results, "browser.get_post_links", cf.get_post_links, browser, server.url("benchpage"),
+            max_posts=max_posts, max_idle_scrolls=3)
+
+
+def page_url(server, kind, size, i):
+    query = "?size=large" if size == "large" else ""
+    if kind == "reel":
+        return server.url(f"reel/{2000000 + i}{query}")
+    return server.url(f"benchpage/{kind}/{2000000 + i}{query}")
+
+
+def bench_post(results, browser, server, size, i):
+    '''The "posts" branch of crawl_post: load every comment, then extract from one snapshot'''
+
+    measure(results, f"browser.open_page.post.{size}", cf.open_page, browser, page_url(server, "posts", size, i),
+            "full")
+    measure(results, f"browser.load_all_comments.post.{size}", cf.load_all_comments, browser)
+    # load_all_comments expands every truncated comment and reply thread
+    replies = measure(results, f"browser.replies_loaded.post.{size}", cf.count_nodes, browser,
+                      f'div[class*="{REPLY_CLASS}"]')
+    if not replies or cf.count_nodes(browser, f".{cf.SEE_MORE_CLASS}"):
+        raise RuntimeError("load_all_comments left comments or reply threads unexpanded")
+    # Whole-page snapshot parsed with BeautifulSoup vs. one injected extraction script
+    html = measure(results, f"browser.get_page_html.post.{size}", cf.get_page_html, browser)
+    measure(results, f"browser.extract_post.post.{size}", lambda: cf.extract_post(html, "posts")["comments"])
+    measure(results, f"browser.extract_post_live.post.{size}",
+            lambda: cf.extract_post_live(browser, "posts")["comments"])
+
+
+def bench_video(results, browser, server, size, i, reel=False):
+    '''The "videos"/"reel" branches of crawl_post: captions, comments and video URLs'''
+
+    kind = "reel" if reel else "video"
+    cf.clear_network_log(browser)
+    measure(results, f"browser.open_page.{kind}.{size}", cf.open_page, browser,
+            page_url(server, "reel" if reel else "videos", size, i), "full")
+    try:
+        cf.click_see_more(browser)
+    except Exception:
+        pass
+    if reel:
+        measure(results, f"browser.get_captions_reel.{kind}.{size}", cf.get_captions_reel, browser)
+    else:
+        measure(results, f"browser.get_captions_spe.{kind}.{size}", cf.get_captions_spe, browser)
+    measure(results, f"browser.extract_captions.{kind}.{size}",
+            lambda: cf.CAPTION_EXTRACTORS["reel" if reel else "videos"](cf.get_page_html(browser)))
+    measure(results, f"browser.get_network_video_urls.{kind}.{size}", cf.get_network_video_urls, browser)
+    measure(results, f"browser.get_video_urls.{kind}.{size}", cf.get_video_urls, browser)
+
+    measure(results, f"browser.click_all_view_more_comments.{kind}.{size}", cf.click_all_view_more_comments, browser)
+    measure(results, f"browser.load_all_comments.{kind}.{size}", cf.load_all_comments, browser)
+    measure(results, f"browser.extract_comments.{kind}.{size}",
+            lambda: cf.extract_comments(cf.get_page_html(browser)))
+    measure(results, f"browser.extract_post_live.{kind}.{size}",
+            lambda: cf.extract_post_live(browser, "reel" if reel else "videos")["comments"])
+
+
+def bench_harvest(results, browser, server, size, i):
+    '''Stream comments with harvest_comments, recording how many nodes the page keeps'''
+
+    for kind in ("posts", "videos"):
+        name = "post" if kind == "posts" else "video"
+        cf.open_page(browser, page_url(server, kind, size, i), "full")
+        measure(results, f"browser.harvest_comments.{name}.{size}", cf.harvest_comments, browser)
+        measure(results, f"browser.dom_nodes_after_harvest.{name}.{size}",
+                lambda: browser.execute_script("return document.getElementsByTagName('*').length;"))
+
+
+def bench_lifecycle(results, driver_path, headless, server, size, posts, recycle_after):
+    '''Crawl many post pages in a row on one browser, then under a BrowserLifecycle restarting it'''
+
+    for label, max_posts in (("kept", None), (f"recycled_{recycle_after}", recycle_after)):
+        lifecycle = cf.BrowserLifecycle(partial(make_browser, driver_path, headless), name=label,
+                                        max_posts=max_posts, max_rss_mb=None, slowdown=None)
+        try:
+            for i in range(posts):
+                browser = lifecycle.browser
+                measure(results, f"browser.lifecycle.post.{size}.{label}", lambda: (
+                    cf.open_page(browser, page_url(server, "posts", size, i), "full"),
+                    cf.load_all_comments(browser),
+                    cf.extract_post_live(browser, "posts")["comments"])[-1])
+                rss = cf.browser_rss_mb(browser)
+                if rss is not None:
+                    results.append({"name": f"browser.lifecycle.rss_mb.{size}.{label}", "seconds": 0.0,
+                                    "items": rss})
+                lifecycle.post_done()
+        finally:
+            if lifecycle.browser is not None:
+                lifecycle.browser.quit()
+
+
+def bench_prefetch(results, browser, server, size, posts):
+    '''Crawl post pages one after the other, then with the next one prefetched in a second tab'''
+
+    urls = [page_url(server, "posts", size, i) for i in range(posts)]
+    for mode in ("serial", "prefetch"):
+        prefetcher = cf.TabPrefetcher(browser) if mode == "prefetch" else None
+        try:
+            for i, url in enumerate(urls):
+                if prefetcher is not None:
+                    prefetcher.queue(urls[i + 1] if i + 1 < len(urls) else None, "full")
+                measure(results, f"browser.pipeline.post.{size}.{mode}", lambda: (
+                    cf.open_page(browser, url, "full"),
+                    cf.load_all_comments(browser),
+                    cf.extract_post_live(browser, "posts")["comments"])[-1])
+        finally:
+            if prefetcher is not None:
+                prefetcher.cancel()
+                del browser.prefetcher
+
+
+def print_summary(summary):
+    print(f"{'benchmark':<56}{'runs':>5}{'mean s':>10}{'p50 s':>9}{'p95 s':>9}{'items':>12}{'items/s':>14}")
+    for name, s in summary.items():
+        print(f"{name:<56}{s['runs']:>5}{s['mean']:>10.3f}{s['p50']:>9.3f}{s['p95']:>9.3f}"
+              f"{s['items']:>12.0f}{s['items_per_second']:>14.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against local fixture pages.")
+    parser.add_argument("--driver", help="Path to chromedriver (default: found on PATH)")
+    parser.add_argument("--fixtures", help="Fixture directory; generated when it has no feed.html")
+    parser.add_argument("--out", default="benchmarks/results", help="Where results and the profile are written")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark")
+    parser.add_argument("--sizes", default="normal,large", help="Comma-separated fixture sizes: normal,large")
+    parser.add_argument("--comments", type=int, default=1000, help="Comments on the normal fixtures")
+    parser.add_argument("--large-comments", type=int, default=10000, help="Comments on the large fixtures")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every server response")
+    parser.add_argument("--no-browser", action="store_true", help="Skip the benchmarks that need Chrome")
+    parser.add_argument("--headed", action="store_true", help="Show the browser window")
+    parser.add_argument("--pace", action="store_true", help="Keep the rate scheduler's default pacing")
+    parser.add_argument("--lifecycle-posts", type=int, default=0,
+                        help="Posts per browser lifecycle benchmark (0 skips it)")
+    parser.add_argument("--recycle-after", type=int, default=50, help="Posts between restarts in that benchmark")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="Processes of the parse pool benchmark (0: all cores)")
+    parser.add_argument("--pipeline-posts", type=int, default=0,
+                        help="Posts per run of the prefetch benchmark (0 skips it)")
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    fixtures = args.fixtures or tempfile.mkdtemp(prefix="fb-fixtures-")
+    if not os.path.exists(os.path.join(fixtures, "feed.html")):
+        print(f"Writing fixtures to {fixtures}")
+        write_fixtures(fixtures, comments=args.comments, large_comments=args.large_comments)
+    work_dir = tempfile.mkdtemp(prefix="fb-bench-")
+
+    if not args.pace:
+        # Local fixtures need no pacing; accounts created from now on start unthrottled
+        cf.SCHEDULER.initial_rate = cf.SCHEDULER.max_rate = cf.SCHEDULER.burst = 1000
+    cf.PROFILER.enabled = True
+    cf.PROFILER.reset()
+    results = []
+    browser = None
+    try:
+        with FixtureServer(fixtures, latency=args.latency) as server:
+            for run in range(args.repeat):
+                bench_parsing(results, fixtures, sizes)
+                bench_parse_pool(results, fixtures, sizes, args.parse_workers or None)
+                bench_archive(results, fixtures, os.path.join(work_dir, str(run), "archive"), args.parse_workers or None)
+                bench_downloads(results, server, os.path.join(work_dir, str(run)))
+                bench_ranged(results, server, fixtures, os.path.join(work_dir, str(run), "ranged"))
+                bench_http(results, server, os.path.join(work_dir, str(run), "http"), sizes,
+                           {"normal": args.comments, "large": args.large_comments})
+
+            if not args.no_browser:
+                browser = make_browser(args.driver, headless=not args.headed)
+                for run in range(args.repeat):
+                    bench_feed(results, browser, server)
+                    for size in sizes:
+                        bench_post(results, browser, server, size, run)
+                        bench_video(results, browser, server, size, run)
+                        bench_video(results, browser, server, size, run, reel=True)
+                        bench_harvest(results, browser, server, size, run)
+                if args.pipeline_posts:
+                    for size in sizes:
+                        bench_prefetch(results, browser, server, size, args.pipeline_posts)
+                if args.lifecycle_posts:
+                    for size in sizes:
+                        bench_lifecycle(results, args.driver, not args.headed, server, size, args.lifecycle_posts,
+                                        args.recycle_after)
+    finally:
+        if browser is not None:
+            browser.quit()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.fixtures:
+            shutil.rmtree(fixtures, ignore_errors=True)
+
+    summary = summarize(results)
+    print_summary(summary)
+    print()
+    cf.PROFILER.report(args.out)
+    with open(os.path.join(args.out, "results.json"), "w", encoding="utf-8") as f:
+        json.dump({"created_at": time(), "args": vars(args), "benchmarks": summary}, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
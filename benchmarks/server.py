@@ -0,0 +1,148 @@
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+from time import sleep
+import itertools
+import threading
+import io
+import re
+import os
+
+
+# First matching URL segment -> fixture page, mirroring the post types of get_post_type
+ROUTES = {
+    "posts": "post",
+    "videos": "video",
+    "reel": "reel",
+    "feed": "feed",
+    "basic": "basic",
+}
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the fixture pages under Facebook-like URLs (e.g. /page/posts/<id>,
+    with ?size=large for the large variant, /page/basic/<id>?p=<n> for the
+    pages of the basic view) and the files under media/,
+    honouring single Range requests like a CDN does.
+    """
+
+    def _fixture(self, name, query):
+        if "size=large" in query and name != "feed":
+            name += "_large"
+        if name.startswith("basic"):
+            match = re.search(r"(?:^|&)p=(\d+)", query)
+            name += f"_p{match.group(1) if match else 0}"
+        return os.path.join(self.directory, name + ".html")
+
+    def translate_path(self, path):
+        path, _, query = path.partition("?")
+        segments = [s for s in path.split("/") if s]
+        if not segments:
+            return self._fixture(ROUTES["feed"], query)
+        if segments[0] != "media":
+            for segment in segments:
+                if segment in ROUTES:
+                    return self._fixture(ROUTES[segment], query)
+        return super().translate_path(path)
+
+    def send_head(self):
+        if self.server.latency:
+            sleep(self.server.latency)  # Simulated network round-trip
+        path = self.translate_path(self.path)
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", "").strip())
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        first, last = match.groups()
+        if first == "":  # Suffix range: the last N bytes
+            start, end = max(0, size - int(last or 0)), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start > end:
+            self.send_error(416, "Range Not Satisfiable")
+            return None
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Last-Modified", self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+
+        # Cut every fail_every-th range response short, like a connection reset
+        if self.server.fail_every and next(self.server.range_requests) % self.server.fail_every == 0:
+            self.close_connection = True
+            body = body[:len(body) // 2]
+        return io.BytesIO(body)
+
+    def copyfile(self, source, outputfile):
+        try:
+            super().copyfile(source, outputfile)
+        except ConnectionError:
+            # Clients drop truncated responses and abandoned streams; that is expected here
+            self.close_connection = True
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    Local HTTP server for the benchmark fixtures, running on a background
+    thread. Use it as a context manager.
+
+    Args:
+        root: The fixture directory (see write_fixtures).
+        port: The port to listen on; 0 picks a free one.
+        latency: Seconds added to every response, to mimic a slow network.
+        fail_every: Cut every n-th Range response short (0 never), to
+            exercise resumed downloads. Can be changed while running.
+    """
+
+    def __init__(self, root, port=0, latency=0.0, fail_every=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port),
+                                         partial(FixtureHandler, directory=os.path.abspath(root)))
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.fail_every = fail_every
+        self.httpd.range_requests = itertools.count(1)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fixture-server", daemon=True)
+
+    @property
+    def fail_every(self):
+        return self.httpd.fail_every
+
+    @fail_every.setter
+    def fail_every(self, n):
+        self.httpd.fail_every = n
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + "/" + path.lstrip("/")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -1,2 +1,20 @@
 from configuration.utils import *
-from configuration.config import *
\ No newline at end of file
+from configuration.config import *
+from configuration.downloader import *
+from configuration.extract import *
+from configuration.waits import *
+from configuration.feed import *
+from configuration.manifest import *
+from configuration.session import *
+from configuration.dataset import *
+from configuration.media_store import *
+from configuration.profiling import *
+from configuration.scheduler import *
+from configuration.jobs import *
+from configuration.harvest import *
+from configuration.lifecycle import *
+from configuration.http_fetch import *
+from configuration.prefetch import *
+from configuration.parse_pool import *
+from configuration.archive import *
+from configuration.expand import *
\ No newline at end of file
@@ -0,0 +1,180 @@
+from configuration.parse_pool import parse_snapshots
+from time import time
+import threading
+import tempfile
+import hashlib
+import sqlite3
+import gzip
+import json
+import os
+
+
+class PageArchive:
+    """
+    Compressed archive of the rendered HTML the crawl extracted posts from,
+    so the extractors can be run again over it when Facebook's class names
+    change, without crawling anything (see reextract.py).
+
+    Pages are stored gzip-compressed once per content hash under
+    root/blobs/<ab>/<sha256>.html.gz; an index maps each post and crawl to
+    its snapshots (the page as it was when each field was read). A crawl is
+    identified by the time the archive was opened, so a post retried within
+    a crawl replaces its snapshots while every crawl of it is kept. A
+    resumed crawl only archives the stages it ran, so the latest view of a
+    post takes each field from the newest crawl that read it. Safe to share
+    between threads.
+
+    Args:
+        root: The archive directory, e.g. data/<page_name>/archive.
+        compresslevel: The gzip level of new blobs.
+        wal: Use WAL mode; pass False when data/ is on a network share used
+            by several hosts (see JobQueue).
+    """
+
+    def __init__(self, root, compresslevel=6, wal=True):
+        self.root = root
+        self.compresslevel = compresslevel
+        self.blob_dir = os.path.join(root, "blobs")
+        if not os.path.exists(self.blob_dir):
+            os.makedirs(self.blob_dir, exist_ok=True)
+        self.crawled_at = time()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=" + ("WAL" if wal else "DELETE"))
+        self._conn.execute("CREATE TABLE IF NOT EXISTS snapshots (post_id TEXT NOT NULL, crawled_at REAL NOT NULL, "
+                           "seq INTEGER NOT NULL, url TEXT, post_type TEXT, fields TEXT, sha256 TEXT NOT NULL, "
+                           "PRIMARY KEY (post_id, crawled_at, seq))")
+        self._conn.commit()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, sha256[:2], sha256 + ".html.gz")
+
+    def _store(self, html):
+        '''Write a page once per content hash and return the hash'''
+
+        data = html.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            return sha256
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb",
+                                                          compresslevel=self.compresslevel, mtime=0) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return sha256
+
+    def add(self, post_id, url, snapshots):
+        """
+        Archives the snapshots of one post for the current crawl.
+
+        Args:
+            post_id: The post ID.
+            url: The post URL.
+            snapshots: A list of (html, post_type, fields) tuples, as
+                collected for a ParsePool.
+
+        Returns:
+            The number of bytes the pages take uncompressed.
+        """
+        rows = []
+        size = 0
+        for seq, (html, post_type, fields) in enumerate(snapshots):
+            rows.append((str(post_id), self.crawled_at, seq, url, post_type, json.dumps(list(fields)),
+                         self._store(html)))
+            size += len(html)
+        with self._lock:
+            self._conn.execute("DELETE FROM snapshots WHERE post_id = ? AND crawled_at = ?",
+                               (str(post_id), self.crawled_at))
+            self._conn.executemany("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+        return size
+
+    def posts(self, latest=True):
+        """
+        Streams the archived posts, ordered by post ID and crawl time.
+
+        Args:
+            latest: One entry per post, with each field read from the newest
+                crawl that archived it; False lists every crawl separately.
+
+        Yields:
+            Dicts with post_id, url, crawled_at (the newest crawl used) and
+            snapshots, a list of (blob path, post_type, fields) tuples for
+            parse_archived.
+        """
+        query = "SELECT post_id, crawled_at, url, post_type, fields, sha256 FROM snapshots ORDER BY post_id, "
+        query += "crawled_at DESC, seq" if latest else "crawled_at, seq"
+
+        # A separate connection, so the crawl can keep adding while a long listing streams
+        conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30)
+        try:
+            post = None
+            for post_id, crawled_at, url, post_type, fields, sha256 in conn.execute(query):
+                if post is None or post["post_id"] != post_id or (not latest and post["crawled_at"] != crawled_at):
+                    if post is not None:
+                        yield post
+                    post = {"post_id": post_id, "url": url, "crawled_at": crawled_at, "snapshots": []}
+                    newer, crawl, current = set(), crawled_at, set()
+                if crawled_at != crawl:
+                    # An older crawl of the post: only the fields no newer crawl read
+                    newer |= current
+                    crawl, current = crawled_at, set()
+                fields = tuple(field for field in json.loads(fields) if field not in newer)
+                if fields:
+                    current.update(fields)
+                    post["snapshots"].append((self.blob_path(sha256), post_type, fields))
+            if post is not None:
+                yield post
+        finally:
+            conn.close()
+
+    def count(self, latest=True):
+        '''Return the number of archived posts (or post crawls with latest=False)'''
+
+        with self._lock:
+            if latest:
+                return self._conn.execute("SELECT COUNT(DISTINCT post_id) FROM snapshots").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM (SELECT DISTINCT post_id, crawled_at "
+                                      "FROM snapshots)").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_archived_page(path):
+    '''Return the HTML of an archived page'''
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_archived(snapshots, parser=None):
+    """
+    Extracts a post from its archived snapshots. Reads the pages itself so
+    only their paths travel to the ParsePool's worker processes.
+
+    Args:
+        snapshots: A list of (blob path, post_type, fields) tuples, as
+            listed by PageArchive.posts.
+        parser: The BeautifulSoup parser backend (HTML_PARSER by default).
+
+    Returns:
+        A tuple (dict of the requested fields, seconds spent parsing).
+    """
+    return parse_snapshots([(read_archived_page(path), post_type, fields) for path, post_type, fields in snapshots],
+                           parser)
@@ -2,17 +2,137 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 import pickle
 import random
-from time import sleep
+import os
 from selenium.webdriver.chrome.options import Options
 from selenium_stealth import stealth
+from configuration.profiling import timed
+from configuration.scheduler import navigate, is_blocked_page
 
-def login(driver_path, cookies_path):
+# URL patterns for Network.setBlockedURLs ('*' is a wildcard)
+BLOCKED_MEDIA = ["*.mp4*", "*.m4a*", "*.m4v*", "*.webm*", "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*"]
+BLOCKED_FONTS = ["*.woff*", "*.ttf*", "*.otf*"]
+BLOCKED_TRACKING = ["*/ajax/bz*", "*/ajax/bnzai*", "*/logging_client_events*", "*connect.facebook.net*",
+                    "*doubleclick.net*", "*google-analytics.com*"]
+
+# Per-stage fetch profiles: text extraction needs no media, media URL discovery does
+FETCH_PROFILES = {
+    "text": {"blocked_urls": BLOCKED_MEDIA + BLOCKED_FONTS + BLOCKED_TRACKING},
+    "media": {"blocked_urls": BLOCKED_FONTS + BLOCKED_TRACKING},
+    "full": {"blocked_urls": []},
+}
+
+def apply_fetch_profile(browser, profile):
+    """
+    Blocks the resources of a fetch profile through the Chrome DevTools
+    Protocol. Only talks to the browser when the profile changes.
+
+    Args:
+        browser: A Selenium Chrome WebDriver instance.
+        profile: A key of FETCH_PROFILES.
+    """
+    if getattr(browser, "fetch_profile", None) == profile:
+        return
+    browser.execute_cdp_cmd("Network.enable", {})
+    browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": FETCH_PROFILES[profile]["blocked_urls"]})
+    browser.fetch_profile = profile
+
+def page_load_stats(browser):
+    """
+    Reads the Navigation/Resource Timing of the current page.
+
+    Returns:
+        A dict with load_ms (navigation start to load event), bytes
+        (transfer size of the document and its resources) and requests.
+    """
+    return browser.execute_script("""
+        var nav = performance.getEntriesByType('navigation')[0] || {};
+        var resources = performance.getEntriesByType('resource');
+        var bytes = nav.transferSize || 0;
+        resources.forEach(function (r) { bytes += r.transferSize || 0; });
+        return {load_ms: nav.loadEventEnd || nav.duration || 0, bytes: bytes, requests: resources.length + 1};
+    """)
+
+@timed()
+def open_page(browser, url, profile=None):
+    """
+    Loads a page under a fetch profile, paced by the rate scheduler. A page
+    the browser's TabPrefetcher already loads in another tab is taken from
+    there, and the prefetch queued next is started once the page is open.
+
+    Args:
+        browser: A Selenium Chrome WebDriver instance.
+        url: The URL to load.
+        profile: A key of FETCH_PROFILES, or None to keep the current one.
+
+    Returns:
+        The page_load_stats of the loaded page.
+
+    Raises:
+        RuntimeError: The page redirected to a login wall or checkpoint.
+    """
+    prefetcher = getattr(browser, "prefetcher", None)
+    if prefetcher is not None and prefetcher.take(url, profile):
+        loaded = not is_blocked_page(browser, url)
+    else:
+        if profile is not None:
+            apply_fetch_profile(browser, profile)
+        loaded = navigate(browser, url)
+    if not loaded:
+        raise RuntimeError(f"{url} redirected to a login wall or checkpoint ({browser.current_url})")
+    if prefetcher is not None:
+        prefetcher.page_opened()
+    try:
+        return page_load_stats(browser)
+    except Exception:
+        return {"load_ms": 0, "bytes": 0, "requests": 0}
+
+def summarize_page_loads(stats):
+    '''Print the average load time and bytes per page of a list of page_load_stats'''
+
+    if not stats:
+        return
+    n = len(stats)
+    print(f"Page loads: {n}, avg {sum(s['load_ms'] for s in stats) / n:.0f} ms, "
+          f"avg {sum(s['bytes'] for s in stats) / n / 1e6:.2f} MB, "
+          f"avg {sum(s['requests'] for s in stats) / n:.0f} requests")
+
+def is_logged_in(browser):
+    '''Return True if the browser holds a Facebook session (the c_user cookie)'''
+
+    try:
+        return browser.get_cookie("c_user") is not None
+    except Exception:
+        return False
+
+def load_cookies(browser, cookies_path):
+    """
+    Adds the saved cookies to the browser's current domain.
+
+    Args:
+        browser: A Selenium WebDriver instance on a facebook.com page.
+        cookies_path: Path to the file containing saved cookies.
+    """
+    with open(cookies_path, "rb") as f:
+        cookies = pickle.load(f)
+    for cookie in cookies:
+        # Ensure the 'sameSite' attribute is set, or it will be ignored by Chrome
+        if 'sameSite' not in cookie:
+            cookie['sameSite'] = 'None' # You might need 'Strict' or 'Lax' depending on the website and cookie
+        if cookie.get('expiry', None) is not None:
+            cookie['expiry'] = int(cookie['expiry'])
+        browser.add_cookie(cookie)
+
+@timed()
+def login(driver_path, cookies_path, profile_dir=None, headless=False):
     """
     Logs into Facebook using saved cookies, with enhanced bot detection avoidance.
 
     Args:
         driver_path: Path to the chromedriver executable.
         cookies_path: Path to the file containing saved cookies.
+        profile_dir: Optional persistent Chrome user-data directory. When the
+            profile is still logged in, the cookies are not re-injected.
+        headless: Run Chrome without a window.
 
     Returns:
         A Selenium WebDriver instance logged into Facebook.
@@ -20,8 +140,10 @@ def login(driver_path, cookies_path):
 
     options = Options()
     
-    # Headless mode (comment out to run with visible browser)
-    # options.add_argument("--headless")
+    # Headless mode
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
 
     # Stealth options
     options.add_argument("start-maximized")
@@ -40,6 +162,13 @@ def login(driver_path, cookies_path):
     ]
     options.add_argument(f"user-agent={random.choice(user_agents)}")
 
+    # Record network events so media URLs can be read from the traffic (see get_network_video_urls)
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    # Persistent profile keeps the session between runs
+    if profile_dir is not None:
+        options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+
     # Use the Service object to specify the path to chromedriver
     service = Service(executable_path=driver_path)
 
@@ -56,20 +185,19 @@ def login(driver_path, cookies_path):
             fix_hairline=True,
             )
 
-    # Open Facebook with initial sleep
-    browser.get('https://www.facebook.com/')
-    sleep(random.uniform(3, 5))  # Initial longer sleep
+    # Navigations of the same account share one rate (see RateScheduler)
+    browser.account = cookies_path
+
+    # Open Facebook
+    navigate(browser, 'https://www.facebook.com/')
+
+    # A persistent profile that is still logged in needs no cookies or refresh
+    if profile_dir is not None and is_logged_in(browser):
+        return browser
 
     # Load cookies
     try:
-        cookies = pickle.load(open(cookies_path, "rb"))
-        for cookie in cookies:
-            # Ensure the 'sameSite' attribute is set, or it will be ignored by Chrome
-            if 'sameSite' not in cookie:
-                cookie['sameSite'] = 'None' # You might need 'Strict' or 'Lax' depending on the website and cookie
-            if cookie.get('expiry', None) is not None:
-                cookie['expiry'] = int(cookie['expiry'])
-            browser.add_cookie(cookie)
+        load_cookies(browser, cookies_path)
     except FileNotFoundError:
         print(f"Error: Cookies file not found at {cookies_path}")
         browser.quit()
@@ -79,14 +207,14 @@ def login(driver_path, cookies_path):
         browser.quit()
         return None
 
-    # Refresh with human-like delay
-    browser.get('https://www.facebook.com/')
-    sleep(random.uniform(2, 4))  # Shorter sleep after refresh
+    # Refresh, paced like every other navigation
+    navigate(browser, 'https://www.facebook.com/')
 
     return browser
 
 
-def login_mobile(driver_path, cookies_path):
+@timed()
+def login_mobile(driver_path, cookies_path, profile_dir=None, headless=False):
     """
     Logs into Facebook using saved cookies, emulating a mobile device, 
     with enhanced bot detection avoidance.
@@ -94,6 +222,9 @@ def login_mobile(driver_path, cookies_path):
     Args:
         driver_path: Path to the chromedriver executable.
         cookies_path: Path to the file containing saved cookies.
+        profile_dir: Optional persistent Chrome user-data directory (must not
+            be shared with a desktop browser running at the same time).
+        headless: Run Chrome without a window.
 
     Returns:
         A Selenium WebDriver instance logged into Facebook, emulating a mobile device.
@@ -106,8 +237,9 @@ def login_mobile(driver_path, cookies_path):
     options = Options()
     options.add_experimental_option("mobileEmulation", mobile_emulation)
 
-    # Headless mode (comment out to run with visible browser)
-    # options.add_argument("--headless")
+    # Headless mode
+    if headless:
+        options.add_argument("--headless=new")
 
     # Stealth options - Important even when emulating a mobile device
     options.add_argument("start-maximized") # Even in mobile emulation, maximizing can be helpful
@@ -125,6 +257,10 @@ def login_mobile(driver_path, cookies_path):
     ]
     options.add_argument(f"user-agent={random.choice(user_agents)}")
 
+    # Persistent profile keeps the session between runs
+    if profile_dir is not None:
+        options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+
     # Use the Service object to specify the path to chromedriver
     service = Service(executable_path=driver_path)
 
@@ -141,20 +277,19 @@ def login_mobile(driver_path, cookies_path):
             fix_hairline=True,
             )
 
-    # Open Facebook with initial sleep
-    browser.get('https://m.facebook.com/') # Use the mobile version of Facebook
-    sleep(random.uniform(3, 5))  # Initial longer sleep
+    # Navigations of the same account share one rate (see RateScheduler)
+    browser.account = cookies_path
+
+    # Open Facebook
+    navigate(browser, 'https://m.facebook.com/') # Use the mobile version of Facebook
+
+    # A persistent profile that is still logged in needs no cookies or refresh
+    if profile_dir is not None and is_logged_in(browser):
+        return browser
 
     # Load cookies
     try:
-        cookies = pickle.load(open(cookies_path, "rb"))
-        for cookie in cookies:
-            # Ensure the 'sameSite' attribute is set correctly
-            if 'sameSite' not in cookie:
-                cookie['sameSite'] = 'None' # Or 'Strict', 'Lax'
-            if cookie.get('expiry', None) is not None:
-                cookie['expiry'] = int(cookie['expiry'])
-            browser.add_cookie(cookie)
+        load_cookies(browser, cookies_path)
     except FileNotFoundError:
         print(f"Error: Cookies file not found at {cookies_path}")
         browser.quit()
@@ -164,8 +299,7 @@ def login_mobile(driver_path, cookies_path):
         browser.quit()
         return None
 
-    # Refresh with human-like delay
-    browser.get('https://m.facebook.com/') # Use the mobile version of Facebook
-    sleep(random.uniform(2, 4))  # Shorter sleep after refresh
+    # Refresh, paced like every other navigation
+    navigate(browser, 'https://m.facebook.com/') # Use the mobile version of Facebook
 
     return browser
\ No newline at end of file
@@ -0,0 +1,110 @@
+from time import time
+import threading
+import gzip
+import json
+import glob
+import os
+
+
+SHARD_PATTERN = "part-{:05d}.jsonl.gz"
+
+
+class DatasetWriter:
+    """
+    Buffered writer appending one JSON record per post to sharded,
+    gzip-compressed JSONL files under root.
+
+    Records are kept in memory and flushed every batch_size records (each
+    flush appends one gzip member to the current shard); a new shard is
+    started every shard_size records. Shards of earlier runs are never
+    rewritten, so re-crawled posts appear again with a later crawled_at.
+    Safe to share between crawl threads.
+    """
+
+    def __init__(self, root, batch_size=50, shard_size=5000):
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.batch_size = batch_size
+        self.shard_size = shard_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._shard = len(glob.glob(os.path.join(root, "part-*.jsonl.gz")))
+        self._shard_count = 0
+
+    def write(self, record):
+        """
+        Queues a record, flushing when the batch is full.
+
+        Args:
+            record: A JSON-serialisable dict; crawled_at is added if missing.
+        """
+        record.setdefault("crawled_at", time())
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        while self._buffer:
+            room = self.shard_size - self._shard_count
+            batch, self._buffer = self._buffer[:room], self._buffer[room:]
+            path = os.path.join(self.root, SHARD_PATTERN.format(self._shard))
+            with gzip.open(path, "at", encoding="utf-8") as f:
+                for record in batch:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._shard_count += len(batch)
+            if self._shard_count >= self.shard_size:
+                self._shard += 1
+                self._shard_count = 0
+
+    def flush(self):
+        '''Write buffered records to disk'''
+
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def iter_dataset(root):
+    """
+    Streams the records of a dataset written by DatasetWriter, shard by
+    shard, without walking the post folders.
+
+    Args:
+        root: The dataset directory.
+
+    Yields:
+        One dict per post record, in write order.
+    """
+    for path in sorted(glob.glob(os.path.join(root, "part-*.jsonl.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def load_latest_records(root):
+    """
+    Reads a dataset keeping the most recent value of each field of each
+    post. A resumed post only carries the fields of the stages that were
+    still pending (e.g. only media), so later records are merged over the
+    earlier ones instead of replacing them.
+
+    Returns:
+        A dict mapping post_id to its merged record.
+    """
+    latest = {}
+    for record in iter_dataset(root):
+        post_id = record.get("post_id")
+        latest[post_id] = dict(latest.get(post_id, {}), **record)
+    return latest
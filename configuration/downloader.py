@@ -0,0 +1,382 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+import requests
+import json
+import os
+from time import time
+from configuration.profiling import PROFILER
+
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+
+# Files at least this large are fetched with parallel Range requests
+RANGE_THRESHOLD = 16 * 1024 * 1024
+RANGE_PART_SIZE = 8 * 1024 * 1024
+RANGE_CONNECTIONS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def media_path(folder, kind, i):
+    '''Return the file path of the i-th (0-based) image or video of a post folder'''
+
+    return os.path.join(folder, f"image_{i+1}.jpg" if kind == "image" else f"video_{i+1}.mp4")
+
+
+def make_session(pool_size=10, retries=2):
+    """
+    Creates a requests Session with keep-alive connection pooling and retries.
+
+    Args:
+        pool_size: The number of connections kept open per host.
+        retries: The number of retries on connection errors and 5xx responses.
+
+    Returns:
+        A requests.Session instance.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    '''Return the process-wide pooled session, creating it on first use'''
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+    return _session
+
+
+def _write_response(response, path, chunk_size):
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size):
+            if chunk:
+                f.write(chunk)
+                written += len(chunk)
+    return written
+
+
+def fetch_to_file(session, url, path, chunk_size=65536, timeout=DEFAULT_TIMEOUT):
+    """
+    Streams a URL to a file.
+
+    Args:
+        session: The requests Session to use.
+        url: The URL to download.
+        path: The destination file path.
+        chunk_size: The size of the chunks read from the response.
+        timeout: The (connect, read) timeout in seconds.
+
+    Returns:
+        The number of bytes written.
+    """
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()  # Raise an exception for bad status codes
+        return _write_response(response, path, chunk_size)
+
+
+class _PartState:
+    '''Sidecar file recording which parts of a ranged download are on disk'''
+
+    def __init__(self, path, size, validator):
+        self.path = path + ".json"
+        self.size = size
+        self.validator = validator
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("size") == size and saved.get("validator") == validator:
+                self.done = set(saved.get("done", []))
+        except (OSError, ValueError):
+            pass
+
+    def mark(self, part):
+        with self._lock:
+            self.done.add(part)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"size": self.size, "validator": self.validator, "done": sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _fetch_part(session, url, part_path, start, end, timeout, chunk_size, retries):
+    for attempt in range(retries + 1):
+        try:
+            written = 0
+            with session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True,
+                             timeout=timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise requests.exceptions.RequestException("server ignored the Range header")
+                with open(part_path, "r+b") as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+            if written != end - start + 1:
+                raise requests.exceptions.RequestException(f"short read: {written} of {end - start + 1} bytes")
+            return written
+        except requests.exceptions.RequestException:
+            if attempt == retries:
+                raise
+
+
+def fetch_ranged(session, url, path, size, validator=None, part_size=RANGE_PART_SIZE, connections=RANGE_CONNECTIONS,
+                 chunk_size=65536, timeout=DEFAULT_TIMEOUT, retries=2, slots=None):
+    """
+    Downloads a file with concurrent Range requests into path + ".part".
+
+    Finished parts are recorded next to it (path + ".part.json"), so calling
+    it again after an interruption only fetches the missing parts, as long
+    as the remote file is unchanged. The file is moved to path once
+    complete.
+
+    Args:
+        session: The requests Session to use.
+        url: The URL to download.
+        path: The destination file path.
+        size: The size of the remote file.
+        validator: The remote ETag/Last-Modified, to detect a changed file.
+        part_size: The number of bytes per Range request.
+        connections: The most parts fetched at the same time.
+        chunk_size: The size of the chunks read from each response.
+        timeout: The (connect, read) timeout in seconds.
+        retries: Attempts per part after the first one.
+        slots: An optional semaphore bounding the connections to the host,
+            of which the caller holds one; each connection beyond the
+            first takes another, as far as some are free.
+
+    Returns:
+        The number of bytes downloaded by this call.
+    """
+    part_path = path + ".part"
+    state = _PartState(part_path, size, validator)
+    if not state.done or not os.path.exists(part_path):
+        state.done = set()
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+    parts = [(i, start, min(start + part_size, size) - 1) for i, start in enumerate(range(0, size, part_size))
+             if i not in state.done]
+
+    def fetch(part):
+        i, start, end = part
+        written = _fetch_part(session, url, part_path, start, end, timeout, chunk_size, retries)
+        state.mark(i)
+        return written
+
+    # Never wait for a slot: every download holds one already, so waiting could deadlock
+    extra = 0
+    if slots is not None:
+        while extra < min(connections, len(parts)) - 1 and slots.acquire(blocking=False):
+            extra += 1
+        connections = 1 + extra
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(connections, len(parts))),
+                                thread_name_prefix="range") as executor:
+            written = sum(executor.map(fetch, parts))
+    finally:
+        for _ in range(extra):
+            slots.release()
+
+    os.replace(part_path, path)
+    state.remove()
+    return written
+
+
+def fetch_media(session, url, path, chunk_size=65536, timeout=DEFAULT_TIMEOUT, threshold=RANGE_THRESHOLD,
+                connections=RANGE_CONNECTIONS, part_size=RANGE_PART_SIZE, retries=2, slots=None):
+    """
+    Downloads a media file. Small files, and servers without Range support,
+    get a single stream; for files of threshold bytes or more the response
+    headers are enough to switch to fetch_ranged (parallel and resumable,
+    within the host's slots if given).
+
+    Returns:
+        The number of bytes downloaded.
+    """
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        size = int(response.headers.get("Content-Length") or 0)
+        if (threshold is None or size < threshold or response.headers.get("Accept-Ranges") != "bytes"
+                or response.headers.get("Content-Encoding")):
+            return _write_response(response, path, chunk_size)
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    return fetch_ranged(session, url, path, size, validator, part_size, connections, chunk_size, timeout, retries,
+                        slots)
+
+
+class MediaDownloader:
+    """
+    Background media downloader with a pooled HTTP client.
+
+    URLs are handed off with submit()/submit_images()/submit_videos() and
+    downloaded on a thread pool, so the crawl loop can keep navigating.
+    Concurrency is bounded globally by max_workers and per host by per_host.
+    With a MediaStore, assets already stored are linked without any request.
+    Files of range_threshold bytes or more are fetched with up to
+    range_connections parallel, resumable Range requests (see fetch_ranged),
+    which count against per_host too; None disables it.
+    """
+
+    def __init__(self, max_workers=8, per_host=4, timeout=DEFAULT_TIMEOUT, chunk_size=65536, store=None,
+                 range_threshold=RANGE_THRESHOLD, range_connections=RANGE_CONNECTIONS):
+        self.session = make_session(pool_size=max(max_workers, per_host) + range_connections)
+        self.store = store
+        self.range_threshold = range_threshold
+        self.range_connections = range_connections
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="downloader")
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._done = 0
+        self._failed = 0
+        self._cached = 0
+        self._bytes = 0
+        self._started = None
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _download(self, url, path, post_id=None):
+        # Attribute the download to the post that queued it
+        with PROFILER.post(post_id), PROFILER.span("download") as counts:
+            return self._download_file(url, path, counts)
+
+    def _download_file(self, url, path, counts):
+        if self.store is not None:
+            blob = self.store.lookup(url)
+            if blob is not None:
+                self.store.link(blob, path)
+                with self._lock:
+                    self._queued -= 1
+                    self._cached += 1
+                counts["cached"] = 1
+                return path
+
+        with self._host_slot(url):
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                if self._started is None:
+                    self._started = time()
+            try:
+                if self.store is not None:
+                    blob, written = self.store.fetch(self.session, url, os.path.splitext(path)[1],
+                                                     self.timeout, self.chunk_size, download=self._fetch)
+                    self.store.link(blob, path)
+                else:
+                    written = self._fetch(self.session, url, path)
+                with self._lock:
+                    self._bytes += written
+                    self._done += 1
+                counts["bytes"] = written
+                return path
+            except requests.exceptions.RequestException as e:
+                with self._lock:
+                    self._failed += 1
+                counts["failed"] = 1
+                print(f"Error downloading {url}: {e}")
+                return None
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def _fetch(self, session, url, path):
+        return fetch_media(session, url, path, self.chunk_size, self.timeout, self.range_threshold,
+                           self.range_connections, slots=self._host_slot(url))
+
+    def submit(self, url, path):
+        """
+        Queues a single download.
+
+        Args:
+            url: The URL to download.
+            path: The destination file path.
+
+        Returns:
+            A Future resolving to the path, or None if the download failed.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._download, url, path, PROFILER.current_post())
+
+    def submit_images(self, image_urls, download_dir="images"):
+        '''Queue images with the same file layout as download_images'''
+
+        return [self.submit(url, media_path(download_dir, "image", i))
+                for i, url in enumerate(image_urls or []) if url]
+
+    def submit_videos(self, video_urls, download_dir="videos"):
+        '''Queue videos with the same file layout as download_videos'''
+
+        return [self.submit(url, media_path(download_dir, "video", i))
+                for i, url in enumerate(video_urls or []) if url]
+
+    def stats(self):
+        """
+        Returns a snapshot of the downloader's progress.
+
+        Returns:
+            A dict with queue depth, active/done/failed/cached counts, total bytes
+            and average throughput in bytes per second.
+        """
+        with self._lock:
+            elapsed = time() - self._started if self._started else 0
+            return {
+                "queued": self._queued,
+                "active": self._active,
+                "done": self._done,
+                "failed": self._failed,
+                "cached": self._cached,
+                "bytes": self._bytes,
+                "bytes_per_second": self._bytes / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def report(self):
+        '''Print a one-line summary of the downloader's progress'''
+
+        s = self.stats()
+        print(f"Downloads: {s['done']} done, {s['cached']} already stored, {s['failed']} failed, {s['active']} active, "
+              f"{s['queued']} queued, {s['bytes'] / 1e6:.1f} MB at {s['bytes_per_second'] / 1e6:.2f} MB/s")
+
+    def close(self, wait=True):
+        '''Wait for queued downloads (if wait is True) and release the pool'''
+
+        self._executor.shutdown(wait=wait)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,78 @@
+from configuration.waits import wait_for_dom_settle
+from configuration.profiling import PROFILER, timed
+
+
+SEE_MORE_CLASS = "x11i0hfl"
+# Text of the controls opening reply threads: "View 1 reply", "View all 12 replies",
+# "View more replies", "View previous replies", "Jane replied · 3 Replies"
+REPLY_BUTTON_PATTERN = (r"^(view( all| more| previous)?( \d+)? (more |previous )?repl(y|ies)"
+                        r"|.* replied\b.*|\d+ repl(y|ies))$")
+EXPANDED_ATTR = "data-expanded"
+# How long the page must stay quiet after a round of clicks
+EXPAND_IDLE_SECONDS = 0.5
+
+# Clicks up to limit "See more" and reply controls inside the scope nodes (the whole page
+# without one). A clicked control is marked with its text and only clicked again once its
+# text changes ("View 5 more replies" -> "View 2 more replies"), so controls that stay on
+# the page cannot keep the expansion going forever.
+_EXPAND_ALL_JS = """
+var scope = arguments[0], seeMoreClass = arguments[1], replyPattern = new RegExp(arguments[2], 'i');
+var attr = arguments[3], replies = arguments[4], limit = arguments[5];
+var roots = scope ? Array.prototype.slice.call(document.querySelectorAll(scope)) : [document];
+var clicked = {see_more: 0, replies: 0}, seen = new Set();
+function click(node, kind, text) {
+    if (clicked.see_more + clicked.replies >= limit || seen.has(node) || node.getAttribute(attr) === text) return;
+    seen.add(node);
+    node.setAttribute(attr, text);
+    try { node.click(); clicked[kind]++; } catch (e) {}
+}
+roots.forEach(function (root) {
+    root.querySelectorAll('.' + seeMoreClass).forEach(function (button) { click(button, 'see_more', 'see more'); });
+    if (!replies) return;
+    root.querySelectorAll('[role="button"]').forEach(function (button) {
+        var text = (button.innerText || button.textContent || '').trim();
+        if (text.length < 80 && replyPattern.test(text)) click(button, 'replies', text);
+    });
+});
+return clicked;
+"""
+
+
+@timed()
+def expand_comments(driver, scope=None, replies=True, batch_size=100, idle=EXPAND_IDLE_SECONDS, max_rounds=30):
+    """
+    Expands truncated comments ("See more") and opens reply threads in
+    rounds of one injected script each, instead of one WebDriver click per
+    control.
+
+    After every round the page is given time to settle (see
+    wait_for_dom_settle), which also lets opened threads render their own
+    "See more" and "View more replies" controls for the next round. Stops as
+    soon as a round finds nothing left to click.
+
+    Args:
+        driver: The Selenium WebDriver instance, on a post page.
+        scope: An optional CSS selector; only controls inside matching nodes
+            are clicked (e.g. the comments not harvested yet).
+        replies: Also open reply threads.
+        batch_size: The maximum number of clicks per round.
+        idle: Seconds without DOM changes that end the wait after a round.
+        max_rounds: Upper bound on the number of rounds.
+
+    Returns:
+        A dict with the number of see_more and replies controls clicked and
+        the number of rounds.
+    """
+    totals = {"see_more": 0, "replies": 0, "rounds": 0}
+    for _ in range(max_rounds):
+        with PROFILER.span("expand_round") as counts:
+            clicked = driver.execute_script(_EXPAND_ALL_JS, scope, SEE_MORE_CLASS, REPLY_BUTTON_PATTERN,
+                                            EXPANDED_ATTR, replies, batch_size) or {}
+            counts.update(clicked)
+            if not clicked.get("see_more") and not clicked.get("replies"):
+                break
+            totals["rounds"] += 1
+            totals["see_more"] += clicked.get("see_more", 0)
+            totals["replies"] += clicked.get("replies", 0)
+            wait_for_dom_settle(driver, idle=idle)
+    return totals
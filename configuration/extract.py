@@ -0,0 +1,420 @@
+from bs4 import BeautifulSoup, NavigableString, Comment
+from configuration.profiling import timed
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+# Class substrings matched the same way as the XPath contains(@class, ...) queries in utils
+CAPTION_CLASSES = ("xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs x126k92a",
+                   "x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s x126k92a")
+CAPTION_TITLE_CLASS = "xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs"
+CAPTION_SPE_CLASS = "x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s"
+COMMENT_CLASSES = ("x1n2onr6 x1ye3gou x1iorvi4 x78zum5 x1q0g3np x1a2a7pz",
+                   "x1n2onr6 xurb0ha x1iorvi4 x78zum5 x1q0g3np x1a2a7pz")
+COMMENT_SELECTOR = ", ".join(f'div[class*="{c}"]' for c in COMMENT_CLASSES)
+COMMENT_TEXT_CLASS = "xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs"
+IMAGE_CONTAINER_CLASSES = ("x10l6tqk x13vifvy", "xz74otr x1gqwnh9 x1snlj24")
+VIDEO_CONTAINER_CLASS = "inline-video-container"
+
+BLOCK_TAGS = {"div", "p", "li", "ul", "ol", "br", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+@timed()
+def get_page_html(driver, root_selector=None):
+    """
+    Takes a single snapshot of the rendered page.
+
+    Args:
+        driver: The Selenium WebDriver instance.
+        root_selector: An optional CSS selector; when given, only that subtree
+            is returned (falling back to the whole document if it is missing).
+
+    Returns:
+        The HTML of the page (or subtree) as a string.
+    """
+    if root_selector is None:
+        return driver.page_source
+    return driver.execute_script(
+        "var el = document.querySelector(arguments[0]);"
+        "return (el || document.documentElement).outerHTML;", root_selector)
+
+
+def make_soup(html, parser=None):
+    '''Parse HTML with the fastest available parser backend'''
+
+    return BeautifulSoup(html, parser or HTML_PARSER)
+
+
+def get_post_type(url):
+    """
+    Returns the post type of a Facebook URL, matching the branches in crawl.
+
+    Args:
+        url: The Facebook post URL.
+
+    Returns:
+        "posts", "videos", "reel", or None.
+    """
+    for post_type in ("posts", "videos", "reel"):
+        if post_type in url:
+            return post_type
+    return None
+
+
+def _class_contains(*substrings):
+    '''Predicate equivalent to contains(@class, s1) or contains(@class, s2) ...'''
+
+    def match(tag):
+        classes = tag.get("class")
+        if not classes:
+            return False
+        class_attr = " ".join(classes)
+        return any(s in class_attr for s in substrings)
+    return match
+
+
+def _find_all(root, name, *class_substrings):
+    predicate = _class_contains(*class_substrings)
+    return root.find_all(lambda tag: tag.name == name and predicate(tag))
+
+
+def _find(root, name, *class_substrings):
+    predicate = _class_contains(*class_substrings)
+    return root.find(lambda tag: tag.name == name and predicate(tag))
+
+
+def _inline_text_with_emojis(element):
+    '''Join the text pieces and emoji alt texts of an element with spaces'''
+
+    result = []
+    for child in element.descendants:
+        if child.name == 'img' and 'alt' in child.attrs:
+            result.append(child['alt'])  # Extract emoji from 'alt' attribute
+        elif child.name is None and not isinstance(child, Comment):  # This is text
+            text = child.strip()
+            if text:
+                result.append(text)
+    return ' '.join(result)
+
+
+def _text_with_emojis(element):
+    """
+    Walks the dir="auto" divs of a caption element, keeping emoji alt text,
+    the same way get_captions_emojis does.
+    """
+    divs = element.find_all("div", dir="auto")
+    if element.name == "div" and element.get("dir") == "auto":
+        divs.insert(0, element)
+    return [_inline_text_with_emojis(div) for div in divs]
+
+
+def _rendered_text(element):
+    """
+    Approximates WebElement.text: inline text is joined, block elements and
+    <br> start new lines, and blank lines are dropped.
+    """
+    parts = []
+    for child in element.descendants:
+        if isinstance(child, NavigableString):
+            if not isinstance(child, Comment):
+                parts.append(str(child))
+        elif child.name in BLOCK_TAGS:
+            parts.append("\n")
+    lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def _as_soup(html_or_soup):
+    if isinstance(html_or_soup, str):
+        return make_soup(html_or_soup)
+    return html_or_soup
+
+
+@timed()
+def extract_captions_emojis(html):
+    """
+    Offline equivalent of get_captions_emojis.
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of caption lines with emojis kept.
+    """
+    soup = _as_soup(html)
+    captions = []
+    for element in _find_all(soup, "div", *CAPTION_CLASSES):
+        captions.extend(_text_with_emojis(element))
+    return captions
+
+
+@timed()
+def extract_captions_spe(html):
+    """
+    Offline equivalent of get_captions_spe (video posts).
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of caption lines with emojis kept.
+    """
+    soup = _as_soup(html)
+    captions = []
+
+    caption_title = _find(soup, "div", CAPTION_TITLE_CLASS)
+    if caption_title is not None:
+        captions.extend(_text_with_emojis(caption_title))
+
+    for element in _find_all(soup, "div", CAPTION_SPE_CLASS):
+        captions.extend(_text_with_emojis(element))
+
+    return captions
+
+
+@timed()
+def extract_captions_reel(html):
+    """
+    Offline equivalent of get_captions_reel. The caller is expected to have
+    clicked "See more" before taking the snapshot.
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of caption texts.
+    """
+    soup = _as_soup(html)
+    captions = []
+
+    elements = [_find(soup, "div", CAPTION_CLASSES[0])] + _find_all(soup, "div", CAPTION_CLASSES[1])
+    for element in elements:
+        if element is None:
+            continue
+        caption_text = element.get_text(separator=" ").strip()
+
+        # Remove "See less" if present
+        if "See less" in caption_text:
+            caption_text = caption_text.replace("See less", "").strip()
+
+        captions.append(caption_text)
+
+    return captions
+
+
+@timed()
+def extract_comments(html):
+    """
+    Offline equivalent of the text extraction step of get_comments.
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of comments.
+    """
+    soup = _as_soup(html)
+    comments_list = []
+    for comment in _find_all(soup, "div", *COMMENT_CLASSES):
+        text_ele = _find(comment, "div", COMMENT_TEXT_CLASS)
+        if text_ele is not None:
+            comments_list.append(_rendered_text(text_ele))
+    return comments_list
+
+
+@timed()
+def extract_image_urls(html):
+    """
+    Offline equivalent of get_image_urls.
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of image URLs found in the post.
+    """
+    soup = _as_soup(html)
+    image_urls = []
+    for container in _find_all(soup, "div", *IMAGE_CONTAINER_CLASSES):
+        for img in container.find_all("img", recursive=False):
+            image_urls.append(img.get("src"))
+    return image_urls
+
+
+@timed()
+def extract_video_urls(html):
+    """
+    Offline equivalent of the <video src> lookup in get_video_urls.
+
+    Args:
+        html: The page HTML (or an already parsed soup).
+
+    Returns:
+        A list of video URLs.
+    """
+    soup = _as_soup(html)
+    video_urls = []
+    for container in _find_all(soup, "div", VIDEO_CONTAINER_CLASS):
+        for video in container.find_all("video", recursive=False):
+            video_urls.append(video.get("src"))
+    return video_urls
+
+
+CAPTION_EXTRACTORS = {
+    "posts": extract_captions_emojis,
+    "videos": extract_captions_spe,
+    "reel": extract_captions_reel,
+}
+
+
+@timed()
+def extract_post(html, post_type, parser=None):
+    """
+    Extracts everything the crawler saves for a post from one HTML snapshot.
+
+    Args:
+        html: The page HTML.
+        post_type: "posts", "videos" or "reel" (see get_post_type).
+        parser: The BeautifulSoup parser backend (HTML_PARSER by default).
+
+    Returns:
+        A dict with captions, comments, image_urls and video_urls.
+    """
+    soup = make_soup(html, parser)
+    return {
+        "captions": CAPTION_EXTRACTORS.get(post_type, extract_captions_emojis)(soup),
+        "comments": extract_comments(soup),
+        "image_urls": extract_image_urls(soup) if post_type == "posts" else [],
+        "video_urls": extract_video_urls(soup),
+    }
+
+
+# Where each field lives, per post type. Caption rules run in order; "first" keeps only the
+# first match (like find_element), "mode" is "emoji" (dir="auto" lines with emoji alt text,
+# as get_captions_emojis) or "text" (plain text without "See less", as get_captions_reel).
+SELECTOR_REGISTRY = {
+    "posts": {
+        "captions": [{"classes": list(CAPTION_CLASSES), "first": False, "mode": "emoji"}],
+        "image_containers": list(IMAGE_CONTAINER_CLASSES),
+    },
+    "videos": {
+        "captions": [{"classes": [CAPTION_TITLE_CLASS], "first": True, "mode": "emoji"},
+                     {"classes": [CAPTION_SPE_CLASS], "first": False, "mode": "emoji"}],
+        "image_containers": [],
+    },
+    "reel": {
+        "captions": [{"classes": [CAPTION_CLASSES[0]], "first": True, "mode": "text"},
+                     {"classes": [CAPTION_CLASSES[1]], "first": False, "mode": "text"}],
+        "image_containers": [],
+    },
+}
+SELECTOR_REGISTRY["default"] = SELECTOR_REGISTRY["posts"]
+
+COMMON_SELECTORS = {
+    "comments": list(COMMENT_CLASSES),
+    "comment_text": COMMENT_TEXT_CLASS,
+    "video_containers": [VIDEO_CONTAINER_CLASS],
+}
+
+POST_FIELDS = ("captions", "comments", "image_urls", "video_urls")
+
+# Runs in the page and returns every requested field in one JSON payload
+_EXTRACT_POST_JS = r"""
+var rules = arguments[0], fields = arguments[1];
+var want = function (f) { return fields.indexOf(f) >= 0; };
+var anyClass = function (tag, classes) {
+    return classes.map(function (c) { return tag + '[class*="' + c + '"]'; }).join(', ');
+};
+var emojiLines = function (el) {
+    var divs = Array.prototype.slice.call(el.querySelectorAll('div[dir="auto"]'));
+    if (el.matches('div[dir="auto"]')) divs.unshift(el);
+    return divs.map(function (div) {
+        var parts = [];
+        var walker = document.createTreeWalker(div, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) {
+            var node = walker.currentNode;
+            if (node.nodeType === 3) {
+                var text = node.nodeValue.trim();
+                if (text) parts.push(text);
+            } else if (node.tagName === 'IMG' && node.hasAttribute('alt')) {
+                parts.push(node.getAttribute('alt'));
+            }
+        }
+        return parts.join(' ');
+    });
+};
+var plainText = function (el) {
+    var parts = [];
+    var walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+    while (walker.nextNode()) parts.push(walker.currentNode.nodeValue);
+    var text = parts.join(' ').trim();
+    if (text.indexOf('See less') >= 0) text = text.split('See less').join('').trim();
+    return [text];
+};
+var result = {};
+if (want('captions')) {
+    result.captions = [];
+    rules.captions.forEach(function (rule) {
+        var selector = anyClass('div', rule.classes);
+        var elements = rule.first ? [document.querySelector(selector)] : document.querySelectorAll(selector);
+        Array.prototype.forEach.call(elements, function (el) {
+            if (el) result.captions.push.apply(result.captions, rule.mode === 'text' ? plainText(el) : emojiLines(el));
+        });
+    });
+}
+if (want('comments')) {
+    result.comments = [];
+    document.querySelectorAll(anyClass('div', rules.comments)).forEach(function (comment) {
+        var text = comment.querySelector('div[class*="' + rules.comment_text + '"]');
+        if (text) result.comments.push(text.innerText);
+    });
+}
+if (want('image_urls')) {
+    result.image_urls = [];
+    if (rules.image_containers.length) {
+        document.querySelectorAll(anyClass('div', rules.image_containers)).forEach(function (div) {
+            Array.prototype.forEach.call(div.children, function (c) {
+                if (c.tagName === 'IMG') result.image_urls.push(c.src);
+            });
+        });
+    }
+}
+if (want('video_urls')) {
+    result.video_urls = [];
+    document.querySelectorAll(anyClass('div', rules.video_containers)).forEach(function (div) {
+        Array.prototype.forEach.call(div.children, function (c) {
+            if (c.tagName === 'VIDEO') result.video_urls.push(c.src);
+        });
+    });
+}
+return result;
+"""
+
+
+def post_selectors(post_type):
+    '''Return the selector rules of a post type (see SELECTOR_REGISTRY) merged with the common ones'''
+
+    return dict(COMMON_SELECTORS, **SELECTOR_REGISTRY.get(post_type, SELECTOR_REGISTRY["default"]))
+
+
+@timed()
+def extract_post_live(driver, post_type, fields=POST_FIELDS):
+    """
+    Extracts a post from the live page with one injected script instead of
+    one WebDriver query per element.
+
+    Args:
+        driver: The Selenium WebDriver instance.
+        post_type: "posts", "videos" or "reel" (see get_post_type).
+        fields: The fields to extract, a subset of POST_FIELDS.
+
+    Returns:
+        A dict with the requested fields, each a list of strings: captions
+        (emoji alt text kept), comments, image_urls and video_urls.
+    """
+    result = driver.execute_script(_EXTRACT_POST_JS, post_selectors(post_type), list(fields))
+    return {field: result.get(field) or [] for field in fields}
@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta, date
+from configuration.waits import wait_for_dom_settle
+from configuration.scheduler import navigate
+import re
+
+try:
+    import keyboard
+except ImportError:  # keyboard needs root on Linux; the collector also stops on its own
+    keyboard = None
+
+
+POST_LINK_SELECTOR = "a[href*='/posts/'], a[href*='/videos/'], a[href*='/reel/']"
+
+# Installed once per page: keeps a Set of seen post IDs and queues only new anchors
+_COLLECTOR_JS = r"""
+if (window.__postLinks) return window.__postLinks.seen.size;
+var state = window.__postLinks = {seen: new Set(), pending: []};
+var selector = arguments[0];
+var idPattern = /(?:reel\/|posts\/|videos\/|pfbid)([\w\d]+)/;
+var record = function (a) {
+    var href = a.href;
+    if (!href || href.indexOf('#') === href.length - 1) return;
+    var match = href.match(idPattern);
+    var key = match ? match[1] : href;
+    if (state.seen.has(key)) return;
+    state.seen.add(key);
+    state.pending.push({href: href, label: a.getAttribute('aria-label') || a.textContent || ''});
+};
+var scan = function (node) {
+    if (node.nodeType !== 1) return;
+    if (node.matches(selector)) record(node);
+    node.querySelectorAll(selector).forEach(record);
+};
+scan(document.body);
+new MutationObserver(function (mutations) {
+    mutations.forEach(function (m) {
+        if (m.type === 'attributes') { if (m.target.matches(selector)) record(m.target); }
+        else m.addedNodes.forEach(scan);
+    });
+}).observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['href']});
+return state.seen.size;
+"""
+
+# Hands back the links found since the last call, then scrolls to load more
+_DRAIN_AND_SCROLL_JS = r"""
+var state = window.__postLinks;
+if (!state) return null;
+var batch = state.pending;
+state.pending = [];
+window.scrollTo(0, document.body.scrollHeight);
+return batch;
+"""
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+
+def _month(name):
+    name = name.lower()
+    for i, month in enumerate(MONTHS):
+        if len(name) >= 3 and month.startswith(name):
+            return i + 1
+    return None
+
+
+def parse_feed_date(label, now=None):
+    """
+    Parses the timestamp text Facebook shows on a feed post link.
+
+    Handles relative forms ("5h", "3 days ago", "Yesterday at 10:00") and
+    absolute forms ("March 3", "March 3, 2021", "3 March 2021").
+
+    Args:
+        label: The aria-label or text of the post link.
+        now: The reference time (defaults to datetime.now()).
+
+    Returns:
+        A datetime, or None if the label is not a date.
+    """
+    if not label:
+        return None
+    now = now or datetime.now()
+    text = label.strip().lower()
+
+    if text.startswith("just now"):
+        return now
+    if text.startswith("yesterday"):
+        return now - timedelta(days=1)
+
+    match = re.match(r"^(\d+)\s*(m|mins?|minutes?|h|hrs?|hours?|d|days?|w|wks?|weeks?|y|yrs?|years?)\b", text)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)[0]
+        if unit == "m":
+            return now - timedelta(minutes=n)
+        if unit == "h":
+            return now - timedelta(hours=n)
+        if unit == "d":
+            return now - timedelta(days=n)
+        if unit == "w":
+            return now - timedelta(weeks=n)
+        return now - timedelta(days=365 * n)
+
+    match = (re.match(r"^([a-z]+)\s+(\d{1,2})(?:,?\s+(\d{4}))?\b", text)
+             or re.match(r"^(\d{1,2})\s+([a-z]+)(?:,?\s+(\d{4}))?\b", text))
+    if match:
+        first, second, year = match.groups()
+        month_name, day = (first, second) if first.isalpha() else (second, first)
+        month = _month(month_name)
+        if month is None:
+            return None
+        try:
+            parsed = datetime(int(year) if year else now.year, month, int(day))
+        except ValueError:
+            return None
+        # Dates without a year are in the past twelve months
+        if not year and parsed > now:
+            parsed = parsed.replace(year=now.year - 1)
+        return parsed
+
+    return None
+
+
+def _stop_key_pressed():
+    try:
+        return keyboard is not None and keyboard.is_pressed("enter")
+    except Exception:
+        return False
+
+
+def collect_post_links(driver, fanpage_url, max_posts=None, until_date=None, max_idle_scrolls=5,
+                       stop=None, old_run=3):
+    """
+    Scrolls a fanpage feed and collects post links incrementally.
+
+    An injected MutationObserver records each new post anchor once (keyed by
+    post ID) and the links are pulled back in batches, so the cost of each
+    scroll does not grow with the length of the feed. Collection ends on its
+    own when a limit is hit; pressing Enter still stops it when the keyboard
+    module is usable.
+
+    Args:
+        driver: The Selenium WebDriver instance.
+        fanpage_url: The URL of the Facebook fanpage.
+        max_posts: Stop after this many post links.
+        until_date: Stop once old_run consecutive posts are older than this
+            date (pinned posts may be older than the ones below them).
+        max_idle_scrolls: Stop after this many scrolls without new links.
+        stop: Optional callable taking a post URL; collection stops as soon
+            as it returns True (the URL it was called with is not kept).
+        old_run: See until_date.
+
+    Returns:
+        A list of post URLs in feed order.
+    """
+    if isinstance(until_date, date) and not isinstance(until_date, datetime):
+        until_date = datetime(until_date.year, until_date.month, until_date.day)
+
+    post_urls = []
+    navigate(driver, fanpage_url)
+    wait_for_dom_settle(driver, idle=1, timeout=5)
+    driver.execute_script(_COLLECTOR_JS, POST_LINK_SELECTOR)
+
+    idle_scrolls = 0
+    old_posts = 0
+    while True:
+        if _stop_key_pressed():
+            print("Stopping the scrolling.")
+            break
+
+        batch = driver.execute_script(_DRAIN_AND_SCROLL_JS)
+        if batch is None:  # The page was reloaded, install the collector again
+            driver.execute_script(_COLLECTOR_JS, POST_LINK_SELECTOR)
+            continue
+
+        if not batch:
+            idle_scrolls += 1
+            if idle_scrolls >= max_idle_scrolls:
+                print(f"No new posts after {max_idle_scrolls} scrolls.")
+                break
+        else:
+            idle_scrolls = 0
+
+        for item in batch:
+            url = item["href"]
+            if stop is not None and stop(url):
+                return post_urls
+
+            if until_date is not None:
+                posted = parse_feed_date(item.get("label"))
+                if posted is not None and posted < until_date:
+                    old_posts += 1
+                    if old_posts >= old_run:
+                        print(f"Reached posts older than {until_date:%Y-%m-%d}.")
+                        return post_urls
+                    continue
+                if posted is not None:
+                    old_posts = 0
+
+            post_urls.append(url)
+            if max_posts is not None and len(post_urls) >= max_posts:
+                return post_urls
+
+        # Wait for the next page of the feed instead of a fixed sleep
+        wait_for_dom_settle(driver, idle=0.5, timeout=5)
+
+    return post_urls
@@ -0,0 +1,95 @@
+from configuration.extract import COMMENT_CLASSES, COMMENT_TEXT_CLASS
+from configuration.waits import wait_for_dom_settle, DOM_IDLE_SECONDS
+from configuration.expand import expand_comments
+from configuration.profiling import PROFILER, timed
+
+
+HARVESTED_ATTR = "data-harvested"
+# Comment nodes that have not been extracted yet
+PENDING_COMMENT_SELECTOR = ", ".join(f'div[class*="{c}"]:not([{HARVESTED_ATTR}])' for c in COMMENT_CLASSES)
+
+# Extracts the new comments, marks them, and removes all but the last one from the DOM
+_HARVEST_JS = """
+var pending = arguments[0], textClass = arguments[1], attr = arguments[2], prune = arguments[3];
+var comments = [], nodes = Array.prototype.slice.call(document.querySelectorAll(pending));
+nodes.forEach(function (comment) {
+    var text = comment.querySelector('div[class*="' + textClass + '"]');
+    if (text) comments.push(text.innerText);
+    comment.setAttribute(attr, '1');
+});
+if (prune) {
+    // Keep the newest harvested comment: it anchors the scroll that loads the next batch
+    var done = document.querySelectorAll('[' + attr + ']');
+    for (var i = 0; i < done.length - 1; i++) {
+        try { done[i].remove(); } catch (e) {}
+    }
+}
+return comments;
+"""
+
+# Asks for the next batch: scrolls past the last comment and clicks "View more comments" if shown
+_LOAD_MORE_JS = """
+var done = document.querySelectorAll('[' + arguments[0] + ']');
+if (done.length) done[done.length - 1].scrollIntoView(true);
+else window.scrollTo(0, document.body.scrollHeight);
+var button = document.evaluate("//span[contains(text(), 'View more comments')]", document, null,
+                               XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (button) { button.scrollIntoView(true); button.click(); }
+return !!button;
+"""
+
+
+@timed()
+def harvest_comments(driver, path=None, on_batch=None, prune=True, idle=DOM_IDLE_SECONDS, max_idle_rounds=2):
+    """
+    Loads a post's comments batch by batch, extracting each batch as soon as
+    it appears instead of after the whole thread is loaded.
+
+    Every batch is appended to path (flushed, so a crash keeps what was
+    harvested) and/or handed to on_batch. With prune, extracted comment
+    nodes are removed from the page, so the DOM, Chrome's memory and the
+    cost of each scroll stay flat however long the thread is.
+
+    Args:
+        driver: The Selenium WebDriver instance, on a post page.
+        path: An optional text file receiving one comment per line.
+        on_batch: An optional callable receiving each list of new comments.
+        prune: Remove harvested comment nodes from the DOM.
+        idle: Seconds without DOM changes after which a batch is considered loaded.
+        max_idle_rounds: Stop after this many rounds without new comments.
+
+    Returns:
+        The number of comments harvested.
+    """
+    out = open(path, "w", encoding="utf-8") if path is not None else None
+    total = 0
+    idle_rounds = 0
+    try:
+        while True:
+            with PROFILER.span("harvest_batch") as counts:
+                # Expand truncated comments and reply threads of this batch only, then take them out
+                expand_comments(driver, PENDING_COMMENT_SELECTOR, idle=0.25)
+                batch = driver.execute_script(_HARVEST_JS, PENDING_COMMENT_SELECTOR, COMMENT_TEXT_CLASS,
+                                              HARVESTED_ATTR, prune)
+                counts["items"] = len(batch)
+
+            if batch:
+                total += len(batch)
+                idle_rounds = 0
+                if out is not None:
+                    for comment in batch:
+                        out.write(comment + "\n")
+                    out.flush()
+                if on_batch is not None:
+                    on_batch(batch)
+            else:
+                idle_rounds += 1
+                if idle_rounds >= max_idle_rounds:
+                    break
+
+            driver.execute_script(_LOAD_MORE_JS, HARVESTED_ATTR)
+            wait_for_dom_settle(driver, PENDING_COMMENT_SELECTOR, 0, idle)
+    finally:
+        if out is not None:
+            out.close()
+    return total
@@ -0,0 +1,181 @@
+from configuration.downloader import make_session, DEFAULT_TIMEOUT
+from configuration.extract import make_soup, _inline_text_with_emojis, _rendered_text
+from configuration.scheduler import SCHEDULER, browser_account, looks_blocked
+from configuration.profiling import PROFILER, timed
+from urllib.parse import urlsplit, urlunsplit, urljoin
+from time import monotonic
+import requests
+import pickle
+
+
+BASIC_HOST = "mbasic.facebook.com"
+# "View more comments" pages followed per post
+MAX_COMMENT_PAGES = 100
+
+# The basic view is only served to old mobile browsers
+BASIC_USER_AGENT = ("Mozilla/5.0 (Linux; Android 8.1.0; Nokia 2) AppleWebKit/537.36 (KHTML, like Gecko) "
+                    "Chrome/68.0.3440.91 Mobile Safari/537.36")
+
+# Where each field lives on the server-rendered basic view of a post (CSS selectors)
+BASIC_SELECTORS = {
+    "root": "#m_story_permalink_view, #MPhotoContent, #objects_container",
+    "captions": 'div[data-ft*=\'"tn":"*s"\'] p',
+    "comments": 'div[id^="ufi_"] h3 + div',
+    "images": 'a[href*="/photo.php"] img, a[href*="/photos/"] img',
+    "next_comments": 'div[id^="see_next_"] a',
+}
+
+
+def load_cookie_jar(cookies_path):
+    """
+    Converts the cookies saved by save_cookies.py (Selenium cookie dicts)
+    into a cookie jar for requests.
+
+    Args:
+        cookies_path: Path to the file containing saved cookies.
+
+    Returns:
+        A requests.cookies.RequestsCookieJar.
+    """
+    with open(cookies_path, "rb") as f:
+        cookies = pickle.load(f)
+    jar = requests.cookies.RequestsCookieJar()
+    for cookie in cookies:
+        jar.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False), expires=cookie.get("expiry"))
+    return jar
+
+
+def make_cookie_session(cookies_path, pool_size=8):
+    """
+    Returns a pooled HTTP session logged in with the saved cookies, for
+    fetching posts without a browser.
+
+    Args:
+        cookies_path: Path to the file containing saved cookies.
+        pool_size: The maximum number of connections kept per host.
+
+    Returns:
+        A requests.Session, or None if the cookies could not be loaded.
+    """
+    try:
+        jar = load_cookie_jar(cookies_path)
+    except (OSError, pickle.UnpicklingError, KeyError) as e:
+        print(f"Error loading cookies for HTTP fetching: {e}")
+        return None
+    session = make_session(pool_size=pool_size)
+    session.cookies.update(jar)
+    session.headers["User-Agent"] = BASIC_USER_AGENT
+    session.headers["Accept-Language"] = "en-US,en;q=0.9"
+    # Requests share the pacing of the account's browsers (see RateScheduler)
+    session.account = cookies_path
+    return session
+
+
+def basic_url(url, host=BASIC_HOST):
+    '''Point a Facebook URL at the basic view (host=None keeps the URL as it is)'''
+
+    if host is None:
+        return url
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme or "https", host, parts.path, parts.query, parts.fragment))
+
+
+def fetch_html(session, url, timeout=DEFAULT_TIMEOUT, scheduler=None):
+    """
+    GETs a page with the session, paced by the rate scheduler like a
+    browser navigation.
+
+    Args:
+        session: A session from make_cookie_session.
+        url: The URL to fetch.
+        timeout: The (connect, read) timeout in seconds.
+        scheduler: The RateScheduler to use (SCHEDULER by default).
+
+    Returns:
+        A tuple (HTML, final URL), or None on a login wall, checkpoint or
+        HTTP error.
+    """
+    scheduler = scheduler or SCHEDULER
+    account = browser_account(session)
+    scheduler.wait(account)
+    start = monotonic()
+    try:
+        with PROFILER.span("http_fetch") as counts:
+            response = session.get(url, timeout=timeout)
+            counts["bytes"] = len(response.content)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching {url}: {e}")
+        return None
+    blocked = looks_blocked(response.url) and not looks_blocked(url)
+    scheduler.record_load(account, monotonic() - start, blocked)
+    if blocked or not response.ok:
+        return None
+    return response.text, response.url
+
+
+@timed()
+def extract_basic_post(html, base_url=""):
+    """
+    Extracts a post from the basic view. Pure function of the HTML, so it
+    can run anywhere (see BASIC_SELECTORS for where the fields are read).
+
+    Args:
+        html: The HTML of a basic view page.
+        base_url: The page URL, to resolve relative links against.
+
+    Returns:
+        A dict with captions, comments, image_urls and video_urls (always
+        empty: videos need the browser), like extract_post, plus
+        next_comments, the URL of the next page of comments or None.
+    """
+    soup = make_soup(html)
+    root = soup.select_one(BASIC_SELECTORS["root"]) or soup
+    next_link = root.select_one(BASIC_SELECTORS["next_comments"])
+    return {
+        "captions": [text for text in (_inline_text_with_emojis(p) for p in root.select(BASIC_SELECTORS["captions"]))
+                     if text],
+        "comments": [_rendered_text(div) for div in root.select(BASIC_SELECTORS["comments"])],
+        "image_urls": [urljoin(base_url, img["src"]) for img in root.select(BASIC_SELECTORS["images"])
+                       if img.get("src")],
+        "video_urls": [],
+        "next_comments": urljoin(base_url, next_link["href"]) if next_link is not None and next_link.get("href")
+        else None,
+    }
+
+
+@timed()
+def fetch_post_http(session, url, host=BASIC_HOST, max_comment_pages=MAX_COMMENT_PAGES):
+    """
+    Fetches a post and all its comment pages from the basic view, without a
+    browser.
+
+    Args:
+        session: A session from make_cookie_session.
+        url: The post URL.
+        host: The host serving the basic view (None to fetch url as is).
+        max_comment_pages: Stop following "View more comments" after this many
+            pages (None for no limit).
+
+    Returns:
+        A dict like extract_post's (captions, comments, image_urls,
+        video_urls) plus comments_complete, False when the comment pages
+        were cut short, or None if the page could not be fetched.
+    """
+    page = fetch_html(session, basic_url(url, host))
+    if page is None:
+        return None
+    post = extract_basic_post(*page)
+
+    pages = 1
+    next_url = post.pop("next_comments")
+    while next_url is not None and (max_comment_pages is None or pages < max_comment_pages):
+        page = fetch_html(session, next_url)
+        if page is None:
+            break
+        more = extract_basic_post(*page)
+        post["comments"].extend(more["comments"])
+        next_url = more["next_comments"]
+        pages += 1
+    post["comments_complete"] = next_url is None
+    return post
@@ -0,0 +1,208 @@
+from time import time
+import threading
+import sqlite3
+import json
+import os
+
+
+MODES = ("full", "incremental")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page_link TEXT NOT NULL,
+    page_name TEXT NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'full',
+    options TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, id);
+"""
+
+
+class JobQueue:
+    """
+    Persistent SQLite queue of (page, mode) crawl jobs shared by worker
+    processes.
+
+    A worker claims a job with a lease and renews it while it runs. Jobs
+    whose lease expires (the worker died or hung) are handed to the next
+    worker that asks, until max_attempts is reached. Each process opens its
+    own JobQueue; claims are atomic across processes.
+
+    Args:
+        path: The database file.
+        wal: Use WAL mode, which lets workers read while one writes. WAL
+            needs shared memory, so for a database on a network share used
+            by several hosts pass wal=False (rollback journal).
+    """
+
+    def __init__(self, path, wal=True):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode, so claims can take the write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=" + ("WAL" if wal else "DELETE"))
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, page_link, page_name, mode="full", priority=0, max_attempts=3, **options):
+        """
+        Queues a crawl of a page, unless the same page and mode is already
+        pending or running.
+
+        Args:
+            page_link: The URL of the Facebook fanpage.
+            page_name: The name of the page folder under data/.
+            mode: "full" or "incremental".
+            priority: Higher priorities are claimed first.
+            max_attempts: How many times the job is tried before it fails.
+            options: Extra keyword arguments for crawl(), stored as JSON.
+
+        Returns:
+            The job ID (of the existing job if it was already queued).
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT id FROM jobs WHERE page_name = ? AND mode = ? "
+                                         "AND status IN ('pending', 'running')", (page_name, mode)).fetchone()
+                if row is not None:
+                    job_id = row["id"]
+                else:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (page_link, page_name, mode, options, priority, max_attempts, created_at, "
+                        "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (page_link, page_name, mode, json.dumps(options), priority, max_attempts, now, now)).lastrowid
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self, worker, lease_seconds=1800):
+        """
+        Takes the next job: the highest-priority pending job, or a running
+        job whose lease has expired.
+
+        Args:
+            worker: An ID of the claiming worker, e.g. "host:pid".
+            lease_seconds: How long the job stays reserved without renew().
+
+        Returns:
+            The job as a dict (options decoded), or None if there is no work.
+        """
+        now = time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their attempts fail instead of looping forever
+                self._conn.execute("UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+                                   "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                                   (now, now))
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY priority DESC, id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                                       "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                                       (worker, now + lease_seconds, now, row["id"]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["attempts"] += 1
+        job["worker"] = worker
+        return job
+
+    def renew(self, job_id, worker, lease_seconds=1800):
+        """
+        Extends the lease of a running job.
+
+        Returns:
+            False if the worker no longer holds the job (its lease expired and
+            another worker claimed it).
+        """
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET lease_until = ?, updated_at = ? "
+                                        "WHERE id = ? AND worker = ? AND status = 'running'",
+                                        (time() + lease_seconds, time(), job_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker):
+        '''Mark a job done; returns False if the worker no longer held it'''
+
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, "
+                                        "updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                        (time(), job_id, worker))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """
+        Records a failed attempt. The job goes back to pending until it has
+        used max_attempts, then it is marked failed.
+
+        Returns:
+            False if the worker no longer held the job.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                "lease_until = NULL, error = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (str(error), time(), job_id, worker))
+            return cursor.rowcount == 1
+
+    def retry_failed(self):
+        '''Put failed jobs back in the queue with fresh attempts; returns how many'''
+
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, updated_at = ? "
+                                        "WHERE status = 'failed'", (time(),))
+            return cursor.rowcount
+
+    def jobs(self, status=None):
+        '''Return the jobs (optionally of one status) as dicts, in claim order'''
+
+        sql = "SELECT * FROM jobs"
+        params = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            params = (status,)
+        return [dict(row) for row in self._execute(sql + " ORDER BY priority DESC, id", params)]
+
+    def summary(self):
+        """
+        Counts jobs per status.
+
+        Returns:
+            A dict like {"pending": 10, "running": 2, "done": 30}.
+        """
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,192 @@
+from configuration.profiling import PROFILER
+from time import sleep
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+RECYCLE_AFTER_POSTS = 300
+MAX_BROWSER_MB = 2048
+
+
+def browser_rss_mb(browser):
+    """
+    Measures the resident memory of a browser: chromedriver, Chrome and
+    every renderer/GPU process it started.
+
+    Returns:
+        The total in MB, or None if psutil is not installed or the processes
+        cannot be read.
+    """
+    if psutil is None:
+        return None
+    try:
+        root = psutil.Process(browser.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return None
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            pass  # Renderers come and go while we count
+    return total / 1e6
+
+
+def is_responsive(browser):
+    '''Return True if the browser still answers WebDriver commands'''
+
+    try:
+        browser.current_url
+        return True
+    except Exception:
+        return False
+
+
+class BrowserLifecycle:
+    """
+    Owns one logged-in browser for a long crawl and replaces it before it
+    degrades.
+
+    Chrome's memory grows with every heavy page it renders, and page loads
+    slow down with it. The browser is quit and a fresh one started (through
+    start, which logs in again from the cookies or the persistent profile)
+    after max_posts posts, when its processes use more than max_rss_mb, when
+    its navigations become slowdown times slower than right after it
+    started, or when it stops responding. Callers read the current browser
+    from the browser attribute before every post.
+
+    Args:
+        start: A callable returning a new logged-in WebDriver, or None on failure.
+        stop: A callable disposing of a browser; browser.quit() by default.
+        name: A label for log messages, e.g. "desktop".
+        max_posts: Recycle after this many posts (None for no limit).
+        max_rss_mb: Recycle above this memory use (None for no limit;
+            needs psutil).
+        slowdown: Recycle when the average navigation of a window is this
+            many times the first window's (None to ignore latency).
+        window: Navigations per latency window.
+        check_every: Posts between memory checks.
+        start_attempts: Tries to start a browser before giving up.
+    """
+
+    def __init__(self, start, stop=None, name="browser", max_posts=RECYCLE_AFTER_POSTS, max_rss_mb=MAX_BROWSER_MB,
+                 slowdown=2.0, window=20, check_every=10, start_attempts=3):
+        self._start = start
+        self._stop = stop or (lambda browser: browser.quit())
+        self.name = name
+        self.max_posts = max_posts
+        self.max_rss_mb = max_rss_mb
+        self.slowdown = slowdown
+        self.window = window
+        self.check_every = check_every
+        self.start_attempts = start_attempts
+        self.recycles = {}  # reason -> count
+        self.peak_rss_mb = 0.0
+        self.browser = None
+        self._launch()
+
+    def _launch(self):
+        browser = None
+        for attempt in range(self.start_attempts):
+            if attempt:
+                sleep(5 * attempt)
+            try:
+                browser = self._start()
+            except Exception as e:
+                print(f"Could not start the {self.name} browser: {e}")
+            if browser is not None:
+                break
+        self.browser = browser
+        self.posts = 0
+        self._baseline = None  # Average navigation seconds of the first window
+        self._mark = self._navigation_totals()
+
+    def _dispose(self, browser):
+        try:
+            self._stop(browser)
+        except Exception:
+            pass
+
+    def _navigation_totals(self):
+        '''Navigations and their total seconds so far, as counted by navigate()'''
+
+        return (getattr(self.browser, "navigations", 0), getattr(self.browser, "navigation_seconds", 0.0))
+
+    def _slowed_down(self):
+        count, seconds = self._navigation_totals()
+        if count - self._mark[0] < self.window:
+            return False
+        average = (seconds - self._mark[1]) / (count - self._mark[0])
+        self._mark = (count, seconds)
+        if self._baseline is None:
+            self._baseline = average
+            return False
+        # Sub-second loads are noise, not a browser worn out by memory pressure
+        return average > max(1.0, self._baseline * self.slowdown)
+
+    def recycle_reason(self, error=None):
+        """
+        Decides whether the browser should be replaced now.
+
+        Args:
+            error: The exception the last post failed with, if any.
+
+        Returns:
+            A short reason, or None to keep the browser.
+        """
+        if self.browser is None:
+            return "not started"
+        if error is not None and not is_responsive(self.browser):
+            return "unresponsive"
+        if self.max_posts is not None and self.posts >= self.max_posts:
+            return "post limit"
+        if self.max_rss_mb is not None and self.posts % self.check_every == 0:
+            rss = browser_rss_mb(self.browser)
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb, rss)
+                if rss > self.max_rss_mb:
+                    return "memory"
+        if self.slowdown is not None and self._slowed_down():
+            return "latency"
+        return None
+
+    def post_done(self, error=None):
+        """
+        Counts a finished post and recycles the browser if it is due.
+
+        Args:
+            error: The exception the post failed with, if any.
+
+        Returns:
+            True if the browser was replaced.
+        """
+        self.posts += 1
+        reason = self.recycle_reason(error)
+        if reason is None:
+            return False
+        self.recycle(reason)
+        return True
+
+    def recycle(self, reason="manual"):
+        '''Quit the current browser and start a logged-in one in its place'''
+
+        print(f"Restarting the {self.name} browser after {self.posts} posts ({reason}).")
+        with PROFILER.span("browser_recycle") as counts:
+            if self.browser is not None:
+                self._dispose(self.browser)
+            self._launch()
+            counts["started"] = int(self.browser is not None)
+        self.recycles[reason] = self.recycles.get(reason, 0) + 1
+        if self.browser is None:
+            print(f"Could not restart the {self.name} browser.")
+
+    def report(self):
+        '''Print how often the browser was recycled and why'''
+
+        if self.recycles or self.peak_rss_mb:
+            reasons = ", ".join(f"{n} {reason}" for reason, n in self.recycles.items()) or "none"
+            print(f"{self.name.capitalize()} browser restarts: {reasons}; peak memory {self.peak_rss_mb:.0f} MB")
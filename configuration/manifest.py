@@ -0,0 +1,185 @@
+from time import time
+import threading
+import sqlite3
+import os
+
+
+STAGES = ("caption", "comments", "media")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_name TEXT PRIMARY KEY,
+    page_link TEXT,
+    links_complete INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    page_name TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    post_type TEXT,
+    position INTEGER,
+    caption_status TEXT NOT NULL DEFAULT 'pending',
+    comments_status TEXT NOT NULL DEFAULT 'pending',
+    media_status TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    created_at REAL,
+    updated_at REAL,
+    PRIMARY KEY (page_name, post_id)
+);
+"""
+
+
+class Manifest:
+    """
+    Persistent SQLite record of a crawl, so an interrupted run can resume.
+
+    Stores the post list of each page and, for every post (keyed by
+    extract_facebook_post_id), the status of each stage in STAGES:
+    "pending", "done" or "failed". A page's post list is only reused while
+    the run that stored it is unfinished (see finish_post_list). Safe to
+    share between crawl threads.
+
+    Args:
+        path: The database file.
+        wal: Use WAL mode; pass False when data/ is on a network share used
+            by several hosts (see JobQueue).
+    """
+
+    def __init__(self, path, wal=True):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=" + ("WAL" if wal else "DELETE"))
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.fetchall()
+
+    def has_post_list(self, page_name):
+        '''Return True if a complete post list was stored for the page by a run that has not finished'''
+
+        rows = self._execute("SELECT links_complete FROM pages WHERE page_name = ?", (page_name,))
+        return bool(rows and rows[0]["links_complete"])
+
+    def save_post_urls(self, page_name, page_link, post_urls, post_id_func, post_type_func):
+        """
+        Stores the post list of a page. Posts already in the manifest keep
+        their stage statuses.
+
+        Args:
+            page_name: The name of the page folder under data/.
+            page_link: The URL of the Facebook fanpage.
+            post_urls: The post URLs returned by get_post_links.
+            post_id_func: Function mapping a URL to its post ID.
+            post_type_func: Function mapping a URL to its post type.
+        """
+        now = time()
+        with self._lock:
+            start = self._conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM posts WHERE page_name = ?",
+                                       (page_name,)).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO posts (page_name, post_id, url, post_type, position, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(page_name, post_id_func(url), url, post_type_func(url), start + i, now, now)
+                 for i, url in enumerate(post_urls) if post_id_func(url)])
+            self._conn.execute(
+                "INSERT INTO pages (page_name, page_link, links_complete, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(page_name) DO UPDATE SET page_link = excluded.page_link, links_complete = 1, "
+                "updated_at = excluded.updated_at",
+                (page_name, page_link, now))
+            self._conn.commit()
+
+    def finish_post_list(self, page_name):
+        '''Record that a run got through the page's post list, so the next one scrolls the feed again'''
+
+        self._execute("UPDATE pages SET links_complete = 0, updated_at = ? WHERE page_name = ?",
+                      (time(), page_name))
+
+    def get_post_urls(self, page_name, only_incomplete=False):
+        """
+        Returns the stored post list of a page in feed order.
+
+        Args:
+            page_name: The name of the page folder under data/.
+            only_incomplete: Skip posts whose stages are all done.
+
+        Returns:
+            A list of post URLs.
+        """
+        sql = "SELECT url FROM posts WHERE page_name = ?"
+        if only_incomplete:
+            sql += " AND NOT (" + " AND ".join(f"{s}_status = 'done'" for s in STAGES) + ")"
+        rows = self._execute(sql + " ORDER BY position", (page_name,))
+        return [row["url"] for row in rows]
+
+    def get_post_ids(self, page_name, done=None):
+        '''Return the set of post IDs stored for the page; only finished (done=True) or unfinished ones (False)'''
+
+        query = "SELECT post_id FROM posts WHERE page_name = ?"
+        if done is not None:
+            all_done = " AND ".join(f"{s}_status = 'done'" for s in STAGES)
+            query += f" AND ({all_done})" if done else f" AND NOT ({all_done})"
+        rows = self._execute(query, (page_name,))
+        return {row["post_id"] for row in rows}
+
+    def pending_stages(self, page_name, post_id):
+        """
+        Returns the stages of a post that still have to run.
+
+        Args:
+            page_name: The name of the page folder under data/.
+            post_id: The post ID.
+
+        Returns:
+            A list of stage names; all of STAGES if the post is unknown.
+        """
+        rows = self._execute(
+            "SELECT " + ", ".join(f"{s}_status" for s in STAGES) + " FROM posts WHERE page_name = ? AND post_id = ?",
+            (page_name, post_id))
+        if not rows:
+            return list(STAGES)
+        return [s for s in STAGES if rows[0][f"{s}_status"] != "done"]
+
+    def mark(self, page_name, post_id, stage, status, error=None):
+        """
+        Records the outcome of a stage.
+
+        Args:
+            page_name: The name of the page folder under data/.
+            post_id: The post ID.
+            stage: One of STAGES.
+            status: "pending", "done" or "failed".
+            error: An optional error message for failed stages.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        self._execute(f"UPDATE posts SET {stage}_status = ?, error = ?, updated_at = ? "
+                      "WHERE page_name = ? AND post_id = ?",
+                      (status, error, time(), page_name, post_id))
+
+    def summary(self, page_name):
+        """
+        Counts posts per stage status.
+
+        Returns:
+            A dict like {"caption": {"done": 10, "failed": 1}, ...}.
+        """
+        result = {}
+        for stage in STAGES:
+            rows = self._execute(f"SELECT {stage}_status AS status, COUNT(*) AS n FROM posts "
+                                 f"WHERE page_name = ? GROUP BY {stage}_status", (page_name,))
+            result[stage] = {row["status"]: row["n"] for row in rows}
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
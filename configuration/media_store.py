@@ -0,0 +1,244 @@
+from urllib.parse import urlparse, parse_qsl, urlencode
+from contextlib import contextmanager
+from time import time, sleep
+import threading
+import tempfile
+import hashlib
+import sqlite3
+import shutil
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Query parameters of Facebook CDN URLs that pick the rendition of an asset (size, crop, encoding)
+FBCDN_RENDITION_PARAMS = ("stp", "efg")
+# Locks downloads of the same URL within a process are spread over
+KEY_LOCK_STRIPES = 64
+
+
+def _try_lock(fd):
+    '''Take an exclusive advisory lock on an open file without waiting; False if another process holds it'''
+
+    try:
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)  # POSIX locks also hold across NFS
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, poll=0.5):
+    """
+    Holds an exclusive lock shared by every process using the same folder,
+    as an advisory lock (fcntl, or msvcrt on Windows) on a lock file. The
+    operating system drops the lock when its holder dies, so a crashed
+    process never leaves one to break, and a slow download on another host
+    is never taken over.
+
+    The holder removes the lock file before releasing it, so a process that
+    locked the file meanwhile finds it gone from path and starts over on a
+    new one. The lock is per process: threads need their own lock on top.
+
+    Args:
+        path: The lock file path.
+        poll: Seconds between attempts while another process holds it.
+    """
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR)
+        if _try_lock(fd):
+            try:
+                if os.path.samestat(os.fstat(fd), os.stat(path)):
+                    break
+            except OSError:
+                pass  # Removed by the previous holder
+            _unlock(fd)
+            os.close(fd)
+            continue
+        os.close(fd)
+        sleep(poll)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Windows cannot remove an open file; the next holder reuses it
+        _unlock(fd)
+        os.close(fd)
+
+
+def media_url_key(url):
+    """
+    Returns a stable key for a media URL. Facebook CDN URLs carry signed,
+    expiring query parameters and rotate between edge hosts, so for them
+    the path and the parameters picking the rendition (a thumbnail and the
+    full image can share a path) identify the asset.
+
+    Args:
+        url: The media URL.
+
+    Returns:
+        The key string.
+    """
+    parts = urlparse(url)
+    if parts.netloc.endswith("fbcdn.net"):
+        rendition = sorted((name, value) for name, value in parse_qsl(parts.query) if name in FBCDN_RENDITION_PARAMS)
+        return f"{parts.path}?{urlencode(rendition)}" if rendition else parts.path
+    return f"{parts.netloc}{parts.path}?{parts.query}"
+
+
+class MediaStore:
+    """
+    Content-addressed blob store for downloaded media.
+
+    Files live once under root/blobs/<ab>/<sha256><ext>, and post folders get
+    hard links to them (symlinks or copies where hard links are not
+    possible), so the usual image_N.jpg/video_N.mp4 layout is kept. A
+    URL -> hash index lets repeated crawls skip the request entirely for
+    assets that are already stored. Safe to share between threads.
+
+    Args:
+        root: The store directory, shared by every page.
+        wal: Use WAL mode; pass False when data/ is on a network share used
+            by several hosts (see JobQueue).
+    """
+
+    def __init__(self, root="data/media_store", wal=True):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        for directory in (self.blob_dir, self.tmp_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=" + ("WAL" if wal else "DELETE"))
+        self._conn.execute("CREATE TABLE IF NOT EXISTS urls (url_key TEXT PRIMARY KEY, sha256 TEXT NOT NULL, "
+                           "ext TEXT, size INTEGER, created_at REAL)")
+        self._conn.commit()
+
+    def blob_path(self, sha256, ext=""):
+        return os.path.join(self.blob_dir, sha256[:2], sha256 + ext)
+
+    def lookup(self, url):
+        """
+        Returns the stored blob for a URL, or None if it was never fetched.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, ext FROM urls WHERE url_key = ?",
+                                     (media_url_key(url),)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(*row)
+        return path if os.path.exists(path) else None
+
+    def fetch(self, session, url, ext="", timeout=None, chunk_size=65536, download=None):
+        """
+        Downloads a URL into the store, hashing it while streaming.
+
+        Args:
+            session: The requests Session to use.
+            url: The media URL.
+            ext: The file extension of the blob, e.g. ".jpg".
+            timeout: The (connect, read) timeout in seconds.
+            chunk_size: The size of the chunks read from the response.
+            download: An optional callable (session, url, path) -> bytes
+                used instead of a single stream, e.g. for ranged downloads.
+                Its file is kept under a name derived from the URL, so an
+                interrupted download can resume, and hashed afterwards;
+                a lock file next to it keeps other processes sharing the
+                store from writing it at the same time.
+
+        Returns:
+            A tuple (blob path, bytes downloaded).
+        """
+        if download is not None:
+            key = hashlib.sha1(media_url_key(url).encode()).hexdigest()
+            tmp_path = os.path.join(self.tmp_dir, key + ext)
+            # Two posts, possibly crawled by two worker processes, may share an asset; fetch it once
+            with self._key_lock(key), file_lock(tmp_path + ".lock"):
+                blob = self.lookup(url)
+                if blob is not None:
+                    return blob, 0
+                size = download(session, url, tmp_path)
+                digest = hashlib.sha256()
+                with open(tmp_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+                return self._add(url, tmp_path, digest.hexdigest(), ext, size)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f, session.get(url, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._add(url, tmp_path, digest.hexdigest(), ext, size)
+
+    def _key_lock(self, key):
+        '''The lock of a sha1 URL key, from a fixed set so there is no lock per URL to clean up'''
+
+        return self._key_locks[int(key[:8], 16) % len(self._key_locks)]
+
+    def _add(self, url, tmp_path, sha256, ext, size):
+        '''Move a downloaded file into the store and index its URL'''
+
+        path = self.blob_path(sha256, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)  # Same content already stored from another URL
+        else:
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO urls (url_key, sha256, ext, size, created_at) "
+                               "VALUES (?, ?, ?, ?, ?)", (media_url_key(url), sha256, ext, size, time()))
+            self._conn.commit()
+        return path, size
+
+    def link(self, blob, dest):
+        """
+        Makes dest refer to a stored blob: a hard link where possible, else a
+        symlink, else a copy.
+        """
+        directory = os.path.dirname(dest)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(blob, dest)
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(blob), dest)
+            except OSError:
+                shutil.copyfile(blob, dest)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
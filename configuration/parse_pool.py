@@ -0,0 +1,112 @@
+from configuration.extract import extract_post, HTML_PARSER
+from configuration.profiling import PROFILER
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import threading
+import queue
+import os
+
+
+def parse_snapshots(snapshots, parser=None):
+    """
+    Extracts the fields of one post from its HTML snapshots. A pure
+    function of its arguments, so it runs in a worker process.
+
+    Args:
+        snapshots: A list of (html, post_type, fields) tuples, e.g. the page
+            after "See more" for the captions and after loading every
+            comment for the comments.
+        parser: The BeautifulSoup parser backend (HTML_PARSER by default).
+
+    Returns:
+        A tuple (dict of the requested fields, seconds spent parsing).
+    """
+    start = perf_counter()
+    result = {}
+    for html, post_type, fields in snapshots:
+        post = extract_post(html, post_type, parser)
+        result.update({field: post[field] for field in fields})
+    return result, perf_counter() - start
+
+
+class ParsePool:
+    """
+    Parses post snapshots on a pool of worker processes while the browsers
+    keep fetching.
+
+    submit() blocks once max_pending posts are parsing or waiting to be
+    saved, so a slow parse stage slows the crawl down instead of piling up
+    page snapshots in memory. Callbacks run one at a time on a single
+    thread, in the order parses finish.
+
+    Args:
+        workers: The number of processes (all cores by default).
+        max_pending: Posts in flight before submit() blocks (twice the
+            number of workers by default).
+        parser: The BeautifulSoup parser backend, e.g. "lxml" or
+            "html.parser" (HTML_PARSER by default).
+        parse: The function run on the workers, called as parse(snapshots,
+            parser) and returning (fields, seconds); parse_snapshots by
+            default, parse_archived for archived pages.
+    """
+
+    def __init__(self, workers=None, max_pending=None, parser=None, parse=parse_snapshots):
+        self.workers = workers or os.cpu_count() or 1
+        self.parser = parser or HTML_PARSER
+        self.parse = parse
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 2)
+        self._done = queue.Queue()
+        self._finisher = threading.Thread(target=self._finish, name="parse-finisher", daemon=True)
+        self._finisher.start()
+
+    def submit(self, snapshots, callback):
+        """
+        Queues the snapshots of one post.
+
+        Args:
+            snapshots: What the parse function takes, e.g. a list of
+                (html, post_type, fields) tuples (see parse_snapshots).
+            callback: Called as callback(fields, error) once parsed: the dict
+                of fields, or None and the exception if parsing failed.
+        """
+        with PROFILER.span("parse_queue_wait"):
+            self._slots.acquire()
+        try:
+            future = self._executor.submit(self.parse, snapshots, self.parser)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._done.put((f, callback)))
+
+    def _finish(self):
+        while True:
+            item = self._done.get()
+            if item is None:
+                return
+            future, callback = item
+            try:
+                fields, seconds = future.result()
+                PROFILER.count("parse_pool", seconds=seconds)
+                error = None
+            except Exception as e:
+                fields, error = None, e
+            try:
+                callback(fields, error)
+            except Exception as e:
+                print(f"Error saving a parsed post: {e}")
+            finally:
+                self._slots.release()
+
+    def close(self):
+        '''Wait for every queued post to be parsed and handed to its callback'''
+
+        self._executor.shutdown(wait=True)
+        self._done.put(None)
+        self._finisher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
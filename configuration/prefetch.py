@@ -0,0 +1,162 @@
+from configuration.config import apply_fetch_profile
+from configuration.scheduler import SCHEDULER, browser_account, record_navigation, looks_blocked
+from configuration.profiling import PROFILER
+from configuration.utils import extract_facebook_post_id
+from time import monotonic, sleep
+
+
+# Upper bound for waiting on a prefetched page that is still loading
+PREFETCH_LOAD_TIMEOUT = 30
+
+# Where the tab is and, once its load event fired, how long the load took by the page's own clock
+_LOAD_STATE_JS = """
+var entry = performance.getEntriesByType('navigation')[0];
+return {href: location.href, state: document.readyState,
+        load_ms: entry && entry.loadEventEnd > 0 ? entry.loadEventEnd - entry.startTime : null};
+"""
+
+
+def is_queued_page(href, url):
+    '''Return True if the tab at href holds the queued url (or the login wall it was sent to)'''
+
+    if not href or href == "about:blank":
+        return False
+    if href.split("#")[0].rstrip("/") == url.split("#")[0].rstrip("/") or looks_blocked(href):
+        return True
+    # Facebook rewrites post URLs on load, but keeps the post ID in them
+    post_id = extract_facebook_post_id(url)
+    return bool(post_id) and post_id in href
+
+
+class TabPrefetcher:
+    """
+    Loads the next post in a second tab of the same browser while the
+    current one is being extracted, so navigation overlaps the work on the
+    page instead of adding to it.
+
+    The crawl loop queues the next URL; once open_page has the current page
+    loaded it starts the next one in a background tab with a script
+    navigation (which returns at once) and switches back. When open_page is
+    then asked for that URL it switches to the tab, closes the old one and
+    only waits for whatever is left of the load. The navigation is paced
+    and reported like any other (see RateScheduler).
+
+    Both tabs write to the same performance log, so posts whose media is
+    read from the browser's traffic must not overlap a prefetch (see
+    needs_traffic in crawl).
+
+    Args:
+        browser: A Selenium Chrome WebDriver instance; the prefetcher is
+            attached to it as browser.prefetcher.
+        scheduler: The RateScheduler to use (SCHEDULER by default).
+    """
+
+    def __init__(self, browser, scheduler=None):
+        self.browser = browser
+        self.scheduler = scheduler or SCHEDULER
+        self.next = None  # (url, profile) to start once the current page is open
+        self.loading = None  # The prefetch in flight: url, profile, handle, start
+        self.hits = 0
+        self.misses = 0
+        browser.prefetcher = self
+
+    def queue(self, url, profile=None):
+        '''Load url in the background as soon as the current page is open (None cancels)'''
+
+        self.next = (url, profile) if url is not None else None
+
+    def page_opened(self):
+        '''Called by open_page with the current page loaded: start the queued prefetch'''
+
+        if self.next is None:
+            return
+        url, profile = self.next
+        self.next = None
+        if self.loading is not None:
+            if self.loading["url"] == url:
+                return
+            self.cancel()
+
+        browser = self.browser
+        original = browser.current_window_handle
+        original_profile = getattr(browser, "fetch_profile", None)
+        self.scheduler.wait(browser_account(browser))
+        with PROFILER.span("prefetch_start"):
+            browser.switch_to.new_window("tab")
+            handle = browser.current_window_handle
+            # Blocked URLs are set per tab, so the new tab needs its profile applied
+            browser.fetch_profile = None
+            if profile is not None:
+                apply_fetch_profile(browser, profile)
+            browser.execute_script("window.location.href = arguments[0];", url)
+            browser.switch_to.window(original)
+            browser.fetch_profile = original_profile
+        self.loading = {"url": url, "profile": profile, "handle": handle, "start": monotonic()}
+
+    def take(self, url, profile=None):
+        """
+        Switches to the prefetched tab if it holds url under the requested
+        fetch profile, closing the current tab.
+
+        The load reported to the scheduler is the page's own navigation
+        timing, not the time since the prefetch started, which includes
+        all the work done on the previous post meanwhile.
+
+        Returns:
+            True if the page came from the prefetch; False if it has to be
+            loaded normally (the prefetch tab is then the current one).
+        """
+        loading = self.loading
+        if loading is None or loading["url"] != url:
+            return False
+        if profile is not None and profile != loading["profile"]:
+            self.cancel()
+            self.misses += 1
+            return False
+
+        browser = self.browser
+        self.loading = None
+        with PROFILER.span("prefetch_take") as counts:
+            browser.close()  # The current tab, done with
+            browser.switch_to.window(loading["handle"])
+            browser.fetch_profile = loading["profile"]
+            waited = monotonic()
+            loaded = None
+            while monotonic() - waited < PREFETCH_LOAD_TIMEOUT:
+                # A new tab is complete on about:blank before the script navigation commits
+                page = browser.execute_script(_LOAD_STATE_JS) or {}
+                if page.get("state") == "complete" and is_queued_page(page.get("href"), url):
+                    loaded = page
+                    break
+                sleep(0.1)
+            counts["wait_seconds"] = monotonic() - waited
+        if loaded is None:
+            print(f"Prefetch of {url} did not finish loading, loading it again.")
+            self.misses += 1
+            return False
+        seconds = loaded["load_ms"] / 1000 if loaded.get("load_ms") is not None else counts["wait_seconds"]
+        record_navigation(browser, url, seconds, self.scheduler)
+        self.hits += 1
+        return True
+
+    def cancel(self):
+        '''Close the prefetched tab, if any'''
+
+        loading = self.loading
+        self.loading = None
+        if loading is None:
+            return
+        browser = self.browser
+        try:
+            original = browser.current_window_handle
+            browser.switch_to.window(loading["handle"])
+            browser.close()
+            browser.switch_to.window(original)
+        except Exception as e:
+            print(f"Could not close the prefetch tab: {e}")
+
+
+def prefetcher_for(browser):
+    '''Return the browser's TabPrefetcher, attaching one if needed'''
+
+    return getattr(browser, "prefetcher", None) or TabPrefetcher(browser)
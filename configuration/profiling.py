@@ -0,0 +1,217 @@
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, time
+import threading
+import random
+import json
+import os
+
+
+def percentile(values, q):
+    '''Return the q-th quantile (0..1) of a list of numbers, nearest-rank'''
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(round(q * (len(ordered) - 1)))]
+
+
+# Spans kept for trace.json; the per-stage statistics cover every span regardless
+MAX_TRACE_EVENTS = 200_000
+# Durations kept per stage for p50/p95 (a uniform sample of them beyond that)
+SAMPLE_SIZE = 2048
+
+
+class Profiler:
+    """
+    Lightweight span recorder for the crawl.
+
+    Each span records a stage name, the post being crawled (taken from the
+    current thread's post() context), its wall time and optional counts
+    such as comments found or bytes downloaded. summary()/report() give
+    p50/p95 per stage; write_trace() dumps the spans in Chrome trace event
+    format (open it in chrome://tracing or Perfetto).
+
+    Per-stage statistics are updated as spans arrive, with the percentiles
+    taken from a sample of sample_size durations per stage, so memory stays
+    flat on long crawls. Only the first max_events spans are kept for the
+    trace; later ones are counted in dropped.
+    """
+
+    def __init__(self, enabled=True, max_events=MAX_TRACE_EVENTS, sample_size=SAMPLE_SIZE):
+        self.enabled = enabled
+        self.max_events = max_events
+        self.sample_size = sample_size
+        self.events = []
+        self.dropped = 0
+        self._stages = {}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = perf_counter()
+
+    def current_post(self):
+        return getattr(self._local, "post_id", None)
+
+    @contextmanager
+    def post(self, post_id):
+        '''Attribute the spans recorded in this thread to post_id'''
+
+        previous = self.current_post()
+        self._local.post_id = post_id
+        try:
+            yield
+        finally:
+            self._local.post_id = previous
+
+    @contextmanager
+    def span(self, stage, **counts):
+        """
+        Times a block. The yielded dict can be filled with counts.
+
+        Args:
+            stage: The stage name, e.g. "get_comments" or "post.videos".
+            counts: Initial counts for the span.
+        """
+        if not self.enabled:
+            yield counts
+            return
+        start = perf_counter()
+        try:
+            yield counts
+        finally:
+            self._record(stage, start, perf_counter() - start, counts)
+
+    def count(self, stage, **counts):
+        '''Record counts for a stage without timing anything'''
+
+        if self.enabled:
+            self._record(stage, perf_counter(), 0.0, counts)
+
+    def _record(self, stage, start, duration, counts):
+        post_id = self.current_post()
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {"calls": 0, "total": 0.0, "max": 0.0, "posts": set(), "counts": {},
+                                               "sample": []}
+            stats["calls"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            if post_id is not None:
+                stats["posts"].add(post_id)
+            for key, value in counts.items():
+                if isinstance(value, (int, float)):
+                    stats["counts"][key] = stats["counts"].get(key, 0) + value
+
+            # Reservoir sampling keeps a uniform sample of the durations
+            sample = stats["sample"]
+            if len(sample) < self.sample_size:
+                sample.append(duration)
+            else:
+                i = self._random.randrange(stats["calls"])
+                if i < self.sample_size:
+                    sample[i] = duration
+
+            if len(self.events) < self.max_events:
+                self.events.append({
+                    "stage": stage,
+                    "post_id": post_id,
+                    "start": start - self._origin,
+                    "duration": duration,
+                    "thread": threading.current_thread().name,
+                    "counts": counts,
+                })
+            else:
+                self.dropped += 1
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+            self.dropped = 0
+            self._stages = {}
+            self._origin = perf_counter()
+
+    def summary(self):
+        """
+        Aggregates the recorded spans per stage.
+
+        Returns:
+            A dict mapping stage to calls, total/p50/p95/max seconds, the
+            number of distinct posts and the sum of each count.
+        """
+        with self._lock:
+            return {stage: {
+                "calls": stats["calls"],
+                "posts": len(stats["posts"]),
+                "total": stats["total"],
+                "p50": percentile(stats["sample"], 0.5),
+                "p95": percentile(stats["sample"], 0.95),
+                "max": stats["max"],
+                "counts": dict(stats["counts"]),
+            } for stage, stats in self._stages.items()}
+
+    def write_trace(self, path):
+        '''Write the kept spans as a Chrome trace event file'''
+
+        with self._lock:
+            events = list(self.events)
+            dropped = self.dropped
+        threads = {}
+        trace = []
+        for e in events:
+            tid = threads.setdefault(e["thread"], len(threads) + 1)
+            args = dict(e["counts"], post_id=e["post_id"])
+            trace.append({"name": e["stage"], "ph": "X", "pid": 1, "tid": tid,
+                          "ts": e["start"] * 1e6, "dur": e["duration"] * 1e6, "args": args})
+        for name, tid in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms",
+                       "otherData": {"kept_spans": len(events), "dropped_spans": dropped}}, f)
+
+    def report(self, out_dir=None):
+        """
+        Prints the per-stage summary, slowest total first, and optionally
+        writes summary.json and trace.json to out_dir.
+        """
+        summary = self.summary()
+        print(f"{'stage':<32}{'calls':>7}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'max s':>9}  counts")
+        for stage, s in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+            counts = ", ".join(f"{k}={v}" for k, v in s["counts"].items())
+            print(f"{stage:<32}{s['calls']:>7}{s['total']:>10.2f}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['max']:>9.3f}  {counts}")
+
+        if out_dir is not None:
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir, exist_ok=True)
+            with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+                json.dump({"created_at": time(), "stages": summary}, f, indent=2)
+            self.write_trace(os.path.join(out_dir, "trace.json"))
+            if self.dropped:
+                print(f"trace.json keeps the first {len(self.events)} spans ({self.dropped} more were not traced).")
+        return summary
+
+
+PROFILER = Profiler()
+
+
+def timed(stage=None):
+    """
+    Decorator recording a span for every call of the function. When it
+    returns a list, its length is recorded as the "items" count.
+
+    Args:
+        stage: The stage name (defaults to the function name).
+    """
+    def decorator(func):
+        name = stage or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.span(name) as counts:
+                result = func(*args, **kwargs)
+                if isinstance(result, list):
+                    counts["items"] = len(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,250 @@
+from configuration.profiling import PROFILER
+from time import monotonic, sleep
+from collections import deque
+import threading
+import random
+
+
+DEFAULT_ACCOUNT = "default"
+
+# URL fragments of the pages Facebook shows instead of content when it wants us to slow down
+BLOCK_MARKERS = ("/checkpoint", "/login", "login.php", "/two_step_verification", "/captcha")
+
+
+def looks_blocked(url):
+    '''Return True if a URL is a login wall or checkpoint page'''
+
+    return any(marker in (url or "") for marker in BLOCK_MARKERS)
+
+
+def is_blocked_page(browser, url):
+    '''Return True if loading url landed the browser on a login wall or checkpoint'''
+
+    try:
+        return looks_blocked(browser.current_url) and not looks_blocked(url)
+    except Exception:
+        return False
+
+
+class _AccountState:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.cooldown_until = 0.0
+        self.blocks_in_a_row = 0
+        self.history = deque()  # monotonic times of the navigations within the budget window, if there is one
+        self.navigations = 0
+        self.slow = 0
+        self.empty = 0
+        self.blocked = 0
+
+
+class RateScheduler:
+    """
+    Paces navigations with a token bucket per account, replacing fixed and
+    random sleeps.
+
+    The rate of each account adapts to what the crawl observes (additive
+    increase, multiplicative decrease): fast, non-empty page loads raise it
+    slowly, slow loads and empty extractions lower it, and a login wall or
+    checkpoint cuts it sharply and pauses the account with exponential
+    backoff. An optional hourly budget caps navigations per account. Safe to
+    share between crawl threads.
+
+    Args:
+        rate: Initial navigations per second per account.
+        burst: Navigations allowed back to back after an idle period.
+        min_rate: Lowest rate the scheduler backs off to.
+        max_rate: Highest rate it speeds up to.
+        increase: Rate added after each healthy page load.
+        slow_seconds: Page loads slower than this lower the rate.
+        hourly_budget: Maximum navigations per account per hour (None for no cap).
+        cooldown: Pause after the first login wall/checkpoint in seconds;
+            doubles with every further one in a row.
+        max_cooldown: Upper bound for that pause.
+        jitter: Fraction of random variation added to every wait.
+    """
+
+    def __init__(self, rate=0.5, burst=2, min_rate=0.02, max_rate=1.0, increase=0.02, slow_seconds=8.0,
+                 hourly_budget=None, cooldown=60.0, max_cooldown=900.0, jitter=0.2):
+        self.initial_rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.slow_seconds = slow_seconds
+        self.hourly_budget = hourly_budget
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.jitter = jitter
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, account):
+        if account not in self._accounts:
+            self._accounts[account] = _AccountState(self.initial_rate, self.burst)
+        return self._accounts[account]
+
+    def _delay_locked(self, state, now):
+        '''Seconds until the account may navigate; takes the token when that is 0'''
+
+        if now < state.cooldown_until:
+            return state.cooldown_until - now
+
+        if self.hourly_budget is not None:
+            while state.history and now - state.history[0] >= 3600:
+                state.history.popleft()
+            if len(state.history) >= self.hourly_budget:
+                return 3600 - (now - state.history[0])
+
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * state.rate)
+        state.updated = now
+        if state.tokens < 1:
+            return (1 - state.tokens) / state.rate
+
+        state.tokens -= 1
+        if self.hourly_budget is not None:
+            state.history.append(now)
+        state.navigations += 1
+        return 0.0
+
+    def wait(self, account=DEFAULT_ACCOUNT):
+        """
+        Blocks until the account may make its next navigation.
+
+        Args:
+            account: The account key, e.g. the cookies file of the session.
+
+        Returns:
+            The number of seconds waited.
+        """
+        waited = 0.0
+        with PROFILER.span("rate_wait") as counts:
+            while True:
+                with self._lock:
+                    delay = self._delay_locked(self._state(account), monotonic())
+                if delay <= 0:
+                    break
+                delay *= 1 + random.uniform(0, self.jitter)
+                sleep(delay)
+                waited += delay
+            counts["seconds"] = waited
+        return waited
+
+    def record_load(self, account, seconds, blocked=False):
+        """
+        Adapts the account's rate to a finished page load.
+
+        Args:
+            account: The account key.
+            seconds: How long the page took to load.
+            blocked: The load ended on a login wall or checkpoint.
+        """
+        with self._lock:
+            state = self._state(account)
+            if blocked:
+                state.blocked += 1
+                state.blocks_in_a_row += 1
+                pause = min(self.max_cooldown, self.cooldown * 2 ** (state.blocks_in_a_row - 1))
+                state.cooldown_until = monotonic() + pause
+                state.rate = max(self.min_rate, state.rate * 0.25)
+                state.tokens = 0.0
+                print(f"Login wall or checkpoint for {account}: pausing {pause:.0f}s, "
+                      f"rate now {state.rate:.3f}/s")
+                return
+
+            state.blocks_in_a_row = 0
+            if seconds > self.slow_seconds:
+                state.slow += 1
+                state.rate = max(self.min_rate, state.rate * 0.8)
+            else:
+                state.rate = min(self.max_rate, state.rate + self.increase)
+
+    def record_result(self, account, empty):
+        """
+        Adapts the account's rate to an extraction result. Empty pages are
+        often the first sign of throttling, so they lower the rate.
+
+        Args:
+            account: The account key.
+            empty: Nothing was extracted from the page.
+        """
+        if not empty:
+            return
+        with self._lock:
+            state = self._state(account)
+            state.empty += 1
+            state.rate = max(self.min_rate, state.rate * 0.7)
+
+    def stats(self):
+        """
+        Returns a snapshot of every account.
+
+        Returns:
+            A dict mapping account to its current rate, navigations, slow,
+            empty and blocked counts and remaining cooldown in seconds.
+        """
+        now = monotonic()
+        with self._lock:
+            return {account: {"rate": s.rate, "navigations": s.navigations, "slow": s.slow, "empty": s.empty,
+                              "blocked": s.blocked, "cooldown": max(0.0, s.cooldown_until - now)}
+                    for account, s in self._accounts.items()}
+
+    def report(self):
+        '''Print one line per account'''
+
+        for account, s in self.stats().items():
+            print(f"Pacing {account}: {s['navigations']} navigations, rate {s['rate']:.3f}/s, "
+                  f"{s['slow']} slow, {s['empty']} empty, {s['blocked']} blocked")
+
+
+SCHEDULER = RateScheduler()
+
+
+def browser_account(browser):
+    '''Return the account key login stored on the browser'''
+
+    return getattr(browser, "account", DEFAULT_ACCOUNT)
+
+
+def navigate(browser, url, scheduler=None):
+    """
+    Loads a URL once the scheduler allows it and reports the outcome back,
+    so the crawl rate follows how Facebook responds.
+
+    Args:
+        browser: A Selenium WebDriver instance.
+        url: The URL to load.
+        scheduler: The RateScheduler to use (SCHEDULER by default).
+
+    Returns:
+        True if the page loaded without hitting a login wall or checkpoint.
+    """
+    scheduler = scheduler or SCHEDULER
+    scheduler.wait(browser_account(browser))
+    start = monotonic()
+    browser.get(url)
+    return record_navigation(browser, url, monotonic() - start, scheduler)
+
+
+def record_navigation(browser, url, seconds, scheduler=None):
+    """
+    Reports a finished page load to the scheduler and the browser's totals.
+
+    Args:
+        browser: The Selenium WebDriver instance, on the loaded page.
+        url: The URL that was requested.
+        seconds: How long the load took.
+        scheduler: The RateScheduler to use (SCHEDULER by default).
+
+    Returns:
+        True if the page loaded without hitting a login wall or checkpoint.
+    """
+    scheduler = scheduler or SCHEDULER
+    blocked = is_blocked_page(browser, url)
+    scheduler.record_load(browser_account(browser), seconds, blocked)
+    # Per-browser totals, read by BrowserLifecycle to notice a browser slowing down
+    browser.navigations = getattr(browser, "navigations", 0) + 1
+    browser.navigation_seconds = getattr(browser, "navigation_seconds", 0.0) + seconds
+    return not blocked
@@ -0,0 +1,135 @@
+from configuration.config import login, login_mobile, is_logged_in, load_cookies
+from configuration.scheduler import navigate
+from contextlib import contextmanager
+import threading
+import os
+
+
+LOGIN_FUNCTIONS = {
+    "desktop": login,
+    "mobile": login_mobile,
+}
+
+HOME_URLS = {
+    "desktop": "https://www.facebook.com/",
+    "mobile": "https://m.facebook.com/",
+}
+
+
+class SessionPool:
+    """
+    Keeps logged-in browsers warm so they can be reused across crawl calls,
+    e.g. in a long-running daemon.
+
+    Each browser gets its own persistent Chrome profile under profile_root
+    (Chrome cannot share a user-data directory between running instances),
+    so a restarted process finds the session already logged in and skips
+    cookie injection.
+    """
+
+    def __init__(self, driver_path, cookies_path, profile_root="profiles", headless=False):
+        self.driver_path = driver_path
+        self.headless = headless
+        self.cookies_path = cookies_path
+        self.profile_root = profile_root
+        self._idle = {kind: [] for kind in LOGIN_FUNCTIONS}
+        self._profiles = {}  # browser -> (kind, profile_dir)
+        self._reserved = set()  # profile dirs of browsers still starting
+        self._lock = threading.Lock()
+
+    def _free_profile_dir(self, kind):
+        used = {profile for _, profile in self._profiles.values()} | self._reserved
+        i = 0
+        while True:
+            profile = os.path.join(self.profile_root, f"{kind}-{i}")
+            if profile not in used:
+                return profile
+            i += 1
+
+    def _healthy(self, browser, kind):
+        '''Check the browser is alive and still logged in, re-adding cookies if not'''
+
+        try:
+            browser.current_url
+        except Exception:
+            return False
+        if is_logged_in(browser):
+            return True
+        try:
+            navigate(browser, HOME_URLS[kind])
+            load_cookies(browser, self.cookies_path)
+            navigate(browser, HOME_URLS[kind])
+            return is_logged_in(browser)
+        except Exception as e:
+            print(f"Could not restore the session: {e}")
+            return False
+
+    def acquire(self, kind="desktop"):
+        """
+        Returns a logged-in browser, reusing a warm one when available.
+
+        Args:
+            kind: "desktop" or "mobile".
+
+        Returns:
+            A Selenium WebDriver instance, or None if logging in failed.
+        """
+        while True:
+            with self._lock:
+                browser = self._idle[kind].pop() if self._idle[kind] else None
+            if browser is None:
+                break
+            if self._healthy(browser, kind):
+                return browser
+            self.discard(browser)
+
+        with self._lock:
+            profile = self._free_profile_dir(kind)
+            self._reserved.add(profile)  # Reserve the directory while Chrome starts
+        try:
+            browser = LOGIN_FUNCTIONS[kind](self.driver_path, self.cookies_path, profile_dir=profile,
+                                            headless=self.headless)
+        finally:
+            with self._lock:
+                self._reserved.discard(profile)
+                if browser is not None:
+                    self._profiles[browser] = (kind, profile)
+        return browser
+
+    def release(self, browser):
+        '''Return a browser to the pool so the next acquire can reuse it'''
+
+        if browser is None:
+            return
+        with self._lock:
+            kind, _ = self._profiles[browser]
+            self._idle[kind].append(browser)
+
+    def discard(self, browser):
+        '''Quit a browser and drop it from the pool, freeing its profile directory'''
+
+        with self._lock:
+            self._profiles.pop(browser, None)
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self, kind="desktop"):
+        '''Context manager around acquire/release'''
+
+        browser = self.acquire(kind)
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def close(self):
+        '''Quit every browser owned by the pool'''
+
+        with self._lock:
+            browsers = list(self._profiles)
+            self._idle = {kind: [] for kind in LOGIN_FUNCTIONS}
+        for browser in browsers:
+            self.discard(browser)
@@ -2,16 +2,21 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.common.action_chains import ActionChains
-from bs4 import BeautifulSoup
-from time import sleep
 import os
 import requests
-from selenium.webdriver.common.keys import Keys
-import keyboard
+from configuration.downloader import get_session, fetch_to_file, fetch_media
+from configuration.extract import COMMENT_SELECTOR, extract_post_live
+from configuration.waits import wait_for_dom_settle, count_nodes, DOM_IDLE_SECONDS
+from configuration.expand import expand_comments
+from configuration.feed import collect_post_links
+from configuration.profiling import timed
 import re
+import json
+import base64
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 
 
+@timed()
 def show_all_comments(driver):
     '''Change Most relevant to All comments to show all comments'''
 
@@ -25,6 +30,7 @@ def show_all_comments(driver):
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
     return None
 
+@timed()
 def click_see_more(driver):
     '''Click see more to show all captions'''
 
@@ -33,6 +39,7 @@ def click_see_more(driver):
     see_more_btn.click()
     return None
 
+@timed()
 def click_see_less(driver):
     '''Click see less to hide captions'''
 
@@ -41,21 +48,41 @@ def click_see_less(driver):
     see_more_btn.click()
     return None
 
+@timed()
 def click_comment_button(driver):
     # Locate the "Comment" button by its aria-label
     comment_button = driver.find_element(By.XPATH, '//div[@aria-label="Comment"]')
     comment_button.click()
     return None
 
-def click_view_more_comments(driver):
+@timed()
+def click_view_more_comments(driver, timeout=15):
 
-    view_more_cmts_btn = WebDriverWait(driver, 15).until(
+    view_more_cmts_btn = WebDriverWait(driver, timeout).until(
         EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'View more comments')]"))
     )
     driver.execute_script("arguments[0].scrollIntoView(true);", view_more_cmts_btn)  # Scroll into view
     view_more_cmts_btn.click()
     return None
 
+@timed()
+def click_all_view_more_comments(driver, idle=DOM_IDLE_SECONDS):
+    '''Click "View more comments" until it disappears, waiting for each batch to load
+    Return:  - number of clicks.
+    '''
+    clicks = 0
+    while True:
+        known = count_nodes(driver, COMMENT_SELECTOR)
+        try:
+            # The button is re-rendered right after a batch loads, so a short wait is enough
+            click_view_more_comments(driver, timeout=idle)
+        except Exception:
+            break
+        clicks += 1
+        wait_for_dom_settle(driver, COMMENT_SELECTOR, known, idle)
+    return clicks
+
+@timed()
 def click_see_all(driver):
     '''Click See all button to show comments'''
 
@@ -67,11 +94,12 @@ def click_see_all(driver):
 
     return None
 
-def get_comments(driver):
-    '''Get comments under a post
-    Return:  - list of comments.
+@timed()
+def load_all_comments(driver):
+    '''Scroll until no more comments load, then expand truncated comments and reply threads
+    Return:  - list of comment elements.
     '''
-    comments_list = []
+    comments = []
     last_comment_count = 0
 
     while True:
@@ -81,7 +109,7 @@ def get_comments(driver):
         # Scroll to the last comment to trigger loading more
         if len(comments) > 0:
             driver.execute_script("arguments[0].scrollIntoView(true);", comments[-1])
-            sleep(2)  # Allow time for new comments to load
+            wait_for_dom_settle(driver, COMMENT_SELECTOR, len(comments))  # Returns as soon as new comments load
         
         # Check if new comments have been loaded
         if len(comments) == last_comment_count:
@@ -90,38 +118,23 @@ def get_comments(driver):
         last_comment_count = len(comments)
 
     try:
-        # Find all "See more" buttons using the class name or any other identifiable property
-        see_more_buttons = WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, "x11i0hfl"))  # Replace with your button's class or selector
-        )
-
-        # Iterate and click on each button
-        for button in see_more_buttons:
-            try:
-                # Scroll into view if necessary
-                ActionChains(driver).move_to_element(button).perform()
-                button.click()
-                sleep(1)  # Add a short delay to allow content to expand
-            except Exception as e:
-                print(f"Could not click a button: {e}")
-
-    except:
-        pass
+        # Click every "See more" and "View replies" in a few batched rounds
+        expand_comments(driver)
+    except Exception as e:
+        print(f"Could not expand comments: {e}")
 
-    for comment in comments:
-        try:
-            # Check if comment contains text
-            text_ele = comment.find_element(By.XPATH, ".//div[contains(@class, 'xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs')]")
-            if text_ele:
-                text = text_ele.text
-                comments_list.append(text)
-                
-        except Exception as e:
-            continue
+    return comments
 
-    return comments_list
+@timed()
+def get_comments(driver):
+    '''Get comments under a post
+    Return:  - list of comments.
+    '''
+    load_all_comments(driver)
+    return extract_post_live(driver, "default", ("comments",))["comments"]
 
 
+@timed()
 def get_captions(driver):
     """
     Crawls Facebook posts and extracts their captions.
@@ -141,6 +154,7 @@ def get_captions(driver):
     return captions
 
 
+@timed()
 def get_emojis(driver):
     """
     Crawls a Facebook post's caption, extracting each line and any following emojis.
@@ -173,132 +187,31 @@ def get_emojis(driver):
     return lines_and_emojis
 
 
+@timed()
 def get_captions_emojis(driver):
     """
     Extracts text and emojis from Facebook post captions.
     """
-    caption_elements = driver.find_elements(By.XPATH, "//div[contains(@class, 'xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs x126k92a') or contains(@class, 'x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s x126k92a')]")
-    
-    captions = []
-    for caption_element in caption_elements:
-        try:
-            soup = BeautifulSoup(caption_element.get_attribute("outerHTML"), 'html.parser')
-            for div in soup.find_all('div', dir="auto"):
-                result = []
-                for child in div.descendants:
-                    if child.name == 'img' and 'alt' in child.attrs:
-                        result.append(child['alt'])  # Extract emoji from 'alt' attribute
-                    elif child.name is None:  # This is text
-                        text = child.strip()
-                        if text:
-                            result.append(text)
-            
-                captions.append(' '.join(result))
-
-        except AttributeError as e:
-            print(f"Error processing caption: {e}")
-
-    return captions
+    return extract_post_live(driver, "posts", ("captions",))["captions"]
 
+@timed()
 def get_captions_spe(driver):
     """
     Extracts text and emojis from Facebook post captions.
     """
-    captions = []
-
-    try:
-        caption_title = driver.find_element(By.XPATH, "//div[contains(@class, 'xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs')]")
-        try:
-            soup = BeautifulSoup(caption_title.get_attribute("outerHTML"), 'html.parser')
-            for div in soup.find_all('div', dir="auto"):
-                result = []
-                for child in div.descendants:
-                    if child.name == 'img' and 'alt' in child.attrs:
-                        result.append(child['alt'])  # Extract emoji from 'alt' attribute
-                    elif child.name is None:  # This is text
-                        text = child.strip()
-                        if text:
-                            result.append(text)
-            
-                captions.append(' '.join(result))
-        except AttributeError as e:
-            print(f"Error processing caption: {e}")
-    except:
-        pass
-
-    caption_elements = driver.find_elements(By.XPATH, "//div[contains(@class, 'x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s')]")
-
-    for caption_element in caption_elements:
-        try:
-            soup = BeautifulSoup(caption_element.get_attribute("outerHTML"), 'html.parser')
-            for div in soup.find_all('div', dir="auto"):
-                result = []
-                for child in div.descendants:
-                    if child.name == 'img' and 'alt' in child.attrs:
-                        result.append(child['alt'])  # Extract emoji from 'alt' attribute
-                    elif child.name is None:  # This is text
-                        text = child.strip()
-                        if text:
-                            result.append(text)
-            
-                captions.append(' '.join(result))
-        except AttributeError as e:
-            print(f"Error processing caption: {e}")
-
-    return captions
+    return extract_post_live(driver, "videos", ("captions",))["captions"]
 
+@timed()
 def get_captions_reel(driver):
 
-    captions = []
-
     try:
         click_see_more(driver)
     except:
         pass
 
-    try:
-
-        caption_title = driver.find_element(By.XPATH, "//div[contains(@class, 'xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs x126k92a') ]")
-
-        # print(caption_element.get_attribute("outerHTML"))
-
-        # Parse the HTML
-        soup = BeautifulSoup(caption_title.get_attribute("outerHTML"), 'html.parser')
-
-        # Extract caption text
-        caption_div = soup.find("div", class_="xdj266r x11i5rnm xat24cr x1mh8g0r x1vvkbs x126k92a")
-        caption_text = caption_div.get_text(separator=" ").strip()
-
-        # Remove "See less" if present
-        if "See less" in caption_text:
-            caption_text = caption_text.replace("See less", "").strip()
-
-        captions.append(caption_text)
-
-    except:
-        pass
-    
-    try:
-        captions_elements = driver.find_elements(By.XPATH, "//div[contains(@class, 'x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s x126k92a') ]")
-
-        for captions_element in captions_elements:
-            # Parse the HTML
-            soup = BeautifulSoup(captions_element.get_attribute("outerHTML"), 'html.parser')
-
-            # Extract caption text
-            caption_div = soup.find("div", class_="x11i5rnm xat24cr x1mh8g0r x1vvkbs xtlvy1s x126k92a")
-            caption_text = caption_div.get_text(separator=" ").strip()
-
-            # Remove "See less" if present
-            if "See less" in caption_text:
-                caption_text = caption_text.replace("See less", "").strip()
-
-            captions.append(caption_text)
-    except:
-        pass
-
-    return captions
+    return extract_post_live(driver, "reel", ("captions",))["captions"]
 
+@timed()
 def get_image_urls(driver):
     """
     Crawls a Facebook post and extracts image URLs.
@@ -309,15 +222,9 @@ def get_image_urls(driver):
     Returns:
         A list of image URLs found in the post.
     """
+    return extract_post_live(driver, "posts", ("image_urls",))["image_urls"]
 
-    # Find image elements
-    image_elements = driver.find_elements(By.XPATH, ".//div[contains(@class, 'x10l6tqk x13vifvy') or contains(@class, 'xz74otr x1gqwnh9 x1snlj24')]/img")
-    image_urls = []
-    for img in image_elements:
-        image_urls.append(img.get_attribute('src'))
-
-    return image_urls
-
+@timed()
 def download_images(image_urls, download_dir="images"):
     """
     Downloads images from a list of URLs.
@@ -335,18 +242,14 @@ def download_images(image_urls, download_dir="images"):
 
     for i, url in enumerate(image_urls):
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()  # Raise an exception for bad status codes
-
-            with open(os.path.join(download_dir, f"image_{i+1}.jpg"), "wb") as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
+            fetch_to_file(get_session(), url, os.path.join(download_dir, f"image_{i+1}.jpg"))
 
             # print(f"Downloaded image {i+1} from {url}")
 
         except requests.exceptions.RequestException as e:
             print(f"Error downloading image from {url}: {e}")
 
+@timed()
 def get_video_urls(driver):
 
     try:
@@ -368,6 +271,107 @@ def get_video_urls(driver):
 
     return video_urls
 
+def clear_network_log(driver):
+    '''Discard the buffered performance log so the next read only covers the next page'''
+
+    try:
+        driver.get_log("performance")
+    except Exception:
+        pass
+
+def strip_byte_range(url):
+    '''Remove the bytestart/byteend parameters Facebook adds to video segment requests'''
+
+    parts = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ("bytestart", "byteend")]
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+def video_track_info(url):
+    '''Return the encoding details Facebook packs into a video URL's efg parameter (vencode_tag, video_id, bitrate)'''
+
+    efg = dict(parse_qsl(urlparse(url).query)).get("efg")
+    if not efg:
+        return {}
+    try:
+        info = json.loads(base64.urlsafe_b64decode(efg + "=" * (-len(efg) % 4)))
+    except (ValueError, TypeError):
+        return {}
+    return info if isinstance(info, dict) else {}
+
+@timed()
+def get_network_video_urls(driver, video_only=False):
+    """
+    Reads video URLs from the browser's own network traffic (Chrome
+    performance log) instead of loading the post again in a mobile browser.
+
+    Segment requests are collapsed to one URL per file by dropping their
+    byte-range parameters, and audio-only streams are skipped. Adaptive
+    (DASH) videos are played from a video track without sound next to a
+    separate audio track, so they are left out unless video_only is set;
+    the caller then falls back to the mobile page's <video src>, which has
+    sound. Of the renditions of one video, only the highest bitrate is kept.
+
+    Args:
+        driver: A WebDriver started with performance logging (see login).
+        video_only: Also return DASH videos, without their sound.
+
+    Returns:
+        A list of video URLs.
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception as e:
+        print(f"Could not read the performance log: {e}")
+        return []
+
+    candidates = []
+    mime_types = {}
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+
+        params = message.get("params", {})
+        if message.get("method") == "Network.requestWillBeSent":
+            url = params.get("request", {}).get("url", "")
+            mime = ""
+        elif message.get("method") == "Network.responseReceived":
+            url = params.get("response", {}).get("url", "")
+            mime = params.get("response", {}).get("mimeType", "")
+        else:
+            continue
+
+        if not url.startswith("http"):
+            continue
+        path = urlparse(url).path
+        if mime:
+            mime_types[path] = mime
+        if mime.startswith("video/") or path.endswith(".mp4"):
+            candidates.append((path, url))
+
+    # The best rendition of each video, by the video_id and bitrate in efg (one video per file without them)
+    videos = {}
+    seen = set()
+    for path, url in candidates:
+        if path in seen:
+            continue
+        seen.add(path)
+        info = video_track_info(url)
+        tag = str(info.get("vencode_tag", ""))
+        if mime_types.get(path, "").startswith("audio/") or "audio" in tag:
+            continue
+        query = dict(parse_qsl(urlparse(url).query))
+        if not video_only and ("bytestart" in query or tag.startswith("dash")):
+            continue
+        video = info.get("video_id") or info.get("xpv_asset_id") or path
+        bitrate = info.get("bitrate") if isinstance(info.get("bitrate"), (int, float)) else 0
+        if video not in videos or bitrate > videos[video][0]:
+            videos[video] = (bitrate, strip_byte_range(url))
+
+    return [url for _, url in videos.values()]
+
+@timed()
 def download_videos(video_urls, download_dir="videos"):
     """
     Downloads videos from a list of URLs.
@@ -386,64 +390,33 @@ def download_videos(video_urls, download_dir="videos"):
 
     for i, url in enumerate(video_urls):
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-
-            with open(os.path.join(download_dir, f"video_{i+1}.mp4"), "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            fetch_media(get_session(), url, os.path.join(download_dir, f"video_{i+1}.mp4"))
 
             # print(f"Downloaded video {i+1} from {url}")
 
         except requests.exceptions.RequestException as e:
             print(f"Error downloading video from {url}: {e}")
 
-def get_post_links(driver, fanpage_url):
+@timed()
+def get_post_links(driver, fanpage_url, max_posts=None, until_date=None, max_idle_scrolls=5, stop=None):
     """
     Crawls a Facebook fanpage and extracts post links from a specific date until now.
 
     Args:
         driver: The Selenium WebDriver instance.
         fanpage_url: The URL of the Facebook fanpage.
+        max_posts: Stop after this many posts (no limit by default).
+        until_date: Stop once the feed reaches posts older than this date.
+        max_idle_scrolls: Stop after this many scrolls without new posts.
+        stop: Optional callable taking a post URL; scrolling stops when it returns True.
 
     Returns:
         A list of post URLs and a list of post contains videos URLs.
         Returns None if an error occurs.
     """
-    post_urls = []
     try:
-        driver.get(fanpage_url)
-        # Wait for the page to load
-        sleep(3)
-        # filter_year(driver, year)
-        
-        while True:
-            try:
-                # Check if Enter is pressed
-                if keyboard.is_pressed("enter"):
-                    print("Stopping the scrolling.")
-                    break
-
-                # Scroll down
-                driver.find_element(By.TAG_NAME, "body").send_keys(Keys.PAGE_DOWN)
-                sleep(0.5)  # Pause to allow content to load
-
-                # Locate the specific anchor tag and extract the href attribute
-                try:
-                    # Use a CSS selector to target the <a> element
-                    link_post_elements = driver.find_elements(By.CSS_SELECTOR, "a[href*='/posts/'], a[href*='/videos/'], a[href*='/reel/']")
-                    for link in link_post_elements:
-                        url = link.get_attribute("href")
-                        post_urls.append(url) if url not in post_urls else None
-
-                except Exception as e:
-                    # print("Error extracting link:", e)
-                    pass
-
-            except Exception as e:
-                print("Error during scrolling:", e)
-                break
+        post_urls = collect_post_links(driver, fanpage_url, max_posts=max_posts, until_date=until_date,
+                                       max_idle_scrolls=max_idle_scrolls, stop=stop)
 
         post_urls = remove_duplicate_links(post_urls)
 
@@ -458,6 +431,7 @@ def get_post_links(driver, fanpage_url):
         print(f"An error occurred: {e}")
         return None
 
+@timed()
 def save_text(text_list, file_path):
     """
     Saves a list of strings to a text file, with each string on a new line.
@@ -500,4 +474,59 @@ def remove_duplicate_links(links):
         post_id = extract_facebook_post_id(link)
         if post_id and post_id not in unique_links:
             unique_links[post_id] = link
-    return list(unique_links.values())
\ No newline at end of file
+    return list(unique_links.values())
+
+# Folders under data/<page_name>/ that hold no post
+NON_POST_DIRS = {"None", "dataset", "archive", "profile", "reextracted"}
+
+def load_known_post_ids(page_dir, done_ids=(), unfinished_ids=()):
+    """
+    Collects the IDs of posts crawled before: the finished posts of a
+    persisted index such as the manifest, plus post folders under
+    data/<page_name>/ holding both caption.txt and comments.txt (posts
+    crawled without one). A post folder is created before its stages run,
+    so a folder alone does not make a post known.
+
+    Args:
+        page_dir: The page folder, e.g. data/<page_name>.
+        done_ids: IDs of posts whose stages all finished.
+        unfinished_ids: IDs of posts with stages still to run; their
+            folders are not counted.
+
+    Returns:
+        A set of post IDs.
+    """
+    known = set(done_ids)
+    unfinished = set(unfinished_ids)
+    if os.path.isdir(page_dir):
+        for name in os.listdir(page_dir):
+            folder = os.path.join(page_dir, name)
+            if name in NON_POST_DIRS or name in unfinished or not os.path.isdir(folder):
+                continue
+            if all(os.path.exists(os.path.join(folder, f)) for f in ("caption.txt", "comments.txt")):
+                known.add(name)
+    return known
+
+def stop_after_known(known_ids, run=5):
+    """
+    Builds a get_post_links stop callback for delta crawls: scrolling stops
+    once `run` consecutive links are posts we already have. A short run of
+    known posts (e.g. pinned posts above new ones) does not stop it.
+
+    Args:
+        known_ids: A set of already crawled post IDs.
+        run: The number of consecutive known posts that ends the scroll.
+
+    Returns:
+        A callable taking a post URL and returning True to stop.
+    """
+    seen_in_a_row = [0]
+
+    def stop(url):
+        if extract_facebook_post_id(url) in known_ids:
+            seen_in_a_row[0] += 1
+        else:
+            seen_in_a_row[0] = 0
+        return seen_in_a_row[0] >= run
+
+    return stop
\ No newline at end of file
@@ -0,0 +1,64 @@
+from time import time
+from configuration.profiling import timed
+
+
+# How long the DOM must stay quiet before loading is considered finished
+DOM_IDLE_SECONDS = 0.75
+# Upper bound for a single wait
+DOM_SETTLE_TIMEOUT = 10
+
+_SETTLE_JS = """
+var selector = arguments[0], known = arguments[1], idleMs = arguments[2], timeoutMs = arguments[3];
+var done = arguments[arguments.length - 1];
+var count = function () { return selector ? document.querySelectorAll(selector).length : 0; };
+var start = Date.now(), last = Date.now(), finished = false, timer = null;
+var observer = new MutationObserver(function () { last = Date.now(); });
+var finish = function (reason) {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearInterval(timer);
+    done({reason: reason, count: count()});
+};
+observer.observe(document.body, {childList: true, subtree: true});
+timer = setInterval(function () {
+    var now = Date.now();
+    if (selector && known >= 0 && count() > known) finish('grew');
+    else if (now - last >= idleMs) finish('idle');
+    else if (now - start >= timeoutMs) finish('timeout');
+}, 50);
+"""
+
+
+def count_nodes(driver, selector):
+    '''Count the elements matching a CSS selector in one round-trip'''
+
+    return driver.execute_script("return document.querySelectorAll(arguments[0]).length;", selector)
+
+
+@timed()
+def wait_for_dom_settle(driver, selector=None, known=-1, idle=DOM_IDLE_SECONDS, timeout=DOM_SETTLE_TIMEOUT):
+    """
+    Waits until new nodes appear or the page stops changing, using a
+    MutationObserver injected into the page instead of a fixed sleep.
+
+    Args:
+        driver: The Selenium WebDriver instance.
+        selector: An optional CSS selector of the nodes we are waiting for.
+        known: The number of matching nodes already seen; the wait returns as
+            soon as there are more than this. Ignored when negative.
+        idle: Seconds without DOM insertions/removals after which loading is
+            considered finished.
+        timeout: Maximum number of seconds to wait.
+
+    Returns:
+        A dict with the reason the wait ended ("grew", "idle", "timeout")
+        and the current number of nodes matching selector.
+    """
+    driver.set_script_timeout(timeout + 5)
+    start = time()
+    try:
+        return driver.execute_async_script(_SETTLE_JS, selector, known, int(idle * 1000), int(timeout * 1000))
+    except Exception as e:
+        print(f"Error waiting for page to settle after {time() - start:.1f}s: {e}")
+        return {"reason": "error", "count": known}
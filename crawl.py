@@ -1,121 +1,876 @@
 import configuration as cf
-from time import time, sleep
+from time import time
 import os
+import threading
+from functools import partial
+from contextlib import contextmanager
+from queue import Queue, Empty
 from tqdm import tqdm
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 
-def crawl(driver, cookies_path, page_link, page_name):
-    browser = cf.login(driver, cookies_path)
-    browser_mobile = cf.login_mobile(driver, cookies_path)
+def mark_stage(manifest, page_name, id, stage, error=None):
+    '''Record a stage outcome in the manifest, if there is one'''
 
-    post_urls = cf.get_post_links(browser, page_link)
+    if manifest is not None:
+        manifest.mark(page_name, id, stage, "failed" if error else "done", str(error) if error else None)
 
-    if not os.path.exists(f"data/{page_name}"):
-        os.makedirs(f"data/{page_name}")
+# The stage each extracted field belongs to
+FIELD_STAGES = {"captions": "caption", "comments": "comments", "image_urls": "media"}
 
-    # Process post URLs
-    for url in tqdm(post_urls, desc="Processing Posts"):
-        id = cf.extract_facebook_post_id(url)
-        folder = f"data/{page_name}/{id}"
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-            
-        if "posts" in url:
-            browser.get(url)
+@contextmanager
+def run_stage(manifest, page_name, id, stage, mark_done=True):
+    '''Mark a stage done when the block succeeds (unless mark_done is False), failed (and re-raise) otherwise'''
 
-            captions = cf.get_captions_emojis(browser)
-            cf.save_text(captions, f"{folder}/caption.txt")
+    with cf.PROFILER.span(f"stage.{stage}"):
+        try:
+            yield
+        except Exception as e:
+            mark_stage(manifest, page_name, id, stage, e)
+            raise
+    if mark_done:
+        mark_stage(manifest, page_name, id, stage)
 
-            comments = cf.get_comments(browser)
-            cf.save_text(comments, f"{folder}/comments.txt")
+def open_post_page(browser, url, profile, manifest, page_name, id, stages):
+    '''open_page, marking the stages failed when the post cannot be loaded (e.g. a login wall)'''
 
-            img_urls = cf.get_image_urls(browser)
-            cf.download_images(img_urls, folder)
+    try:
+        return cf.open_page(browser, url, profile)
+    except Exception as e:
+        for stage in stages:
+            mark_stage(manifest, page_name, id, stage, e)
+        raise
 
-        elif "videos" in url:
-            browser.get(url)
+def save_post_text(record, key, texts, path, text_files=True):
+    '''Keep texts for the post's dataset record and, unless disabled, write them to a .txt file'''
 
-            try:
-                cf.click_see_more(browser)
-            except:
-                pass
+    record[key] = texts
+    if text_files:
+        cf.save_text(texts, path)
+
+def harvest_post_comments(browser, record, folder, text_files=True):
+    '''Stream the open post's comments to comments.txt while they load, keeping them for the dataset record'''
+
+    comments = []
+    cf.harvest_comments(browser, f"{folder}/comments.txt" if text_files else None, comments.extend)
+    record["comments"] = comments
+
+def extract_fields(browser, post_type, fields, snapshots=None, archived=None):
+    """
+    Extracts fields of the open post in one script round-trip. With a
+    snapshots list the page's HTML is appended to it instead, to be parsed
+    by a ParsePool, and None is returned. With an archived list the HTML is
+    also kept there for the PageArchive.
+    """
+    snapshot = None
+    if snapshots is not None or archived is not None:
+        snapshot = (cf.get_page_html(browser), post_type, tuple(fields))
+        if archived is not None:
+            archived.append(snapshot)
+    if snapshots is None:
+        return cf.extract_post_live(browser, post_type, fields)
+    snapshots.append(snapshot)
+    return None
+
+def save_parsed(fields, error, requested, manifest, page_name, id, folder, record, downloader=None,
+                text_files=True):
+    '''Save what a ParsePool extracted from a post's snapshots, marking the stages it completes'''
 
-            captions = cf.get_captions_spe(browser)
-            cf.save_text(captions, f"{folder}/caption.txt")
+    if error is not None:
+        print(f"Error parsing post {id}: {error}")
+        for field in requested:
+            mark_stage(manifest, page_name, id, FIELD_STAGES[field], error)
+        return
 
+    for field, name in (("captions", "caption.txt"), ("comments", "comments.txt")):
+        if field in fields:
             try:
-                cf.click_see_less(browser)
-            except:
-                pass
-            
+                with run_stage(manifest, page_name, id, FIELD_STAGES[field]):
+                    save_post_text(record, field, fields[field], f"{folder}/{name}", text_files)
+            except Exception as e:
+                print(f"Error saving the {field} of post {id}: {e}")
+
+    if "image_urls" in fields:
+        record["media"] = save_media(manifest, page_name, id, folder, downloader, image_urls=fields["image_urls"])
+
+def finish_record(record, stages, account, dataset=None):
+    '''Report an empty post to the rate scheduler and write the post's dataset record'''
+
+    # A page with neither caption nor comments is often the first sign of throttling
+    if "caption" in stages or "comments" in stages:
+        empty = not record.get("captions") and not record.get("comments")
+        cf.SCHEDULER.record_result(account, empty)
+
+    if dataset is not None:
+        dataset.write(record)
+
+def save_media(manifest, page_name, id, folder, downloader=None, image_urls=None, video_urls=None):
+    """
+    Downloads a post's media and marks the media stage once it has finished.
+
+    With a downloader the files are fetched in the background and the stage
+    is marked from the download callbacks.
+
+    Returns:
+        The paths the media files are written to.
+    """
+    paths = ([cf.media_path(folder, "image", i) for i, url in enumerate(image_urls or []) if url]
+             + [cf.media_path(folder, "video", i) for i, url in enumerate(video_urls or []) if url])
+
+    if downloader is None:
+        if image_urls is not None:
+            cf.download_images(image_urls, folder)
+        if video_urls is not None:
+            cf.download_videos(video_urls, folder)
+        mark_stage(manifest, page_name, id, "media")
+        return paths
+
+    futures = downloader.submit_images(image_urls, folder) + downloader.submit_videos(video_urls, folder)
+    if not futures:
+        mark_stage(manifest, page_name, id, "media")
+        return paths
+
+    pending = set(futures)
+    failed = []
+    lock = threading.Lock()
+
+    def on_done(future):
+        with lock:
+            pending.discard(future)
+            if future.exception() is not None or future.result() is None:
+                failed.append(future)
+            if pending:
+                return
+        mark_stage(manifest, page_name, id, "media", f"{len(failed)} downloads failed" if failed else None)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return paths
+
+def crawl_post_http(session, url, page_name, id, folder, stages, record, manifest=None, text_files=True):
+    """
+    Runs the stages of a post that the basic HTML view can serve, with
+    plain HTTP requests instead of a browser.
+
+    Captions and comments come from the basic view whenever it shows them,
+    and each stage is only marked done when its own field was found (and,
+    for comments, every comment page was followed). The basic view only
+    links thumbnails and videos are only found in the browser's traffic, so
+    the media stage is always left to the browser, as is anything on pages
+    that need JavaScript or hit a login wall.
+
+    Returns:
+        The stages still to run in the browser.
+    """
+    servable = {"caption", "comments"}
+    if not servable.intersection(stages):
+        return stages
+
+    # Further comment pages are only worth fetching while the comments are pending
+    post = cf.fetch_post_http(session, url, max_comment_pages=cf.MAX_COMMENT_PAGES if "comments" in stages else 1)
+    if post is None:
+        return stages
+
+    done = set()
+    if "caption" in stages and post["captions"]:
+        with run_stage(manifest, page_name, id, "caption"):
+            save_post_text(record, "captions", post["captions"], f"{folder}/caption.txt", text_files)
+        done.add("caption")
+
+    if "comments" in stages and post["comments"]:
+        if post["comments_complete"]:
+            with run_stage(manifest, page_name, id, "comments"):
+                save_post_text(record, "comments", post["comments"], f"{folder}/comments.txt", text_files)
+            done.add("comments")
+        else:
+            print(f"Post {id}: the basic view has more than {cf.MAX_COMMENT_PAGES} comment pages; "
+                  f"leaving the comments to the browser.")
+    return [stage for stage in stages if stage not in done]
+
+def post_stages(manifest, page_name, url):
+    '''The stages of a post still to run: all of them without a manifest'''
+
+    if manifest is None:
+        return cf.STAGES
+    return manifest.pending_stages(page_name, cf.extract_facebook_post_id(url))
+
+def page_profile(stages, fetch_profiles=True):
+    '''The fetch profile a post page is opened with: media may only be blocked when the media stage is done'''
+
+    if not fetch_profiles:
+        return "full"
+    return "media" if "media" in stages else "text"
+
+def needs_traffic(url, stages):
+    '''Return True if a post's media is read from the browser's network traffic (videos and reels)'''
+
+    return url is not None and cf.get_post_type(url) in ("videos", "reel") and "media" in stages
 
+def queue_prefetch(browser, url, next_url, page_name, manifest=None, fetch_profiles=True):
+    """
+    Has the browser load next_url in a second tab while url is crawled (see
+    TabPrefetcher). Posts whose media comes from the browser's traffic are
+    neither prefetched nor overlapped with a prefetch, since both tabs
+    share one network log.
+    """
+    prefetcher = cf.prefetcher_for(browser)
+    next_stages = post_stages(manifest, page_name, next_url) if next_url is not None else ()
+    if (not next_stages or needs_traffic(next_url, next_stages)
+            or needs_traffic(url, post_stages(manifest, page_name, url))):
+        prefetcher.queue(None)
+        return
+    prefetcher.queue(next_url, page_profile(next_stages, fetch_profiles))
+
+def stop_prefetch(browser):
+    '''Close the browser's prefetch tab, if it has one'''
+
+    prefetcher = getattr(browser, "prefetcher", None)
+    if prefetcher is not None:
+        prefetcher.queue(None)
+        prefetcher.cancel()
+
+def crawl_post(browser, browser_mobile, url, page_name, *args, **kwargs):
+    '''Profiled entry point of crawl_post_stages, see its docstring for the arguments'''
+
+    with cf.PROFILER.post(cf.extract_facebook_post_id(url)), cf.PROFILER.span(f"post.{cf.get_post_type(url)}"):
+        return crawl_post_stages(browser, browser_mobile, url, page_name, *args, **kwargs)
+
+def crawl_post_stages(browser, browser_mobile, url, page_name, downloader=None, manifest=None, fetch_profiles=True,
+                      dataset=None, text_files=True, stream_comments=False, http_session=None, parse_pool=None,
+                      archive=None):
+    """
+    Crawls a single post and saves its captions, comments and media
+    under data/<page_name>/<id>/.
+
+    Args:
+        browser: A logged-in desktop WebDriver instance.
+        browser_mobile: An optional logged-in mobile WebDriver instance, only
+            used when no video shows up in the desktop browser's traffic.
+        url: The post URL.
+        page_name: The name of the page folder under data/.
+        downloader: An optional MediaDownloader; when given, media is
+            downloaded in the background instead of blocking the crawl.
+        manifest: An optional Manifest; stages it records as done are
+            skipped and the outcome of the others is recorded.
+        fetch_profiles: Block media while reading text and fonts/tracking
+            everywhere (see FETCH_PROFILES); False loads everything.
+        dataset: An optional DatasetWriter receiving one record per post.
+        text_files: Write caption.txt/comments.txt into the post folder.
+        stream_comments: Extract comments batch by batch while loading them
+            and drop them from the page (see harvest_comments), for very
+            large threads.
+        http_session: An optional session from make_cookie_session; the
+            stages the basic HTML view can serve are fetched with it first,
+            and only the rest loads the page in the browser (see crawl_post_http).
+        parse_pool: An optional ParsePool; page snapshots are parsed there
+            and saved once parsed, while the crawl moves on to the next post.
+        archive: An optional PageArchive receiving the HTML every field
+            was extracted from, for re-extraction without crawling.
+
+    Returns:
+        The page_load_stats of every page loaded for the post.
+    """
+    id = cf.extract_facebook_post_id(url)
+    folder = f"data/{page_name}/{id}"
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    stages = post_stages(manifest, page_name, url)
+    if not stages:
+        return []
+
+    media_profile = "media" if fetch_profiles else "full"
+    loads = []
+    record = {"post_id": id, "url": url, "type": cf.get_post_type(url), "page_name": page_name}
+
+    # With a parse pool, extraction keeps snapshots here and their stages are marked once parsed
+    snapshots = [] if parse_pool is not None else None
+    deferred = snapshots is not None
+    archived = [] if archive is not None else None
+
+    # Stages left for the browser
+    pending = stages
+    if http_session is not None:
+        pending = crawl_post_http(http_session, url, page_name, id, folder, stages, record, manifest, text_files)
+
+    if pending and "posts" in url:
+        # Image URLs come from the same page load, so only block media when they are not needed
+        loads.append(open_post_page(browser, url, page_profile(pending, fetch_profiles), manifest, page_name, id,
+                                    pending))
+
+        # Load everything, then extract every field in one script round-trip (or one snapshot)
+        if "comments" in pending and not stream_comments:
+            cf.load_all_comments(browser)
+        fields = [field for field, stage in FIELD_STAGES.items()
+                  if stage in pending and not (field == "comments" and stream_comments)]
+        post = extract_fields(browser, "posts", fields, snapshots, archived) if fields else None
+
+        if post is not None and "caption" in pending:
+            with run_stage(manifest, page_name, id, "caption"):
+                save_post_text(record, "captions", post["captions"], f"{folder}/caption.txt", text_files)
+
+        if "comments" in pending and stream_comments:
+            with run_stage(manifest, page_name, id, "comments"):
+                harvest_post_comments(browser, record, folder, text_files)
+        elif post is not None and "comments" in pending:
+            with run_stage(manifest, page_name, id, "comments"):
+                save_post_text(record, "comments", post["comments"], f"{folder}/comments.txt", text_files)
+
+        if post is not None and "media" in pending:
+            record["media"] = save_media(manifest, page_name, id, folder, downloader, image_urls=post["image_urls"])
+
+    elif pending and "videos" in url:
+        # Video URLs are read from this page load's traffic, so let media through when they are needed
+        cf.clear_network_log(browser)
+        loads.append(open_post_page(browser, url, page_profile(pending, fetch_profiles), manifest, page_name, id,
+                                    pending))
+
+        if "caption" in pending:
+            with run_stage(manifest, page_name, id, "caption", mark_done=not deferred):
+                try:
+                    cf.click_see_more(browser)
+                except:
+                    pass
+
+                post = extract_fields(browser, "videos", ("captions",), snapshots, archived)
+                if post is not None:
+                    save_post_text(record, "captions", post["captions"], f"{folder}/caption.txt", text_files)
+
+                try:
+                    cf.click_see_less(browser)
+                except:
+                    pass
+
+        if "comments" in pending:
+            with run_stage(manifest, page_name, id, "comments", mark_done=stream_comments or not deferred):
+                try:
+                    cf.click_see_all(browser)
+                    cf.wait_for_dom_settle(browser)
+                except Exception:
+                    pass
+
+                if stream_comments:
+                    harvest_post_comments(browser, record, folder, text_files)
+                else:
+                    cf.click_all_view_more_comments(browser)
+
+                    cf.load_all_comments(browser)
+                    post = extract_fields(browser, cf.get_post_type(url), ("comments",), snapshots, archived)
+                    if post is not None:
+                        save_post_text(record, "comments", post["comments"], f"{folder}/comments.txt", text_files)
+
+        if "media" in pending:
             try:
-                cf.click_see_all(browser)
-                sleep(1)
-            except Exception:
-                pass
+                # DASH videos in the traffic have no sound, so only keep them without a mobile browser
+                video_urls = cf.get_network_video_urls(browser, video_only=browser_mobile is None)
+
+                # Fall back to the mobile page's <video src> when the traffic had no video with sound
+                if not video_urls and browser_mobile is not None:
+                    loads.append(cf.open_page(browser_mobile, url, media_profile))
+                    cf.wait_for_dom_settle(browser_mobile)
+                    video_urls = cf.get_video_urls(browser_mobile)
+            except Exception as e:
+                mark_stage(manifest, page_name, id, "media", e)
+                video_urls = None
+            if video_urls is not None:
+                record["media"] = save_media(manifest, page_name, id, folder, downloader, video_urls=video_urls)
+
+    elif pending and "reel" in url:
+        cf.clear_network_log(browser)
+        loads.append(open_post_page(browser, url, page_profile(pending, fetch_profiles), manifest, page_name, id,
+                                    pending))
+
+        if "caption" in pending:
+            with run_stage(manifest, page_name, id, "caption", mark_done=not deferred):
+                try:
+                    cf.click_see_more(browser)
+                except:
+                    pass
 
-            while True:
+                post = extract_fields(browser, "reel", ("captions",), snapshots, archived)
+                if post is not None:
+                    save_post_text(record, "captions", post["captions"], f"{folder}/caption.txt", text_files)
+
+                try:
+                    cf.click_see_less(browser)
+                except:
+                    pass
+
+        if "comments" in pending:
+            with run_stage(manifest, page_name, id, "comments", mark_done=stream_comments or not deferred):
                 try:
-                    cf.click_view_more_comments(browser)
-                    sleep(0.5)
+                    cf.click_see_all(browser)
+                    cf.wait_for_dom_settle(browser)
                 except Exception:
-                    break
+                    pass
+
+                cf.click_comment_button(browser)
+
+                if stream_comments:
+                    harvest_post_comments(browser, record, folder, text_files)
+                else:
+                    cf.click_all_view_more_comments(browser)
+
+                    cf.load_all_comments(browser)
+                    post = extract_fields(browser, cf.get_post_type(url), ("comments",), snapshots, archived)
+                    if post is not None:
+                        save_post_text(record, "comments", post["comments"], f"{folder}/comments.txt", text_files)
+
+        if "media" in pending:
+            try:
+                # DASH videos in the traffic have no sound, so only keep them without a mobile browser
+                video_urls = cf.get_network_video_urls(browser, video_only=browser_mobile is None)
+
+                # Fall back to the mobile page's <video src> when the traffic had no video with sound
+                if not video_urls and browser_mobile is not None:
+                    loads.append(cf.open_page(browser_mobile, url, media_profile))
+                    cf.wait_for_dom_settle(browser_mobile)
+                    video_urls = cf.get_video_urls(browser_mobile)
+            except Exception as e:
+                mark_stage(manifest, page_name, id, "media", e)
+                video_urls = None
+            if video_urls is not None:
+                record["media"] = save_media(manifest, page_name, id, folder, downloader, video_urls=video_urls)
+
+    if archived:
+        with cf.PROFILER.span("archive_page") as counts:
+            counts["bytes"] = archive.add(id, url, archived)
+
+    account = cf.browser_account(browser)
+    if not snapshots:
+        finish_record(record, stages, account, dataset)
+        return loads
+
+    # The record is complete once the snapshots are parsed; the crawl goes on meanwhile
+    requested = [field for _, _, fields in snapshots for field in fields]
+
+    def on_parsed(fields, error):
+        with cf.PROFILER.post(id):
+            save_parsed(fields, error, requested, manifest, page_name, id, folder, record, downloader, text_files)
+            finish_record(record, stages, account, dataset)
+
+    parse_pool.submit(snapshots, on_parsed)
+    return loads
+
+def load_post_urls(browser, page_link, page_name, manifest=None, incremental=False):
+    """
+    Returns the posts to crawl: the unfinished posts of the stored post list
+    when resuming an interrupted run, otherwise the links found by scrolling
+    the feed (posts whose stages are all done are then skipped post by post).
+
+    In incremental mode the feed is scrolled only until a run of already
+    crawled posts is reached, and only the new posts (plus unfinished ones
+    from earlier runs) are returned.
+
+    Returns None when the feed could not be read or showed no post at all.
+    """
+    if incremental:
+        done_ids = unfinished_ids = ()
+        if manifest is not None:
+            done_ids = manifest.get_post_ids(page_name, done=True)
+            unfinished_ids = manifest.get_post_ids(page_name, done=False)
+        known_ids = cf.load_known_post_ids(f"data/{page_name}", done_ids, unfinished_ids)
+        post_urls = cf.get_post_links(browser, page_link, stop=cf.stop_after_known(known_ids))
+        if not post_urls:
+            print(f"Found no posts on {page_link}.")
+            return None
+        new_urls = [url for url in post_urls if cf.extract_facebook_post_id(url) not in known_ids]
+        print(f"Incremental crawl: {len(new_urls)} new posts.")
+        if manifest is None:
+            return new_urls
+        manifest.save_post_urls(page_name, page_link, new_urls, cf.extract_facebook_post_id, cf.get_post_type)
+        unfinished = [url for url in manifest.get_post_urls(page_name, only_incomplete=True) if url not in new_urls]
+        return new_urls + unfinished
+
+    # The stored list is only reused while the run that stored it is unfinished (see finish_post_list)
+    if manifest is not None and manifest.has_post_list(page_name):
+        post_urls = manifest.get_post_urls(page_name, only_incomplete=True)
+        print(f"Resuming from the manifest: {len(post_urls)} posts left.")
+        return post_urls
+
+    post_urls = cf.get_post_links(browser, page_link)
+    if not post_urls:
+        print(f"Found no posts on {page_link}.")
+        return None
+    if manifest is not None:
+        manifest.save_post_urls(page_name, page_link, post_urls, cf.extract_facebook_post_id, cf.get_post_type)
+    return post_urls
+
+def open_browsers(driver, cookies_path, pool=None, headless=False, use_mobile=False, browser_limits=None):
+    """
+    Logs in a desktop browser (and a mobile one if use_mobile), reusing warm
+    ones from the pool when given, each under a BrowserLifecycle that
+    restarts it before a long run wears it out.
+
+    Args:
+        browser_limits: Keyword arguments for BrowserLifecycle, e.g. max_posts.
+
+    Returns:
+        A tuple (desktop, mobile) of BrowserLifecycle; mobile is None unless use_mobile.
+    """
+    limits = browser_limits or {}
+
+    def lifecycle(kind, **overrides):
+        if pool is not None:
+            start, stop = partial(pool.acquire, kind), pool.discard
+        else:
+            start, stop = partial(cf.LOGIN_FUNCTIONS[kind], driver, cookies_path, headless=headless), None
+        return cf.BrowserLifecycle(start, stop, kind, **dict(limits, **overrides))
+
+    # The mobile browser only loads the odd video fallback, so it is not restarted on a post count
+    return lifecycle("desktop"), lifecycle("mobile", max_posts=None) if use_mobile else None
+
+def lifecycle_browsers(*lifecycles):
+    '''The current browsers of the given lifecycles (None for a missing lifecycle)'''
+
+    return tuple(lifecycle.browser if lifecycle is not None else None for lifecycle in lifecycles)
+
+def browsers_ready(desktop, mobile):
+    '''Return True if the desktop browser, and the mobile one when used, are running'''
+
+    return desktop.browser is not None and (mobile is None or mobile.browser is not None)
+
+def finish_post(error, *lifecycles):
+    '''Count a finished post on every lifecycle, restarting browsers that are due'''
+
+    for lifecycle in lifecycles:
+        if lifecycle is not None:
+            lifecycle.post_done(error)
+
+def close_browsers(browsers, pool=None):
+    '''Hand browsers back to the pool, or quit them when there is none'''
 
-            comments = cf.get_comments(browser)
-            cf.save_text(comments, f"{folder}/comments.txt")
+    for b in browsers:
+        if b is None:
+            continue
+        if pool is not None:
+            pool.release(b)
+        else:
+            b.quit()
 
+def close_stores(*stores):
+    '''Close the writers and databases of a crawl (None entries are skipped), flushing what they buffer'''
+
+    for store in stores:
+        if store is None:
+            continue
+        try:
+            store.close()
+        except Exception as e:
+            print(f"Error closing the {type(store).__name__}: {e}")
+
+def crawl_worker(driver, cookies_path, page_name, url_queue, progress, downloader=None, manifest=None, pool=None,
+                 headless=False, load_stats=None, use_mobile=False, browser_limits=None, prefetch=False,
+                 stop=None, errors=None, **post_options):
+    """
+    Logs in its own desktop/mobile browser pair and processes post URLs
+    from a shared queue until it is empty.
+
+    Args:
+        driver: Path to the chromedriver executable.
+        cookies_path: Path to the file containing saved cookies.
+        page_name: The name of the page folder under data/.
+        url_queue: A queue.Queue of post URLs shared by all workers.
+        progress: A tqdm progress bar shared by all workers.
+        downloader: An optional MediaDownloader shared by all workers.
+        manifest: An optional Manifest shared by all workers.
+        pool: An optional SessionPool to take warm browsers from.
+        headless: Run the worker's browsers without a window.
+        load_stats: An optional list collecting page_load_stats.
+        use_mobile: Also log in a mobile browser as a fallback for videos.
+        browser_limits: Keyword arguments for the browsers' BrowserLifecycle.
+        prefetch: Load the worker's next post in a second tab while
+            crawling the current one (see queue_prefetch).
+        stop: An optional threading.Event; once set, no further post is taken.
+        errors: An optional list collecting the URLs of posts that failed.
+        post_options: Keyword arguments passed on to crawl_post.
+    """
+    desktop, mobile = open_browsers(driver, cookies_path, pool, headless, use_mobile, browser_limits)
+
+    try:
+        if not browsers_ready(desktop, mobile):
+            print("Worker could not log in, leaving its posts to the other workers.")
+            return
+
+        def next_url():
+            if stop is not None and stop.is_set():
+                return None
+            try:
+                return url_queue.get_nowait()
+            except Empty:
+                return None
+
+        url = next_url()
+        while url is not None:
+            # With prefetching the worker holds its next URL, so the tab can start loading it
+            following = next_url() if prefetch else None
+            if prefetch:
+                queue_prefetch(desktop.browser, url, following, page_name, manifest,
+                               post_options.get("fetch_profiles", True))
+
+            error = None
             try:
-                sleep(5)
-                browser_mobile.get(url)
-                sleep(5)
-                video_urls = cf.get_video_urls(browser_mobile)
-                cf.download_videos(video_urls, folder)
-            except Exception:
-                continue
-        
-        elif "reel" in url:
-            browser.get(url)
+                loads = crawl_post(*lifecycle_browsers(desktop, mobile), url, page_name, downloader, manifest,
+                                   **post_options)
+                if load_stats is not None:
+                    load_stats.extend(loads)
+            except Exception as e:
+                error = e
+                print(f"Error processing {url}: {e}")
+                if errors is not None:
+                    errors.append(url)
+            finally:
+                progress.update(1)
+                url_queue.task_done()
 
-            captions = cf.get_captions_reel(browser)
+            finish_post(error, desktop, mobile)
+            if not browsers_ready(desktop, mobile):
+                print("Worker could not restart its browser, leaving its posts to the other workers.")
+                if following is not None:
+                    url_queue.put(following)
+                    url_queue.task_done()
+                return
+            url = following if prefetch else next_url()
+    finally:
+        stop_prefetch(desktop.browser)
+        close_browsers(lifecycle_browsers(desktop, mobile), pool)
+        desktop.report()
 
-            cf.save_text(captions, f"{folder}/caption.txt")
+def crawl_parallel(driver, cookies_path, page_link, page_name, workers=4, resume=True, incremental=False,
+                   pool=None, headless=False, use_mobile=False, fetch_profiles=True, dataset=True, text_files=True,
+                   dedupe_media=True, stream_comments=False, browser_limits=None, http_fetch=False,
+                   prefetch=False, parse_workers=0, html_parser=None, archive_pages=False, wal=True, stop=None):
+    """
+    Crawls a page with a pool of logged-in browser pairs pulling post URLs
+    from a shared queue.
 
+    Args:
+        driver: Path to the chromedriver executable.
+        cookies_path: Path to the file containing saved cookies.
+        page_link: The URL of the Facebook fanpage.
+        page_name: The name of the page folder under data/.
+        workers: The number of browser pairs to run concurrently.
+        resume: Keep a manifest under data/<page_name>/ and skip work
+            finished by a previous run.
+        incremental: Only crawl posts newer than the ones already stored.
+        pool: An optional SessionPool keeping browsers warm between calls.
+        headless: Run the browsers without a window.
+        use_mobile: Give each worker a mobile browser as a fallback for videos.
+        fetch_profiles: Block resources each stage does not need.
+        dataset: Append one record per post to data/<page_name>/dataset/.
+        text_files: Also write caption.txt/comments.txt per post.
+        dedupe_media: Store media by content hash under data/media_store/ and
+            link it into the post folders, skipping assets already stored.
+        stream_comments: Harvest comments batch by batch with bounded browser memory.
+        browser_limits: Keyword arguments for each browser's BrowserLifecycle
+            (when to restart it).
+        http_fetch: Fetch what the basic HTML view serves over plain HTTP
+            with the saved cookies, using the browsers only for the rest.
+        prefetch: Load each worker's next post in a second tab while the
+            current one is crawled. Ignored with http_fetch, which often
+            needs no page at all.
+        parse_workers: Parse page snapshots on this many processes while
+            the browsers move on (0 extracts in the page, see ParsePool).
+        html_parser: The BeautifulSoup parser backend for the parse workers.
+        archive_pages: Keep the HTML posts are extracted from, compressed,
+            under data/<page_name>/archive/ (see PageArchive and reextract.py).
+        wal: Open the manifest, media store and archive databases in WAL
+            mode; pass False when data/ is on a network share used by
+            several hosts.
+        stop: An optional threading.Event; once set, the workers take no
+            further post.
+
+    Returns:
+        A dict with the number of posts, how many failed and whether every
+        post was processed, or None if the feed could not be read.
+    """
+    if not os.path.exists(f"data/{page_name}"):
+        os.makedirs(f"data/{page_name}")
+
+    manifest = cf.Manifest(f"data/{page_name}/manifest.db", wal) if resume else None
+    dataset_writer = media_store = archive = None
+    try:
+        if not incremental and manifest is not None and manifest.has_post_list(page_name):
+            post_urls = load_post_urls(None, page_link, page_name, manifest)
+        else:
+            browser = pool.acquire("desktop") if pool is not None else cf.login(driver, cookies_path,
+                                                                               headless=headless)
             try:
-                cf.click_see_less(browser)
-            except:
-                pass
+                post_urls = load_post_urls(browser, page_link, page_name, manifest, incremental)
+            finally:
+                close_browsers((browser,), pool)
 
+        if post_urls is None:
+            return None
+        if not post_urls:
+            if manifest is not None:
+                manifest.finish_post_list(page_name)
+            return {"posts": 0, "failed": 0, "finished": True}
 
+        url_queue = Queue()
+        for url in post_urls:
+            url_queue.put(url)
+
+        progress = tqdm(total=len(post_urls), desc="Processing Posts")
+        load_stats = []
+        errors = []
+        dataset_writer = cf.DatasetWriter(f"data/{page_name}/dataset") if dataset else None
+        media_store = cf.MediaStore("data/media_store", wal) if dedupe_media else None
+        archive = cf.PageArchive(f"data/{page_name}/archive", wal=wal) if archive_pages else None
+        post_options = {"fetch_profiles": fetch_profiles, "dataset": dataset_writer, "text_files": text_files,
+                        "stream_comments": stream_comments, "archive": archive,
+                        "http_session": cf.make_cookie_session(cookies_path, pool_size=workers) if http_fetch
+                        else None}
+        with cf.MediaDownloader(store=media_store) as downloader:
+            parse_pool = cf.ParsePool(parse_workers, parser=html_parser) if parse_workers else None
+            post_options["parse_pool"] = parse_pool
             try:
-                cf.click_see_all(browser)
-                sleep(1)
-            except Exception:
-                pass
+                threads = []
+                for i in range(min(workers, len(post_urls))):
+                    t = threading.Thread(target=crawl_worker,
+                                         args=(driver, cookies_path, page_name, url_queue, progress, downloader,
+                                               manifest, pool, headless, load_stats, use_mobile, browser_limits,
+                                               prefetch and not http_fetch, stop, errors),
+                                         kwargs=post_options, name=f"crawl-worker-{i}", daemon=True)
+                    t.start()
+                    threads.append(t)
 
-            cf.click_comment_button(browser)
+                for t in threads:
+                    t.join()
+                progress.close()
+            finally:
+                # Parsed posts still queue downloads, so the pool drains before the downloader
+                if parse_pool is not None:
+                    parse_pool.close()
+        downloader.report()
+        cf.summarize_page_loads(load_stats)
+        # Workers that could not log in (or were stopped) leave their posts in the queue for the next run
+        finished = url_queue.empty()
+        if manifest is not None:
+            if finished:
+                manifest.finish_post_list(page_name)
+            print(manifest.summary(page_name))
+        return {"posts": len(post_urls), "failed": len(errors), "finished": finished}
+    finally:
+        # Buffered records must reach disk even on Ctrl-C: the manifest already counts their posts as done
+        close_stores(dataset_writer, archive, media_store, manifest)
 
-            while True:
-                try:
-                    cf.click_view_more_comments(browser)
-                    sleep(0.5)
-                except Exception:
-                    break
+def crawl(driver, cookies_path, page_link, page_name, workers=1, resume=True, incremental=False, pool=None,
+          headless=False, fetch_profiles=True, use_mobile=False, dataset=True, text_files=True, dedupe_media=True,
+          profile=True, stream_comments=False, recycle_after=cf.RECYCLE_AFTER_POSTS, max_browser_mb=cf.MAX_BROWSER_MB,
+          http_fetch=False, prefetch=False, parse_workers=0, html_parser=None, archive_pages=False, wal=True,
+          stop=None):
+    # Returns crawl_parallel's summary of the run (None if the feed could not be read); setting the
+    # stop event makes the crawl wind down after the posts in progress
+
+    # Per-stage timings go to data/<page_name>/profile/ (summary.json and a Chrome trace)
+    cf.PROFILER.enabled = profile
+    cf.PROFILER.reset()
 
-            comments = cf.get_comments(browser)
-            cf.save_text(comments, f"{folder}/comments.txt")
+    # Browsers are restarted after recycle_after posts or above max_browser_mb of memory (None disables either)
+    browser_limits = {"max_posts": recycle_after, "max_rss_mb": max_browser_mb}
 
+    if workers > 1:
+        result = crawl_parallel(driver, cookies_path, page_link, page_name, workers, resume, incremental, pool,
+                                headless, use_mobile, fetch_profiles, dataset, text_files, dedupe_media,
+                                stream_comments, browser_limits, http_fetch, prefetch, parse_workers, html_parser,
+                                archive_pages, wal, stop)
+    else:
+        result = crawl_sequential(driver, cookies_path, page_link, page_name, resume, incremental, pool,
+                                  headless, use_mobile, fetch_profiles, dataset, text_files, dedupe_media,
+                                  stream_comments, browser_limits, http_fetch, prefetch, parse_workers, html_parser,
+                                  archive_pages, wal, stop)
+
+    cf.SCHEDULER.report()
+    if profile:
+        cf.PROFILER.report(f"data/{page_name}/profile")
+    return result
+
+def crawl_sequential(driver, cookies_path, page_link, page_name, resume=True, incremental=False, pool=None,
+                     headless=False, use_mobile=False, fetch_profiles=True, dataset=True, text_files=True,
+                     dedupe_media=True, stream_comments=False, browser_limits=None, http_fetch=False,
+                     prefetch=False, parse_workers=0, html_parser=None, archive_pages=False, wal=True, stop=None):
+    '''Crawls a page with a single desktop browser (and optional mobile fallback); returns like crawl_parallel'''
+
+    desktop, mobile = open_browsers(driver, cookies_path, pool, headless, use_mobile, browser_limits)
+    browser = desktop.browser
+    manifest = dataset_writer = media_store = archive = None
+    try:
+        if not os.path.exists(f"data/{page_name}"):
+            os.makedirs(f"data/{page_name}")
+
+        # The manifest lets an interrupted run pick up where it stopped
+        manifest = cf.Manifest(f"data/{page_name}/manifest.db", wal) if resume else None
+
+        post_urls = load_post_urls(browser, page_link, page_name, manifest, incremental)
+        if post_urls is None:
+            return None
+
+        # One record per post goes to sharded JSONL files under data/<page_name>/dataset/
+        dataset_writer = cf.DatasetWriter(f"data/{page_name}/dataset") if dataset else None
+
+        # Media is stored once per content hash and shared by every page's post folders
+        media_store = cf.MediaStore("data/media_store", wal) if dedupe_media else None
+
+        # The HTML of every post, for re-running the extractors later without crawling
+        archive = cf.PageArchive(f"data/{page_name}/archive", wal=wal) if archive_pages else None
+
+        # Captions and comments come from the basic HTML view when it has them, sparing the browser
+        http_session = cf.make_cookie_session(cookies_path) if http_fetch else None
+
+        # Process post URLs, handing media off to background downloads
+        load_stats = []
+        failed = 0
+        finished = False
+        with cf.MediaDownloader(store=media_store) as downloader:
+            # The basic HTML view often needs no page at all, so there is nothing to prefetch
+            prefetch = prefetch and not http_fetch
+
+            # Snapshots are parsed on other cores while the browser loads the next post
+            parse_pool = cf.ParsePool(parse_workers, parser=html_parser) if parse_workers else None
             try:
-                sleep(5)
-                browser_mobile.get(url)
-                sleep(5)
-                video_urls = cf.get_video_urls(browser_mobile)
-                cf.download_videos(video_urls, folder)
-            except Exception:
-                pass
+                for i, url in enumerate(tqdm(post_urls, desc="Processing Posts")):
+                    if stop is not None and stop.is_set():
+                        print("Stopping the crawl; run again to resume the remaining posts.")
+                        break
+                    if prefetch:
+                        queue_prefetch(desktop.browser, url, post_urls[i + 1] if i + 1 < len(post_urls) else None,
+                                       page_name, manifest, fetch_profiles)
+
+                    # Read the browsers for every post: the lifecycle may have restarted them
+                    error = None
+                    try:
+                        load_stats.extend(crawl_post(*lifecycle_browsers(desktop, mobile), url, page_name,
+                                                     downloader, manifest, fetch_profiles, dataset_writer,
+                                                     text_files, stream_comments, http_session, parse_pool, archive))
+                    except Exception as e:
+                        error = e
+                        failed += 1
+                        print(f"Error processing {url}: {e}")
+                    finish_post(error, desktop, mobile)
+                    if not browsers_ready(desktop, mobile):
+                        print("Could not restart the browser; run again to resume the remaining posts.")
+                        break
+                else:
+                    finished = True  # The next run scrolls the feed again instead of resuming this list
+            finally:
+                stop_prefetch(desktop.browser)
+                # Parsed posts still queue downloads, so the pool drains before the downloader
+                if parse_pool is not None:
+                    parse_pool.close()
+        downloader.report()
+        cf.summarize_page_loads(load_stats)
+        desktop.report()
+        if manifest is not None:
+            if finished:
+                manifest.finish_post_list(page_name)
+            print(manifest.summary(page_name))
+        return {"posts": len(post_urls), "failed": failed, "finished": finished}
+    finally:
+        # Buffered records must reach disk even on Ctrl-C: the manifest already counts their posts as done
+        close_stores(dataset_writer, archive, media_store, manifest)
+        # Warm browsers go back to the pool for the next crawl call, and are quit without one
+        close_browsers(lifecycle_browsers(desktop, mobile), pool)
+
 
-        
 
 if __name__ == "__main__":
     driver = "./chromedriver.exe"
@@ -124,12 +879,21 @@ if __name__ == "__main__":
     page_link = "https://www.facebook.com/vinamilkofficial"
     page_name = "vinamilk"
 
+    # Number of logged-in browser pairs crawling posts concurrently
+    workers = 1
+
+    # Run Chrome without a window
+    headless = False
+
+    # Daily refresh: only crawl posts newer than the ones already under data/<page_name>/
+    incremental = False
+
     # End timing the process
     start_time = time()
 
-    crawl(driver, cookies_path, page_link, page_name)
+    crawl(driver, cookies_path, page_link, page_name, workers, incremental=incremental, headless=headless)
     # End timing the process
     end_time = time()
     elapsed_time = (end_time - start_time)/60
 
-    print(f"Processing completed in {elapsed_time:.2f} minutes.")
\ No newline at end of file
+    print(f"Processing completed in {elapsed_time:.2f} minutes.")
@@ -0,0 +1,97 @@
+"""
+Re-runs the extractors over the pages archived by a crawl with
+archive_pages=True, on all cores and without any network traffic, e.g.
+after fixing a selector in configuration/extract.py:
+
+    python reextract.py vinamilk
+    python reextract.py vinamilk --all-crawls --workers 16 --parser lxml
+    python reextract.py vinamilk --text-files    # also rewrite caption.txt/comments.txt
+
+Records go to data/<page_name>/reextracted/ (sharded JSONL like the
+crawl's dataset), keeping the crawled_at of the archived page.
+"""
+import configuration as cf
+import argparse
+import os
+from time import time, perf_counter
+from tqdm import tqdm
+
+
+def reextract(page_name, out=None, workers=None, parser=None, latest=True, text_files=False, wal=True):
+    """
+    Extracts every archived post of a page again on a ParsePool.
+
+    Args:
+        page_name: The name of the page folder under data/.
+        out: The dataset directory for the records (data/<page_name>/reextracted by default).
+        workers: The number of processes (all cores by default).
+        parser: The BeautifulSoup parser backend.
+        latest: One record per post, each field from the newest crawl that read it; False
+            re-extracts every crawl.
+        text_files: Also rewrite caption.txt/comments.txt in the post folders.
+        wal: See PageArchive.
+
+    Returns:
+        A tuple (posts extracted, posts that failed).
+    """
+    archive_root = f"data/{page_name}/archive"
+    if not os.path.exists(os.path.join(archive_root, "index.db")):
+        print(f"No archive under {archive_root}; crawl with archive_pages=True first.")
+        return 0, 0
+
+    archive = cf.PageArchive(archive_root, wal=wal)
+    writer = cf.DatasetWriter(out or f"data/{page_name}/reextracted")
+    progress = tqdm(total=archive.count(latest), desc="Re-extracting posts")
+    counts = {"done": 0, "failed": 0}
+
+    def save(post, fields, error):
+        progress.update(1)
+        if error is not None:
+            counts["failed"] += 1
+            print(f"Error re-extracting post {post['post_id']}: {error}")
+            return
+        record = {"post_id": post["post_id"], "url": post["url"], "type": cf.get_post_type(post["url"]),
+                  "page_name": page_name, "crawled_at": post["crawled_at"], "reextracted_at": time()}
+        record.update(fields)
+        if text_files:
+            folder = f"data/{page_name}/{post['post_id']}"
+            os.makedirs(folder, exist_ok=True)
+            for field, name in (("captions", "caption.txt"), ("comments", "comments.txt")):
+                if field in fields:
+                    cf.save_text(fields[field], f"{folder}/{name}")
+        writer.write(record)
+        counts["done"] += 1
+
+    start = perf_counter()
+    try:
+        with cf.ParsePool(workers, parser=parser, parse=cf.parse_archived) as pool:
+            for post in archive.posts(latest):
+                pool.submit(post["snapshots"], lambda fields, error, post=post: save(post, fields, error))
+    finally:
+        progress.close()
+        writer.close()
+        archive.close()
+
+    elapsed = perf_counter() - start
+    print(f"Re-extracted {counts['done']} posts ({counts['failed']} failed) in {elapsed:.1f}s "
+          f"with {pool.workers} processes.")
+    return counts["done"], counts["failed"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run the extractors over a page's archived HTML.")
+    parser.add_argument("page_name", help="The page folder under data/")
+    parser.add_argument("--out", help="Dataset directory for the records (default: data/<page_name>/reextracted)")
+    parser.add_argument("--workers", type=int, default=0, help="Parse processes (0: all cores)")
+    parser.add_argument("--parser", choices=("lxml", "html.parser"), help="BeautifulSoup parser backend")
+    parser.add_argument("--all-crawls", action="store_true", help="Every archived crawl, not only the latest")
+    parser.add_argument("--text-files", action="store_true", help="Rewrite caption.txt/comments.txt")
+    parser.add_argument("--no-wal", action="store_true", help="Use a rollback journal (data/ on a network share)")
+    args = parser.parse_args(argv)
+
+    reextract(args.page_name, args.out, args.workers or None, args.parser, not args.all_crawls, args.text_files,
+              not args.no_wal)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Crawl worker pulling (page, mode) jobs from a shared SQLite job queue.
+
+Queue pages, then start one worker per account (on one or several machines
+sharing the queue file and the data folder; on a network share pass
+--no-wal to every command, since SQLite's WAL mode needs a local disk):
+
+    python worker.py add https://www.facebook.com/vinamilkofficial vinamilk
+    python worker.py add --file pages.txt --mode incremental
+    python worker.py run --cookies my_cookies.pkl --headless
+    python worker.py status
+
+pages.txt holds one "page_link page_name" pair per line.
+"""
+from crawl import crawl
+import configuration as cf
+import argparse
+import threading
+import socket
+import os
+from time import sleep
+
+
+def keep_lease(queue, job, worker, lease_seconds, stop, lost):
+    '''Renew the job's lease until stop is set; sets lost when the lease cannot be renewed'''
+
+    while not stop.wait(lease_seconds / 3):
+        if not queue.renew(job["id"], worker, lease_seconds):
+            print(f"Lost the lease of job {job['id']} ({job['page_name']}), another worker may pick it up; "
+                  f"stopping its crawl.")
+            lost.set()
+            return
+
+
+def run_job(queue, job, worker, driver, cookies_path, pool, lease_seconds, **crawl_options):
+    """
+    Crawls the page of a claimed job while a background thread keeps its
+    lease alive, then records the outcome in the queue. The crawl stops
+    once the lease is lost, leaving the job to the worker that took it over.
+    A crawl that found no posts, did not get through them or failed on
+    every one is recorded as a failed attempt.
+
+    Returns:
+        True if the job was completed by this worker.
+    """
+    print(f"Job {job['id']}: {job['mode']} crawl of {job['page_name']} (attempt {job['attempts']})")
+    options = dict(crawl_options, **job["options"])
+    stop = threading.Event()
+    lost = threading.Event()
+    heartbeat = threading.Thread(target=keep_lease, args=(queue, job, worker, lease_seconds, stop, lost),
+                                 name=f"lease-{job['id']}", daemon=True)
+    heartbeat.start()
+    try:
+        result = crawl(driver, cookies_path, job["page_link"], job["page_name"],
+                       incremental=job["mode"] == "incremental", pool=pool, stop=lost, **options)
+    except Exception as e:
+        result = e
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    if lost.is_set():
+        print(f"Job {job['id']} stopped: its lease was lost.")
+        return False
+    if isinstance(result, Exception):
+        error = result
+    elif result is None:
+        error = "found no posts on the page"
+    elif not result["finished"]:
+        error = "stopped before every post was crawled"
+    elif result["posts"] and result["failed"] == result["posts"]:
+        error = f"all {result['posts']} posts failed"
+    else:
+        error = None
+    if error is not None:
+        print(f"Job {job['id']} failed: {error}")
+        queue.fail(job["id"], worker, error)
+        return False
+    if not queue.complete(job["id"], worker):
+        print(f"Job {job['id']} finished after its lease was lost; another worker may crawl it again.")
+        return False
+    return True
+
+
+def run_worker(queue_path, driver, cookies_path, lease_seconds=1800, poll=30, once=False, wal=True,
+               **crawl_options):
+    """
+    Claims and crawls jobs until the queue is empty (once=True) or forever,
+    polling for new jobs. Browsers stay logged in between jobs.
+
+    Args:
+        queue_path: The job queue database.
+        driver: Path to the chromedriver executable.
+        cookies_path: This worker's cookies file (one account per worker).
+        lease_seconds: How long a job stays reserved between renewals.
+        poll: Seconds to wait before asking again when the queue is empty.
+        once: Exit when there are no jobs left instead of polling.
+        wal: See JobQueue; also used for the crawl's manifest, media store and archive.
+        crawl_options: Keyword arguments passed on to crawl().
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    queue = cf.JobQueue(queue_path, wal=wal)
+    # Separate profile folders per account, so workers on one machine do not share Chrome profiles
+    account = os.path.splitext(os.path.basename(cookies_path))[0]
+    pool = cf.SessionPool(driver, cookies_path, profile_root=os.path.join("profiles", account),
+                          headless=crawl_options.get("headless", False))
+    done = 0
+    try:
+        while True:
+            job = queue.claim(worker, lease_seconds)
+            if job is None:
+                if once:
+                    break
+                sleep(poll)
+                continue
+            done += run_job(queue, job, worker, driver, cookies_path, pool, lease_seconds, wal=wal, **crawl_options)
+    except KeyboardInterrupt:
+        print("Stopping the worker; its running job will be picked up again once the lease expires.")
+    finally:
+        pool.close()
+        print(f"Worker {worker} finished {done} jobs. Queue: {queue.summary()}")
+        queue.close()
+
+
+def add_jobs(queue_path, pages, mode="full", priority=0, wal=True):
+    '''Queue (page_link, page_name) pairs; returns their job IDs'''
+
+    queue = cf.JobQueue(queue_path, wal=wal)
+    try:
+        return [queue.add(page_link, page_name, mode, priority) for page_link, page_name in pages]
+    finally:
+        queue.close()
+
+
+def read_pages(path):
+    '''Read "page_link page_name" lines, skipping blanks and # comments'''
+
+    pages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            page_link, page_name = line.split()[:2]
+            pages.append((page_link, page_name))
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue fanpages and crawl them with leased workers.")
+    parser.add_argument("--queue", default="data/jobs.db", help="The job queue database")
+    parser.add_argument("--no-wal", action="store_true", help="Use a rollback journal (queue or data/ on a network share)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="Queue pages")
+    add.add_argument("page_link", nargs="?")
+    add.add_argument("page_name", nargs="?")
+    add.add_argument("--file", help="File with one 'page_link page_name' pair per line")
+    add.add_argument("--mode", choices=cf.MODES, default="full")
+    add.add_argument("--priority", type=int, default=0)
+
+    run = commands.add_parser("run", help="Claim and crawl jobs")
+    run.add_argument("--cookies", default="my_cookies.pkl", help="This worker's cookies file")
+    run.add_argument("--driver", default="./chromedriver.exe", help="Path to chromedriver")
+    run.add_argument("--workers", type=int, default=1, help="Browser pairs per job")
+    run.add_argument("--headless", action="store_true")
+    run.add_argument("--lease", type=int, default=1800, help="Lease length in seconds")
+    run.add_argument("--poll", type=int, default=30, help="Seconds between polls of an empty queue")
+    run.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    run.add_argument("--recycle-after", type=int, default=cf.RECYCLE_AFTER_POSTS,
+                     help="Restart each browser after this many posts")
+    run.add_argument("--max-browser-mb", type=int, default=cf.MAX_BROWSER_MB,
+                     help="Restart a browser using more memory than this (needs psutil)")
+    run.add_argument("--http-fetch", action="store_true",
+                     help="Fetch captions and comments over plain HTTP when the basic view has them")
+    run.add_argument("--prefetch", action="store_true", help="Load the next post in a second tab meanwhile")
+    run.add_argument("--parse-workers", type=int, default=0,
+                     help="Parse page snapshots on this many processes (0 extracts in the page)")
+    run.add_argument("--archive-pages", action="store_true",
+                     help="Keep the HTML of every post for reextract.py")
+
+    status = commands.add_parser("status", help="Show the queue")
+    status.add_argument("--retry-failed", action="store_true", help="Put failed jobs back in the queue")
+
+    args = parser.parse_args(argv)
+    wal = not args.no_wal
+
+    if args.command == "add":
+        pages = read_pages(args.file) if args.file else []
+        if args.page_link and args.page_name:
+            pages.append((args.page_link, args.page_name))
+        if not pages:
+            parser.error("give a page_link and page_name, or --file")
+        ids = add_jobs(args.queue, pages, args.mode, args.priority, wal)
+        print(f"Queued {len(ids)} jobs.")
+
+    elif args.command == "run":
+        run_worker(args.queue, args.driver, args.cookies, args.lease, args.poll, args.once, wal,
+                   workers=args.workers, headless=args.headless, recycle_after=args.recycle_after,
+                   max_browser_mb=args.max_browser_mb, http_fetch=args.http_fetch, prefetch=args.prefetch,
+                   parse_workers=args.parse_workers, archive_pages=args.archive_pages)
+
+    elif args.command == "status":
+        queue = cf.JobQueue(args.queue, wal=wal)
+        try:
+            if args.retry_failed:
+                print(f"Requeued {queue.retry_failed()} failed jobs.")
+            for job in queue.jobs():
+                print(f"{job['id']:>5}  {job['status']:<8} {job['mode']:<12} {job['page_name']:<30} "
+                      f"attempts={job['attempts']}  worker={job['worker'] or '-'}  {job['error'] or ''}")
+            print(queue.summary())
+        finally:
+            queue.close()
+
+
+if __name__ == "__main__":
+    main()